@@ -0,0 +1,116 @@
+"""编码后端对比测试（CPU）
+
+对每个编码后端（torch / torch_int8 / onnx / onnx_int8）测量：
+    load_s        加载模型（ONNX后端第一次运行包含导出和量化）的时间
+    docs_per_s    文档编码吞吐量（长度分桶组批）
+    query_p50/p99 单条查询编码延迟（毫秒）
+    min/mean_cos  与torch fp32结果的余弦相似度（parity检查）
+
+语料与 bench_encoding.py 相同（大部分为标题，少部分为段落）。不指定 --model 时使用
+随机初始化、与 all-MiniLM-L6-v2 同规模的BERT。ONNX后端需要安装 onnxruntime（未安装时跳过）。
+任一后端的最小余弦相似度低于 --min-cosine 时退出码为1。
+
+用法:
+    python benchmarks/bench_encoders.py --num-docs 2000 --threads 4
+    python benchmarks/bench_encoders.py --model BAAI/bge-m3 --backends torch onnx_int8
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import importlib.util
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_encoding import make_texts, random_model
+from retriever.encoding import BucketedEncoder
+from retriever.encoder_backends import ENCODER_BACKENDS, load_encoder_backend, cosine_parity
+
+
+def query_latencies(encoder, queries):
+    """逐条编码查询，返回每条的耗时（毫秒）"""
+    latencies = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        encoder.encode([query])
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1000
+
+
+def run_backend(backend, model_name, config, texts, queries, args):
+    start = time.perf_counter()
+    tokenizer, model = load_encoder_backend(model_name, dict(config, backend=backend))
+    load_s = time.perf_counter() - start
+    encoder = BucketedEncoder(tokenizer, model, args.max_length, args.max_tokens, args.max_batch_size)
+
+    encoder.encode(queries[:10])    # 预热
+    start = time.perf_counter()
+    vectors = encoder.encode(texts)
+    docs_per_s = len(texts) / (time.perf_counter() - start)
+    latencies = query_latencies(encoder, queries)
+    return vectors, {
+        'backend': backend,
+        'load_s': load_s,
+        'docs_per_s': docs_per_s,
+        'query_p50_ms': float(np.percentile(latencies, 50)),
+        'query_p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="HuggingFace模型名，默认使用随机初始化的MiniLM规模BERT")
+    parser.add_argument("--backends", nargs="+", choices=ENCODER_BACKENDS, default=list(ENCODER_BACKENDS))
+    parser.add_argument("--num-docs", type=int, default=2000)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--title-fraction", type=float, default=0.8)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--max-tokens", type=int, default=16384)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=None, help="intra-op线程数")
+    parser.add_argument("--onnx-dir", default=None, help="导出ONNX模型的目录，默认为临时目录")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="与fp32结果的最小余弦相似度")
+    args = parser.parse_args()
+
+    if importlib.util.find_spec('onnxruntime') is None:
+        skipped = [backend for backend in args.backends if backend.startswith('onnx')]
+        if skipped:
+            print(f"onnxruntime not installed, skipping {', '.join(skipped)}")
+        args.backends = [backend for backend in args.backends if not backend.startswith('onnx')]
+
+    texts = make_texts(args.num_docs, args.title_fraction)
+    queries = make_texts(args.num_queries, 1.0, seed=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_name = args.model
+        if model_name is None:
+            model_name = os.path.join(tmp, "model")
+            tokenizer, model = random_model(tmp)
+            model.save_pretrained(model_name)
+            tokenizer.save_pretrained(model_name)
+        config = {'num_threads': args.threads, 'onnx_dir': args.onnx_dir or os.path.join(tmp, "onnx")}
+
+        # fp32基准总是最先运行，其余后端与之比较
+        backends = ['torch'] + [backend for backend in args.backends if backend != 'torch']
+        baseline = None
+        failed = False
+        print(f"{len(texts)} documents, {len(queries)} queries, threads={args.threads or 'default'}")
+        print(f"{'backend':<11} {'load_s':>7} {'docs/s':>9} {'p50_ms':>8} {'p99_ms':>8} {'min_cos':>8} {'mean_cos':>9}")
+        for backend in backends:
+            vectors, result = run_backend(backend, model_name, config, texts, queries, args)
+            if baseline is None:
+                baseline = vectors
+            parity = cosine_parity(baseline, vectors)
+            failed = failed or parity['min_cosine'] < args.min_cosine
+            print(f"{backend:<11} {result['load_s']:7.2f} {result['docs_per_s']:9.1f} {result['query_p50_ms']:8.2f} "
+                  f"{result['query_p99_ms']:8.2f} {parity['min_cosine']:8.5f} {parity['mean_cosine']:9.5f}")
+
+    if failed:
+        print(f"FAIL: a backend's embeddings fell below cosine {args.min_cosine} of fp32")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
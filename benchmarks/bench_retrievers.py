@@ -0,0 +1,421 @@
+"""检索器基准测试
+
+对 RankBM25Retriever、BM25SRetriever、FaissRetriever 在不同规模的语料上分别测量：
+    build_s              构建索引的时间（不含生成语料）
+    save_s / index_mb    保存时间与磁盘上的索引大小（含压缩的原始文档）
+    build_peak_rss_mb    构建进程的峰值RSS（corpus_rss_mb 为只生成语料时的RSS）
+    load_s / load_rss_mb 在新进程中加载索引的时间与加载后的RSS
+    latency_ms           逐条 search() 的延迟分位数（p50/p95/p99/mean）
+    batch_qps            search_batch() 一次处理全部查询的吞吐量
+    query_peak_rss_mb    查询进程的峰值RSS
+
+构建和查询分别在新的子进程（spawn）中执行，峰值RSS互不影响；FaissRetriever的编码模型
+在预热查询时加载，不计入加载时间。
+语料默认为词频服从Zipf分布的合成语料（固定随机种子，可复现）；指定 --data 时从
+decompress.py 输出的 .jsonl（或旧格式 .json）文件中按种子抽样。
+
+FaissRetriever 默认使用随机初始化的小型BERT（2层，64维，词表覆盖合成语料的常用词），
+测量的是索引与流水线本身的开销而不是模型的编码速度；--model 可指定真实模型。
+
+结果写为JSON（--output），包含运行环境与每个 (检索器, 文档数) 的指标。
+指定 --baseline 时与之前的结果比较，任何指标变差超过 --tolerance 时以非0状态退出。
+
+用法:
+    python benchmarks/bench_retrievers.py --sizes 10000 100000 --output results.json
+    python benchmarks/bench_retrievers.py --retrievers rank_bm25 bm25s --baseline results.json
+    python benchmarks/bench_retrievers.py --data data/wiki_00.jsonl --sizes 50000
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import io
+import multiprocessing
+import numpy as np
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from retriever.metrics import peak_rss_bytes
+
+RETRIEVERS = ('rank_bm25', 'bm25s', 'faiss')
+
+# 越大越差的指标；batch_qps越小越差
+COST_METRICS = ('build_s', 'save_s', 'index_mb', 'build_peak_rss_mb', 'load_s', 'load_rss_mb',
+                'latency_p50_ms', 'latency_p99_ms', 'query_peak_rss_mb')
+THROUGHPUT_METRICS = ('batch_qps',)
+
+
+def make_corpus(num_docs, vocab_size, seed=0):
+    """生成词频服从Zipf分布的合成语料，返回 (文本列表, 原始文档列表)"""
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocab_size)])
+    weights = 1.0 / np.arange(1, vocab_size + 1)
+    weights /= weights.sum()
+    # 大部分是短文本（标题），少部分是段落
+    lengths = np.where(rng.random(num_docs) < 0.5, rng.integers(2, 10, num_docs), rng.integers(20, 120, num_docs))
+    tokens = rng.choice(vocab_size, size=int(lengths.sum()), p=weights)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    texts = [' '.join(words[tokens[offsets[i]:offsets[i + 1]]]) for i in range(num_docs)]
+    raw = [{'id': str(i), 'type': 'paragraph', 'title': f"doc {i}", 'text': text} for i, text in enumerate(texts)]
+    return texts, raw
+
+
+def make_queries(num_queries, vocab_size, seed=1):
+    """每个查询包含若干常见词和若干较少见的词，近似自然语言问题"""
+    rng = np.random.default_rng(seed)
+    return [
+        ' '.join(f"w{t}" for t in np.concatenate([rng.integers(0, 20, 2), rng.integers(100, vocab_size // 10, 4)]))
+        for _ in range(num_queries)
+    ]
+
+
+def sample_documents(paths, num_docs, output, seed=0):
+    """从数据文件中均匀抽样num_docs个文档（蓄水池抽样），打乱后写为.jsonl
+
+    各规模的语料取该文件的前N行，较小的语料是较大语料的子集。
+    Returns:
+        int: 实际抽样的文档数
+    """
+    from build_index import iter_documents
+
+    rng = np.random.default_rng(seed)
+    reservoir = []
+    seen = 0
+    for path in paths:
+        for doc in iter_documents(path):
+            if len(reservoir) < num_docs:
+                reservoir.append(doc)
+            else:
+                j = rng.integers(0, seen + 1)
+                if j < num_docs:
+                    reservoir[j] = doc
+            seen += 1
+    rng.shuffle(reservoir)
+    with open(output, 'w', encoding='utf-8') as f:
+        for doc in reservoir:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+    return len(reservoir)
+
+
+def read_sample(path, num_docs):
+    """读取抽样文件的前num_docs个文档，返回 (文本列表, 原始文档列表)"""
+    raw = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if len(raw) >= num_docs:
+                break
+            raw.append(json.loads(line))
+    return [doc.get('text', '') for doc in raw], raw
+
+
+def sample_queries(texts, num_queries, seed=1):
+    """从语料中随机截取3~8个词的片段作为查询"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    while len(queries) < num_queries:
+        words = texts[rng.integers(0, len(texts))].split()
+        if words:
+            start = rng.integers(0, len(words))
+            queries.append(' '.join(words[start:start + rng.integers(3, 9)]))
+    return queries
+
+
+def tiny_model(directory, vocab_size):
+    """保存随机初始化的小型BERT及词表（覆盖合成语料的前vocab_size个词），返回模型目录"""
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizer
+
+    os.makedirs(directory, exist_ok=True)
+    vocab = os.path.join(directory, "vocab.txt")
+    with open(vocab, 'w') as f:
+        f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + [f"w{i}" for i in range(vocab_size)]))
+    torch.manual_seed(0)
+    model = BertModel(BertConfig(vocab_size=vocab_size + 5, hidden_size=64, num_hidden_layers=2,
+                                 num_attention_heads=2, intermediate_size=128))
+    model.save_pretrained(directory)
+    BertTokenizer(vocab).save_pretrained(directory)
+    return directory
+
+
+def load_case_corpus(case):
+    if case['sample_path']:
+        return read_sample(case['sample_path'], case['num_docs'])
+    return make_corpus(case['num_docs'], case['vocab_size'], case['seed'])
+
+
+def faiss_overrides(case):
+    return {'index_factory': case['faiss_factory'], 'use_gpu': False}
+
+
+def build_retriever(case, texts, raw):
+    name = case['retriever']
+    if name == 'rank_bm25':
+        from retriever.analyzer import TokenizedCorpus
+        from retriever.rank_bm25_retriever import RankBM25Retriever
+        return RankBM25Retriever(TokenizedCorpus.from_texts(texts), raw)
+    if name == 'bm25s':
+        from retriever.bm25s_retriever import BM25SRetriever
+        return BM25SRetriever(texts, raw)
+    from retriever.faiss_retriever import FaissRetriever
+    return FaissRetriever(texts, raw, model_name=case['model'], config=faiss_overrides(case))
+
+
+def load_retriever(case, path):
+    name = case['retriever']
+    if name == 'rank_bm25':
+        from retriever.rank_bm25_retriever import RankBM25Retriever
+        return RankBM25Retriever.load(path)
+    if name == 'bm25s':
+        from retriever.bm25s_retriever import BM25SRetriever
+        return BM25SRetriever.load(path)
+    from retriever.faiss_retriever import FaissRetriever
+    retriever = FaissRetriever(model_name=case['model'], config=faiss_overrides(case))
+    retriever.load(path)
+    return retriever
+
+
+def rss_mb():
+    return psutil.Process().memory_info().rss / 2 ** 20
+
+
+def peak_rss_mb():
+    return peak_rss_bytes() / 2 ** 20
+
+
+def directory_size(path):
+    """目录中文件的总字节数，硬链接的同一文件只计一次"""
+    seen = set()
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            stat = os.lstat(os.path.join(root, name))
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽检索器构建/加载时的进度输出"""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def _init_worker(threads):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def run_build(case):
+    """子进程：生成语料，构建并保存索引"""
+    _init_worker(case['threads'])
+    texts, raw = load_case_corpus(case)
+    corpus_rss = rss_mb()
+    with quiet():
+        start = time.perf_counter()
+        retriever = build_retriever(case, texts, raw)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        retriever.save(case['index_path'])
+        save_s = time.perf_counter() - start
+    return {
+        'build_s': build_s,
+        'save_s': save_s,
+        'index_mb': directory_size(case['index_path']) / 2 ** 20,
+        'corpus_rss_mb': corpus_rss,
+        'build_peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_query(case):
+    """子进程：加载索引，测量逐条查询延迟和批量吞吐量"""
+    _init_worker(case['threads'])
+    with quiet():
+        start = time.perf_counter()
+        retriever = load_retriever(case, case['index_path'])
+        load_s = time.perf_counter() - start
+    load_rss = rss_mb()
+
+    queries = case['queries']
+    if case['retriever'] == 'rank_bm25':
+        from retriever.analyzer import DEFAULT_ANALYZER
+        queries = [DEFAULT_ANALYZER.tokenize(query) for query in queries]
+
+    top_k = case['top_k']
+    with quiet():
+        for query in queries[:min(20, len(queries))]:
+            retriever.search(query, top_k=top_k)
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        retriever.search(query, top_k=top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    retriever.search_batch(queries, top_k=top_k)
+    batch_qps = len(queries) / (time.perf_counter() - start)
+
+    return {
+        'load_s': load_s,
+        'load_rss_mb': load_rss,
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'latency_p99_ms': float(np.percentile(latencies, 99)),
+        'latency_mean_ms': float(np.mean(latencies)),
+        'batch_qps': batch_qps,
+        'query_peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_isolated(function, case):
+    """在新的spawn子进程中执行function(case)"""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(function, (case,))
+
+
+def environment():
+    """运行环境信息，比较结果时确认两次运行可比"""
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+    for module in ('faiss', 'torch', 'transformers'):
+        try:
+            info[module] = __import__(module).__version__
+        except ImportError:
+            info[module] = None
+    try:
+        info['git_commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info['git_commit'] = None
+    return info
+
+
+def compare(results, baseline, tolerance):
+    """与基线结果比较
+    Returns:
+        list: (检索器, 文档数, 指标, 基线值, 当前值) 中变差超过tolerance（相对值）的项
+    """
+    previous = {(row['retriever'], row['num_docs']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        old = previous.get((row['retriever'], row['num_docs']))
+        if old is None:
+            continue
+        for metric in COST_METRICS + THROUGHPUT_METRICS:
+            if metric not in row or not old.get(metric):
+                continue
+            change = row[metric] / old[metric] - 1
+            worse = -change if metric in THROUGHPUT_METRICS else change
+            if worse > tolerance:
+                regressions.append((row['retriever'], row['num_docs'], metric, old[metric], row[metric]))
+    return regressions
+
+
+def format_row(row):
+    return (f"{row['retriever']:<10} {row['num_docs']:>9} {row['build_s']:8.2f} {row['index_mb']:9.1f} "
+            f"{row['build_peak_rss_mb']:9.0f} {row['load_s']:7.3f} {row['latency_p50_ms']:8.2f} "
+            f"{row['latency_p99_ms']:8.2f} {row['batch_qps']:9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retrievers", nargs="+", choices=RETRIEVERS, default=list(RETRIEVERS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000], help="各次运行的文档数")
+    parser.add_argument("--data", nargs="+", default=None, help="从这些 .jsonl/.json 文件抽样语料，默认使用合成语料")
+    parser.add_argument("--vocab-size", type=int, default=50000, help="合成语料的词表大小")
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", default=None, help="FaissRetriever使用的模型，默认为随机初始化的小型BERT")
+    parser.add_argument("--faiss-factory", default="Flat", help="FAISS索引类型（index_factory字符串）")
+    parser.add_argument("--threads", type=int, default=None, help="torch线程数")
+    parser.add_argument("--work-dir", default=None, help="索引等临时文件的目录，默认为临时目录（运行后删除）")
+    parser.add_argument("--output", default="bench_retrievers.json", help="结果JSON文件")
+    parser.add_argument("--baseline", default=None, help="与之比较的历史结果JSON文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="指标变差超过该比例视为性能回退")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory(prefix="bench-retrievers-"))
+        os.makedirs(work_dir, exist_ok=True)
+
+        sample_path = None
+        if args.data:
+            sample_path = os.path.join(work_dir, "sample.jsonl")
+            available = sample_documents(args.data, max(args.sizes), sample_path, args.seed)
+            print(f"Sampled {available} documents from {len(args.data)} file(s)")
+            sizes = sorted({min(size, available) for size in args.sizes})
+        else:
+            sizes = sorted(set(args.sizes))
+
+        model = args.model
+        if 'faiss' in args.retrievers and model is None:
+            model = tiny_model(os.path.join(work_dir, "tiny-bert"), min(args.vocab_size, 30000))
+
+        print(f"{'retriever':<10} {'docs':>9} {'build_s':>8} {'index_mb':>9} {'build_rss':>9} "
+              f"{'load_s':>7} {'p50_ms':>8} {'p99_ms':>8} {'batch_qps':>9}")
+        results = []
+        for num_docs in sizes:
+            # 查询在父进程中生成，同一规模的各检索器使用相同的查询
+            if sample_path:
+                queries = sample_queries(read_sample(sample_path, num_docs)[0], args.num_queries, args.seed + 1)
+            else:
+                queries = make_queries(args.num_queries, args.vocab_size, args.seed + 1)
+            for name in args.retrievers:
+                case = {
+                    'retriever': name,
+                    'num_docs': num_docs,
+                    'vocab_size': args.vocab_size,
+                    'queries': queries,
+                    'top_k': args.top_k,
+                    'seed': args.seed,
+                    'sample_path': sample_path,
+                    'model': model,
+                    'faiss_factory': args.faiss_factory,
+                    'threads': args.threads,
+                    'index_path': os.path.join(work_dir, f"{name}-{num_docs}"),
+                }
+                row = {'retriever': name, 'num_docs': num_docs}
+                row.update(run_isolated(run_build, case))
+                row.update(run_isolated(run_query, case))
+                results.append(row)
+                print(format_row(row))
+
+    report = {
+        'environment': environment(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'work_dir')},
+        'corpus': 'sampled' if args.data else 'synthetic-zipf',
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for retriever, num_docs, metric, old, new in regressions:
+            print(f"REGRESSION {retriever} {num_docs} docs: {metric} {old:.3f} -> {new:.3f}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
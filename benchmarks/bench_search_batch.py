@@ -0,0 +1,72 @@
+"""BM25批量查询吞吐量测试
+
+在合成的Zipf分布语料上比较逐条 search() 与 search_batch() 的吞吐量，
+输出 QPS 以及每核 QPS（QPS / 并行线程数）。
+
+用法:
+    python benchmarks/bench_search_batch.py --num-docs 200000 --num-queries 2000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retriever.rank_bm25_retriever import RankBM25Retriever
+from retriever.parallel import default_num_workers
+
+
+def make_corpus(num_docs, vocab_size, seed=0):
+    """生成词频服从Zipf分布的合成语料"""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, vocab_size + 1)
+    weights /= weights.sum()
+    lengths = rng.integers(5, 80, num_docs)
+    tokens = rng.choice(vocab_size, size=int(lengths.sum()), p=weights)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    return [[f"t{t}" for t in tokens[offsets[i]:offsets[i + 1]]] for i in range(num_docs)]
+
+
+def make_queries(num_queries, vocab_size, seed=1):
+    """每个查询包含若干常见词和若干较少见的词，近似自然语言问题"""
+    rng = np.random.default_rng(seed)
+    return [
+        [f"t{t}" for t in np.concatenate([rng.integers(0, 20, 3), rng.integers(100, vocab_size // 10, 7)])]
+        for _ in range(num_queries)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-docs", type=int, default=200000)
+    parser.add_argument("--vocab-size", type=int, default=100000)
+    parser.add_argument("--num-queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=default_num_workers())
+    args = parser.parse_args()
+
+    print(f"Building corpus with {args.num_docs} documents...")
+    corpus = make_corpus(args.num_docs, args.vocab_size)
+    raw = [{'id': str(i), 'type': 'paragraph', 'text': ''} for i in range(len(corpus))]
+    retriever = RankBM25Retriever(corpus, raw)
+    queries = make_queries(args.num_queries, args.vocab_size)
+
+    start = time.perf_counter()
+    for query in queries:
+        retriever.search(query, args.top_k)
+    sequential = len(queries) / (time.perf_counter() - start)
+    print(f"sequential search:   {sequential:10.1f} QPS  ({sequential:10.1f} QPS/core)")
+
+    for workers in sorted({1, 2, 4, args.workers}):
+        if workers > args.workers:
+            continue
+        start = time.perf_counter()
+        retriever.search_batch(queries, args.top_k, num_workers=workers)
+        qps = len(queries) / (time.perf_counter() - start)
+        print(f"search_batch x{workers:<3d}   {qps:10.1f} QPS  ({qps / workers:10.1f} QPS/core)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""多进程查询服务的吞吐量与内存测试
+
+对每个工作进程数（--workers），在子进程中用 PreforkServer 启动查询服务（索引内存映射，
+fork前加载；编码模型由各工作进程在fork后加载），由 --clients 个客户端进程以keep-alive连接并发发送查询 --duration 秒，测量：
+    qps           每秒完成的请求数
+    p50/p99_ms    请求延迟
+    rss_mb        每个工作进程的平均RSS（共享的索引页在每个进程中都计入）
+    uss_mb        每个工作进程的平均独占内存
+    total_pss_mb  所有工作进程的PSS之和（共享页按进程数均摊），即实际占用的物理内存
+
+索引页在进程间共享时，total_pss_mb 随进程数的增长远小于 rss_mb × workers。
+不指定 --index-dir 时在临时目录中构建合成语料的BM25/BM25S索引。
+
+用法:
+    python benchmarks/bench_serving.py --workers 1 2 4 --clients 8
+    python benchmarks/bench_serving.py --index-dir ./indexes --retriever bm25 --workers 4
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import http.client
+import multiprocessing as mp
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_retrievers import make_queries
+from bench_startup import build_sparse_indexes
+from retriever.metrics import process_memory
+
+
+def run_server(index_dir, retriever, workers, port):
+    """子进程：加载索引并以预先fork的工作进程提供服务，直到被终止"""
+    from main_load_built_index import IndexLoader
+    from retriever.prefork import PreforkServer
+
+    loader = IndexLoader(index_dir=index_dir)
+    if retriever == 'bm25':
+        loader.load_bm25_index()
+    elif retriever == 'bm25s':
+        loader.load_bm25s_index()
+    else:
+        loader.load_faiss_index(gpu=False)
+    PreforkServer(loader, {'port': port, 'workers': workers, 'retrievers': [retriever],
+                           'memory_report_s': 0}).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"search service on port {port} did not start")
+
+
+def client(args):
+    """客户端进程：在一个keep-alive连接上循环发送查询，返回每个请求的延迟（秒）"""
+    port, retriever, queries, duration, top_k = args
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        body = json.dumps({'query': queries[i % len(queries)], 'top_k': top_k, 'retriever': retriever})
+        start = time.perf_counter()
+        connection.request('POST', '/search', body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"search failed with status {response.status}")
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    connection.close()
+    return latencies
+
+
+def worker_pids(server_pid):
+    with open(f'/proc/{server_pid}/task/{server_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def run_case(index_dir, retriever, workers, queries, args):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--server", "--index-dir", index_dir,
+                               "--retriever", retriever, "--workers", str(workers), "--port", str(port)],
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        with mp.get_context('spawn').Pool(args.clients) as pool:
+            # 预热：各工作进程触及索引页
+            pool.map(client, [(port, retriever, queries, 1.0, args.top_k)] * args.clients)
+            start = time.perf_counter()
+            results = pool.map(client, [(port, retriever, queries[i::args.clients], args.duration, args.top_k)
+                                        for i in range(args.clients)])
+            elapsed = time.perf_counter() - start
+        memory = [process_memory(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = np.concatenate([np.asarray(r) for r in results]) * 1000
+    return {
+        'workers': workers,
+        'qps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'rss_mb': float(np.mean([m['rss'] for m in memory])) / 2 ** 20,
+        'uss_mb': float(np.mean([m['uss'] for m in memory])) / 2 ** 20,
+        'total_pss_mb': sum(m['pss'] for m in memory) / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-dir", default=None, help="已构建的索引目录，默认构建临时的合成索引")
+    parser.add_argument("--num-docs", type=int, default=200000, help="合成索引的文档数")
+    parser.add_argument("--retriever", choices=('bm25', 'bm25s', 'faiss'), default='bm25s')
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端进程数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每种进程数的测试时长（秒）")
+    parser.add_argument("--num-queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", default=None, help="把结果写为JSON")
+    parser.add_argument("--server", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.server:
+        run_server(args.index_dir, args.retriever, args.workers[0], args.port)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench-serving-") as tmp:
+        index_dir = args.index_dir
+        if index_dir is None:
+            index_dir = tmp
+            print(f"Building synthetic BM25 indexes with {args.num_docs} documents...")
+            build_sparse_indexes(index_dir, args.num_docs)
+        queries = make_queries(args.num_queries, 50000)
+
+        results = []
+        print(f"{os.cpu_count()} CPUs, {args.clients} clients, retriever {args.retriever}")
+        print(f"{'workers':>7} {'qps':>9} {'p50_ms':>8} {'p99_ms':>8} {'rss_mb':>8} {'uss_mb':>8} {'total_pss_mb':>13}")
+        for workers in args.workers:
+            result = run_case(index_dir, args.retriever, workers, queries, args)
+            results.append(result)
+            print(f"{workers:7d} {result['qps']:9.1f} {result['p50_ms']:8.2f} {result['p99_ms']:8.2f} "
+                  f"{result['rss_mb']:8.1f} {result['uss_mb']:8.1f} {result['total_pss_mb']:13.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""冷启动时间测试
+
+在新的Python进程中用 IndexLoader 加载索引并执行第一个查询，测量：
+    total_s     进程从启动到第一个查询返回的总时间（在父进程中计时，含解释器启动）
+    import_s    导入 main_load_built_index 的时间
+    load_s      加载索引的时间
+    query_s     第一个查询的时间（FAISS包含加载编码模型）
+    rss_mb      第一个查询后的RSS
+    heavy       进程中已导入的重量级依赖（torch / transformers / faiss）
+
+每种检索器重复 --repeat 次，报告中位数；只用BM25/BM25S的进程不应导入torch等依赖，
+总时间应低于 --budget 秒（默认1秒）。
+
+不指定 --index-dir 时在临时目录中构建合成语料的BM25/BM25S索引
+（FAISS需要 --index-dir 中已有 faiss/ 索引）。
+
+用法:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --index-dir ./indexes --retrievers bm25 bm25s faiss
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEAVY_MODULES = ('torch', 'transformers', 'faiss')
+QUERY = "what is the capital of australia"
+
+
+def child(retriever, index_dir):
+    """子进程：导入、加载、查询，把各阶段耗时以JSON输出到stdout的最后一行"""
+    import io
+    import contextlib
+    import psutil
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        from main_load_built_index import IndexLoader
+        from retriever.analyzer import DEFAULT_ANALYZER
+        import_s = time.perf_counter() - start
+
+        loader = IndexLoader(index_dir=index_dir)
+        start = time.perf_counter()
+        if retriever == 'bm25':
+            loader.load_bm25_index()
+        elif retriever == 'bm25s':
+            loader.load_bm25s_index()
+        else:
+            loader.load_faiss_index()
+        load_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if retriever == 'bm25':
+            loader.bm25_retriever.search(DEFAULT_ANALYZER.tokenize(QUERY), top_k=5)
+        elif retriever == 'bm25s':
+            loader.bm25s_retriever.search(QUERY, top_k=5)
+        else:
+            loader.faiss_retriever.search(QUERY, top_k=5)
+        query_s = time.perf_counter() - start
+
+    print(json.dumps({
+        'import_s': import_s,
+        'load_s': load_s,
+        'query_s': query_s,
+        'rss_mb': psutil.Process().memory_info().rss / 2 ** 20,
+        'heavy': [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def build_sparse_indexes(index_dir, num_docs):
+    """在index_dir中构建合成语料的 bm25/ 与 bm25s/（与IndexBuilder相同的目录结构）"""
+    from bench_retrievers import make_corpus
+    from retriever.analyzer import TokenizedCorpus
+    from retriever.inverted_index import InvertedIndex
+    from retriever.rank_bm25_retriever import RankBM25Retriever
+    from retriever.bm25s_retriever import BM25SRetriever
+
+    texts, raw = make_corpus(num_docs, vocab_size=50000)
+    index = InvertedIndex.from_corpus(TokenizedCorpus.from_texts(texts))
+    RankBM25Retriever.from_index(index, raw).save(os.path.join(index_dir, "bm25"))
+    BM25SRetriever.from_index(index, raw).save(os.path.join(index_dir, "bm25s"))
+
+
+def run_trial(retriever, index_dir):
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", retriever, "--index-dir", index_dir],
+                             capture_output=True, text=True, cwd=ROOT)
+    total_s = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{retriever} cold start failed:\n{process.stderr[-2000:]}")
+    return dict(json.loads(process.stdout.strip().splitlines()[-1]), total_s=total_s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-dir", default=None, help="已构建的索引目录，默认构建临时的合成索引")
+    parser.add_argument("--num-docs", type=int, default=100000, help="合成索引的文档数")
+    parser.add_argument("--retrievers", nargs="+", choices=('bm25', 'bm25s', 'faiss'), default=['bm25', 'bm25s'])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="BM25/BM25S冷启动的时间上限（秒）")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.index_dir)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as tmp:
+        index_dir = args.index_dir
+        if index_dir is None:
+            index_dir = tmp
+            print(f"Building synthetic BM25 indexes with {args.num_docs} documents...")
+            build_sparse_indexes(index_dir, args.num_docs)
+
+        failed = False
+        print(f"{'retriever':<10} {'total_s':>8} {'import_s':>9} {'load_s':>8} {'query_s':>8} {'rss_mb':>7}  heavy imports")
+        for retriever in args.retrievers:
+            trials = [run_trial(retriever, index_dir) for _ in range(args.repeat)]
+            median = {key: float(np.median([trial[key] for trial in trials]))
+                      for key in ('total_s', 'import_s', 'load_s', 'query_s', 'rss_mb')}
+            heavy = trials[-1]['heavy']
+            print(f"{retriever:<10} {median['total_s']:8.3f} {median['import_s']:9.3f} {median['load_s']:8.3f} "
+                  f"{median['query_s']:8.3f} {median['rss_mb']:7.0f}  {', '.join(heavy) or '-'}")
+            if retriever != 'faiss' and median['total_s'] > args.budget:
+                failed = True
+
+    if failed:
+        print(f"FAIL: BM25 cold start exceeded {args.budget}s")
+        sys.exit(1)
+    print(f"OK: BM25 cold start within {args.budget}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,28 +4,69 @@ import pickle
 import psutil
 from pathlib import Path
 import numpy as np
-import gc
-import faiss
 from tqdm import tqdm
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import glob
 from datetime import datetime
 import logging
-from typing import List, Dict, Set, Any
+from typing import List, Dict, Any
 from retriever.bm25s_retriever import BM25SRetriever
 from retriever.rank_bm25_retriever import RankBM25Retriever
-from retriever.faiss_retriever import FaissRetriever
+from retriever.vector_store import VectorStore
+from retriever.document_store import DocumentStore, DocumentWriter
+from retriever.storage import replace_directory, write_json_atomic, read_json
+from retriever.inverted_index import InvertedIndex
+from retriever.shard import write_shard, read_manifest, load_shard
+from retriever.metrics import METRICS, configure_metrics, peak_rss_bytes
+from decompress import article_documents
 import shutil
+import hashlib
+import time
+
+# 构建清单（indexes/build/manifest.json）的格式版本
+BUILD_MANIFEST_VERSION = 2
+
+
+def iter_documents(json_path):
+    """逐条产生文件中的检索单元（原始文档dict）
+
+    .jsonl 为 decompress.py 输出的格式，每行一个已清洗的文档，逐行读取；
+    .json 为旧格式（整个文件是文章数组），整体读取后拆分。
+    """
+    if json_path.endswith('.jsonl'):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for article in data:
+        yield from article_documents(article)
+
+
+def tokenize_file(json_path, shard_path):
+    """worker进程：读取并分词一个文件，写成分片目录，只返回manifest"""
+    return write_shard(iter_documents(json_path), shard_path, source=json_path)
+
 
 class IndexBuilder:
-    def __init__(self, index_dir="./indexes", batch_size=1000):
+    def __init__(self, index_dir="./indexes", batch_size=1000, build_faiss=True,
+                 faiss_model_name="bert-base-uncased", faiss_config_path=None):
         """
         初始化索引构建器
         Args:
             index_dir: 索引保存目录
             batch_size: 每批处理的文档数量
+            build_faiss: 是否同时构建FAISS向量索引
+            faiss_model_name: FAISS检索器使用的编码模型
+            faiss_config_path: FAISS配置文件路径，默认为 retriever/faiss_config.yaml
         """
         self.batch_size = batch_size
+        self.build_faiss = build_faiss
+        self.faiss_model_name = faiss_model_name
+        self.faiss_config_path = faiss_config_path
         # 转换为绝对路径
         self.index_dir = os.path.abspath(index_dir)
         
@@ -35,17 +76,26 @@ class IndexBuilder:
         # 设置日志和进度记录相关的路径
         self.processed_files_path = os.path.join(index_dir, "processed_files.txt")
         self.log_path = os.path.join(index_dir, "build_index.log")
+        # 启用指标时，构建结束后把 METRICS 写到这里
+        self.metrics_path = os.path.join(index_dir, "build_metrics.json")
         
         # 初始化日志
         self.setup_logging()
         
-        # 加载已处理文件列表
-        self.processed_files = self._load_processed_files()
-        self.current_batch = 0
-        self.checkpoint_path = os.path.join(index_dir, "checkpoint.json")
-        self.load_checkpoint()
-        self.bm25_path = os.path.join(self.index_dir, "bm25.pkl")
+        self.bm25_path = os.path.join(self.index_dir, "bm25")
         self.bm25s_path = os.path.join(self.index_dir, "bm25s")
+        # 所有检索器共享的压缩文档存储，各索引目录中只保存指向它的链接
+        self.documents_path = os.path.join(self.index_dir, "documents")
+        # 构建中的状态：清单、已提交的倒排索引和按文件顺序追加的文档，全部处理完后再发布
+        self.build_path = os.path.join(self.index_dir, "build")
+        self.build_manifest_path = os.path.join(self.build_path, "manifest.json")
+        self.sparse_build_path = os.path.join(self.build_path, "sparse")
+        self.documents_build_path = os.path.join(self.build_path, "documents")
+        # worker写出的分词分片
+        self.shards_path = os.path.join(self.index_dir, "shards")
+        # FAISS向量和文档先流式写入构建目录，全部处理完后再训练索引并整体替换 faiss/
+        self.faiss_path = os.path.join(self.index_dir, "faiss")
+        self.faiss_build_path = os.path.join(self.index_dir, "faiss.build")
         self.initialize_indexes()
     
     def setup_logging(self):
@@ -66,108 +116,23 @@ class IndexBuilder:
         self.logger = logging.getLogger(__name__)
         self.logger.info(f"日志初始化完成，日志文件: {self.log_path}")
     
-    def _load_processed_files(self) -> Set[str]:
-        """加载已处理文件列表"""
-        if os.path.exists(self.processed_files_path):
-            with open(self.processed_files_path, 'r') as f:
-                return set(line.strip() for line in f)
-        return set()
-    
-    def _save_processed_file(self, filepath: str):
-        """记录已处理的文件"""
-        with open(self.processed_files_path, 'a') as f:
-            f.write(f"{filepath}\n")
-        self.processed_files.add(filepath)
+    def _save_processed_files(self, filepaths: List[str]):
+        """记录已提交到索引的文件（整体替换，由构建清单导出，重复写入结果相同）"""
+        tmp_path = self.processed_files_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(f"{filepath}\n" for filepath in filepaths)
+        os.replace(tmp_path, self.processed_files_path)
 
     def log_memory_usage(self):
-        """记录内存使用情况"""
-        process = psutil.Process()
-        mem_info = process.memory_info()
-        self.logger.info(f"Memory usage: {mem_info.rss / 1024 / 1024:.2f} MB")
-
-    def load_data(self, json_path):
-        """使用迭代器方式加载和预处理JSON数据"""
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            documents = []
-            raw_documents = []
-            doc_count = 0
-            
-            for doc in data:
-                if doc_count >= self.batch_size:
-                    yield documents, raw_documents
-                    documents = []
-                    raw_documents = []
-                    doc_count = 0
-                    gc.collect()  # 强制垃圾回收
-                
-                # 处理title
-                title = doc['title'].lower()
-                title_doc = {'id': doc['id'], 'type': 'title', 'text': title}
-                documents.append(title)
-                raw_documents.append(title_doc)
-                doc_count += 1
-                
-                # 处理每个段落文本
-                for paragraph in doc['text']:
-                    if not paragraph:
-                        continue
-                    
-                    text_content = ' '.join(paragraph)
-                    text_content = text_content.replace('<a href="', '').replace('">', ' ').replace('</a>', '')
-                    processed_text = ' '.join(text_content.lower().split())
-                    
-                    if (processed_text.strip()):
-                        paragraph_doc = {
-                            'id': doc['id'],
-                            'type': 'paragraph',
-                            'text': processed_text,
-                            'title': title
-                        }
-                        documents.append(processed_text)
-                        raw_documents.append(paragraph_doc)
-                        doc_count += 1
-                        
-                        if doc_count >= self.batch_size:
-                            yield documents, raw_documents
-                            documents = []
-                            raw_documents = []
-                            doc_count = 0
-                            gc.collect()
-            
-            if documents:  # 处理剩余的文档
-                yield documents, raw_documents
-                
-        except Exception as e:
-            self.logger.error(f"Error loading file {json_path}: {str(e)}")
-            return [], []
-
-    def process_single_json(self, json_path: str) -> List[tuple]:
-        """处理单个JSON文件，返回多个批次的结果"""
-        try:
-            if (json_path in self.processed_files):
-                self.logger.info(f"跳过已处理的文件: {json_path}")
-                return []
-            
-            self.logger.info(f"处理文件: {json_path}")
-            self.log_memory_usage()
-            
-            results = []
-            for batch_docs, batch_raw_docs in self.load_data(json_path):
-                if batch_docs and batch_raw_docs:
-                    results.append((batch_docs, batch_raw_docs))
-                
-            self._save_processed_file(json_path)
-            return results
-            
-        except Exception as e:
-            self.logger.error(f"处理文件 {json_path} 时出错: {str(e)}")
-            return []
+        """记录内存使用情况（当前RSS与峰值）"""
+        rss = psutil.Process().memory_info().rss
+        peak = peak_rss_bytes()
+        METRICS.set('build_memory_rss_bytes', rss)
+        METRICS.set_max('build_memory_high_water_bytes', peak)
+        self.logger.info(f"Memory usage: {rss / 1024 / 1024:.2f} MB (peak {peak / 1024 / 1024:.2f} MB)")
 
     def find_all_json_files(self, data_dir: str) -> List[str]:
-        """查找目录下所有JSON文件"""
+        """查找目录下所有JSON/JSONL文件"""
         # 转换为绝对路径
         data_dir = os.path.abspath(data_dir)
         self.logger.info(f"搜索目录的绝对路径: {data_dir}")
@@ -184,7 +149,8 @@ class IndexBuilder:
             self.logger.debug(f"当前目录下的文件数: {len(files)}")
             
             for file in files:
-                if file.endswith('.json'):
+                # decompress.py 输出的 .jsonl，或旧格式的 .json
+                if file.endswith('.json') or file.endswith('.jsonl'):
                     full_path = os.path.join(root, file)
                     json_files.append(full_path)
                     self.logger.debug(f"找到JSON文件: {full_path}")
@@ -198,22 +164,6 @@ class IndexBuilder:
         
         return json_files
 
-    def load_checkpoint(self):
-        """加载检查点信息"""
-        if os.path.exists(self.checkpoint_path):
-            with open(self.checkpoint_path, 'r') as f:
-                self.checkpoint = json.load(f)
-        else:
-            self.checkpoint = {
-                'current_batch': 0,
-                'processed_count': 0
-            }
-
-    def save_checkpoint(self):
-        """保存检查点信息"""
-        with open(self.checkpoint_path, 'w') as f:
-            json.dump(self.checkpoint, f)
-
     def initialize_indexes(self):
         """初始化或加载现有索引"""
         try:
@@ -232,156 +182,342 @@ class IndexBuilder:
             self.bm25_index = None
             self.bm25s_index = None
 
-    def append_to_index(self, documents, raw_documents, index_type):
-        """将文档追加到现有索引"""
-        try:
-            if index_type == 'bm25':
-                tokenized_docs = [doc.split() for doc in documents]
-                if self.bm25_index is None:
-                    # 首次创建索引
-                    self.bm25_index = RankBM25Retriever(tokenized_docs, raw_documents)
-                else:
-                    # 追加到现有索引
-                    self.bm25_index.add_documents(tokenized_docs, raw_documents)
-                
-                # 保存更新后的索引
-                try:
-                    self.bm25_index.save(self.bm25_path)
-                    self.logger.info(f"Successfully saved BM25 index to {self.bm25_path}")
-                except Exception as save_error:
-                    self.logger.error(f"Error saving BM25 index: {str(save_error)}")
-                    raise
-                    
-            elif index_type == 'bm25s':
-                try:
-                    if self.bm25s_index is None:
-                        # 首次创建索引
-                        self.bm25s_index = BM25SRetriever(documents, raw_documents)
+        # FAISS检索器（加载编码模型）和构建目录在第一次追加文档时才打开
+        self.faiss_index = None
+        self.faiss_vectors = None
+        self.faiss_documents = None
+
+    def open_faiss_build(self):
+        """打开FAISS流式构建目录，丢弃构建清单中最后一次提交之后写入的向量和文档"""
+        if self.faiss_index is None:
+            # 不构建FAISS（build_faiss=False）或只用 iter_documents 的进程不导入faiss/torch
+            from retriever.faiss_retriever import FaissRetriever
+            self.faiss_index = FaissRetriever(model_name=self.faiss_model_name, config_path=self.faiss_config_path)
+        if self.faiss_vectors is not None:
+            return
+
+        self.faiss_vectors = VectorStore(os.path.join(self.faiss_build_path, "vectors"))
+        self.faiss_documents = DocumentWriter(os.path.join(self.faiss_build_path, "documents"))
+        # 第i行向量对应文档id i；提交时向量数与文档数一起写入构建清单
+        committed = self.build_manifest['faiss_count']
+        available = min(len(self.faiss_vectors), len(self.faiss_documents))
+        if available < committed:
+            raise RuntimeError(f"FAISS构建目录只有 {available} 条记录，少于已提交的 {committed} 条，"
+                               f"请删除 {self.build_path} 和 {self.faiss_build_path} 后重新构建")
+        self.faiss_vectors.truncate(committed)
+        self.faiss_documents.truncate(committed)
+        if committed:
+            self.logger.info(f"从上次提交处恢复FAISS构建，已有 {committed} 个向量")
+
+    def shard_path_for(self, json_path: str) -> str:
+        """文件对应的分片目录：indexes/shards/<路径哈希>-<文件名>"""
+        digest = hashlib.md5(os.path.abspath(json_path).encode('utf-8')).hexdigest()[:12]
+        name = os.path.basename(json_path).rsplit('.', 1)[0]
+        return os.path.join(self.shards_path, f"{digest}-{name}")
+
+    def index_shard(self, shard_path: str, manifest: Dict[str, Any]):
+        """把一个分片追加到倒排索引和文档存储（按需编码到FAISS构建目录）"""
+        doc_start = self.sparse_index.num_docs
+        num_docs = manifest['num_docs']
+        documents_path = os.path.join(shard_path, "documents")
+        self.documents_writer.append_directory(documents_path)
+        self.sparse_index.add_corpus(load_shard(shard_path))
+
+        if self.build_faiss and num_docs:
+            self.open_faiss_build()
+            if len(self.faiss_vectors) != doc_start:
+                raise RuntimeError(f"FAISS构建目录有 {len(self.faiss_vectors)} 个向量，与已索引的 {doc_start} 个文档"
+                                   f"不一致，请删除 {self.build_path} 和 {self.faiss_build_path} 后重新构建")
+            documents = DocumentStore.open(documents_path)
+            for start in range(0, num_docs, self.batch_size):
+                raw_documents = [documents[i] for i in range(start, min(start + self.batch_size, num_docs))]
+                with METRICS.timer('build_stage_seconds', stage='encode'):
+                    # 向量直接追加到内存映射文件，不在内存中累积
+                    vectors = self.faiss_index.encode_documents([doc['text'] for doc in raw_documents])
+                self.faiss_vectors.append(vectors)
+                self.faiss_documents.extend(raw_documents)
+                # 中断后重新编码本分片时，已编码的批次从向量缓存中读取
+                if self.faiss_index.embedding_cache is not None:
+                    self.faiss_index.embedding_cache.flush()
+
+        self.logger.info(f"已合并分片 {os.path.basename(shard_path)}: {num_docs} 个文档, "
+                         f"{manifest['num_tokens']} 个词")
+
+    @staticmethod
+    def _file_entry(json_path: str) -> Dict[str, Any]:
+        """构建清单中一个文件的记录，大小或修改时间变化说明文件已改变"""
+        stat = os.stat(json_path)
+        return {'path': json_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _write_build_manifest(self):
+        write_json_atomic(self.build_manifest_path, self.build_manifest)
+
+    def open_build(self, json_files: List[str]) -> List[str]:
+        """打开构建目录，返回还需要处理的文件
+
+        上次的构建未完成、且已提交的文件都未变化时，加载已提交的倒排索引，丢弃提交之后
+        追加的文档，继续处理其余文件（包括上次处理失败的文件，它们没有被提交）；
+        否则清空构建目录重新开始（已有的分片仍会复用）。
+        """
+        entries = [self._file_entry(json_file) for json_file in json_files]
+        manifest = read_json(self.build_manifest_path) if os.path.exists(self.build_manifest_path) else None
+        if manifest is not None and manifest.get('format_version') == BUILD_MANIFEST_VERSION:
+            current = {entry['path']: entry for entry in entries}
+            committed = [{key: entry[key] for key in ('path', 'size', 'mtime_ns')} for entry in manifest['files']]
+            unchanged = all(current.get(entry['path']) == entry for entry in committed)
+            if manifest['status'] == 'published' and unchanged and len(committed) == len(entries):
+                self.logger.info("索引已是最新，没有需要处理的文件")
+                self.build_manifest = manifest
+                return None
+            # 构建FAISS时，已提交的向量必须与已提交的文档一一对应
+            faiss_committed = not self.build_faiss or manifest['faiss_count'] == manifest['num_docs']
+            if manifest['status'] == 'building' and unchanged and faiss_committed:
+                documents_writer = DocumentWriter(self.documents_build_path)
+                if (len(documents_writer) >= manifest['num_docs']
+                        and (manifest['num_docs'] == 0 or InvertedIndex.exists(self.sparse_build_path))):
+                    documents_writer.truncate(manifest['num_docs'])
+                    self.documents_writer = documents_writer
+                    if manifest['num_docs']:
+                        self.sparse_index = InvertedIndex.load(self.sparse_build_path)
+                        self.sparse_index.background_merge = True
                     else:
-                        # 追加到现有索引
-                        self.bm25s_index.add_documents(documents, raw_documents)
-                    
-                    # 保存更新后的索引
-                    self.bm25s_index.save(self.bm25s_path)
-                    self.logger.info(f"Successfully saved BM25S index to {self.bm25s_path}")
-                except Exception as save_error:
-                    self.logger.error(f"Error with BM25S index: {str(save_error)}")
-                    raise
-                
-            self.logger.info(f"Updated {index_type} index with {len(documents)} documents")
-            
-        except Exception as e:
-            self.logger.error(f"Error updating {index_type} index: {str(e)}")
-            raise
+                        self.sparse_index = InvertedIndex(background_merge=True)
+                    self.build_manifest = manifest
+                    self.build_manifest['failed'] = []
+                    self.logger.info(f"从上次提交处继续构建：已提交 {len(committed)} 个文件，"
+                                     f"{manifest['num_docs']} 个文档")
+                    done = {entry['path'] for entry in committed}
+                    return [json_file for json_file in json_files if json_file not in done]
+            self.logger.info("文件列表或构建状态已变化，重新开始构建")
 
-    def process_and_save_batch(self, documents, raw_documents):
-        """处理一个批次的文档并追加到索引"""
-        try:
-            self.logger.info(f"Processing batch {self.current_batch} with {len(documents)} documents")
-            
-            # 追加到BM25索引
-            self.append_to_index(documents, raw_documents, 'bm25')
-            
-            # 追加到BM25S索引
-            self.append_to_index(documents, raw_documents, 'bm25s')
-            
-            # 更新检查点
-            self.checkpoint['current_batch'] = self.current_batch
-            self.checkpoint['processed_count'] += len(documents)
-            self.save_checkpoint()
-            
-            self.current_batch += 1
-            gc.collect()
-            self.log_memory_usage()
-            
-        except Exception as e:
-            self.logger.error(f"Error processing batch {self.current_batch}: {str(e)}")
-            raise
-    
-    def merge_document_lists(self, all_results: List[List[tuple]]) -> None:
-        """分批处理并保存结果"""
-        all_documents = []
-        all_raw_documents = []
-        
-        for batch_results in all_results:
-            if not batch_results:
+        shutil.rmtree(self.build_path, ignore_errors=True)
+        os.makedirs(self.build_path)
+        # 文档id从0重新分配，FAISS构建目录中已编码的向量不再对应
+        shutil.rmtree(self.faiss_build_path, ignore_errors=True)
+        self.faiss_vectors = None
+        self.faiss_documents = None
+        # 合并段的工作在后台线程中进行，不阻塞分片的追加
+        self.sparse_index = InvertedIndex(background_merge=True)
+        self.documents_writer = DocumentWriter(self.documents_build_path)
+        self.build_manifest = {
+            'format_version': BUILD_MANIFEST_VERSION,
+            'status': 'building',
+            'num_docs': 0,
+            # 已提交的FAISS向量数，构建FAISS时与num_docs相同
+            'faiss_count': 0,
+            # 已提交的文件，按文档id的顺序；处理失败的文件只记录在failed中，下次运行时重试
+            'files': [],
+            'failed': [],
+        }
+        self._write_build_manifest()
+        return json_files
+
+    def commit_build(self):
+        """提交构建进度：文档落盘、倒排索引写入构建目录，最后原子地替换构建清单
+
+        清单替换是提交点；在此之前中断，重启后回到上一次提交，之后追加的内容（包括FAISS
+        构建目录中的向量和文档）被丢弃。
+        """
+        with METRICS.timer('build_stage_seconds', stage='commit'):
+            self.documents_writer.flush()
+            if self.faiss_vectors is not None:
+                self.faiss_vectors.flush()
+                self.faiss_documents.flush()
+                if self.faiss_index.embedding_cache is not None:
+                    self.faiss_index.embedding_cache.flush()
+                self.build_manifest['faiss_count'] = len(self.faiss_vectors)
+            if self.sparse_index.num_docs:
+                tmp_path = self.sparse_build_path + ".tmp"
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                # 上次提交中已有的段以硬链接复用，只写入新段
+                self.sparse_index.save(tmp_path, previous=self.sparse_build_path)
+                replace_directory(tmp_path, self.sparse_build_path)
+            self.build_manifest['num_docs'] = self.sparse_index.num_docs
+            self._write_build_manifest()
+        self._save_processed_files([entry['path'] for entry in self.build_manifest['files']])
+        self.logger.info(f"已提交 {len(self.build_manifest['files'])} 个文件，"
+                         f"{self.sparse_index.num_docs} 个文档")
+
+    def finalize_sparse_indexes(self):
+        """保存共享的压缩文档存储，以及链接到它的BM25和BM25S索引"""
+        if self.sparse_index.num_docs == 0:
+            self.logger.info("没有需要索引的文档")
+            return
+        self.sparse_index.wait_for_merges()
+        self.documents_writer.finish()
+        tmp_path = self.documents_path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        DocumentStore.open(self.documents_build_path).save(tmp_path)
+        replace_directory(tmp_path, self.documents_path)
+        shared = DocumentStore.open(self.documents_path)
+        self.logger.info(f"共享文档存储已保存到 {self.documents_path}，共 {len(shared)} 个文档")
+
+        # 两个检索器使用相同的分词，保存同一个倒排索引后分别重新加载（互不影响后续追加）
+        RankBM25Retriever.from_index(self.sparse_index, shared).save(self.bm25_path)
+        BM25SRetriever.from_index(self.sparse_index, shared).save(self.bm25s_path)
+        self.bm25_index = RankBM25Retriever.load(self.bm25_path)
+        self.bm25s_index = BM25SRetriever.load(self.bm25s_path)
+        self.logger.info(f"BM25/BM25S索引已保存，共 {self.sparse_index.num_docs} 个文档，"
+                         f"{self.sparse_index.vocab_size} 个词，{len(self.sparse_index.segments)} 个段")
+        self.log_memory_usage()
+
+    def publish_build(self):
+        """发布构建结果：替换 documents/、bm25/、bm25s/、faiss/，再把清单标记为已发布
+
+        每个目录都先写临时目录再整体替换；发布中途中断时清单仍为building且所有文件
+        都已提交，重启后直接重新发布，不需要重新分词或编码。
+        """
+        with METRICS.timer('build_stage_seconds', stage='finalize_sparse'):
+            self.finalize_sparse_indexes()
+        if self.build_faiss:
+            with METRICS.timer('build_stage_seconds', stage='finalize_faiss'):
+                self.finalize_faiss_index()
+        self.build_manifest['status'] = 'published'
+        self._write_build_manifest()
+        # 发布后不再需要构建中的倒排索引和文档
+        shutil.rmtree(self.sparse_build_path, ignore_errors=True)
+        shutil.rmtree(self.documents_build_path, ignore_errors=True)
+
+    def finalize_faiss_index(self):
+        """用构建目录中内存映射的向量训练并构建FAISS索引，保存到 faiss/
+
+        训练只读取采样的向量，添加时分批读取，完整的向量矩阵不会整体载入内存。
+        原始向量保存在 faiss/vectors/ 下。
+        """
+        if self.faiss_vectors is None and os.path.isdir(self.faiss_build_path):
+            self.open_faiss_build()
+        if self.faiss_vectors is None or len(self.faiss_vectors) == 0:
+            self.logger.info("没有需要加入FAISS索引的向量")
+            return
+
+        self.logger.info(f"构建FAISS索引，共 {len(self.faiss_vectors)} 个向量")
+        self.faiss_documents.finish()
+        documents = DocumentStore.open(os.path.join(self.faiss_build_path, "documents"))
+        if os.path.isdir(self.documents_path):
+            shared = DocumentStore.open(self.documents_path)
+            if len(shared) == len(documents):
+                documents = shared
+        if documents.directory != self.documents_path:
+            # 构建目录随后会被删除，文档需要复制保存而不是链接
+            documents.directory = None
+        self.faiss_index.raw_docs = documents
+        self.faiss_index.index_vectors(self.faiss_vectors.vectors())
+        # 原始向量以硬链接随索引一起原子地提交到 faiss/vectors/
+        self.faiss_index.save(self.faiss_path, vectors=self.faiss_vectors.vectors())
+        if self.faiss_index.embedding_cache is not None:
+            self.faiss_index.embedding_cache.flush()
+
+        shutil.rmtree(self.faiss_build_path, ignore_errors=True)
+        self.faiss_vectors = None
+        self.faiss_documents = None
+        self.logger.info(f"FAISS索引已保存到 {self.faiss_path}")
+        self.log_memory_usage()
+
+    def merge_all_indexes(self, max_segments=1):
+        """把BM25/BM25S索引的倒排表段强制合并为至多max_segments个并保存
+
+        构建和追加时段按分层策略自动合并；语料不再变化后调用本方法，
+        可以减少查询时需要访问的段数。
+        """
+        for name, retriever, path in (('BM25', self.bm25_index, self.bm25_path),
+                                      ('BM25S', self.bm25s_index, self.bm25s_path)):
+            if retriever is None or retriever.bm25 is None:
                 continue
-                
-            for batch_data in batch_results:
-                if not isinstance(batch_data, tuple) or len(batch_data) != 2:
-                    self.logger.warning(f"跳过无效的批次数据: {batch_data}")
-                    continue
-                    
-                docs, raw_docs = batch_data
-                all_documents.extend(docs)
-                all_raw_documents.extend(raw_docs)
-                
-                # 当累积的文档数量达到批处理大小时进行处理
-                if len(all_documents) >= self.batch_size:
-                    self.process_and_save_batch(all_documents, all_raw_documents)
-                    all_documents = []
-                    all_raw_documents = []
-        
-        # 处理剩余的文档
-        if all_documents:
-            self.process_and_save_batch(all_documents, all_raw_documents)
+            before = len(retriever.bm25.segments)
+            retriever.bm25.force_merge(max_segments)
+            retriever.save(path)
+            self.logger.info(f"{name}索引的段已从 {before} 个合并为 {len(retriever.bm25.segments)} 个")
+
+    def build_all_indexes(self, data_dir: str, max_workers: int = 4, commit_interval: float = 300):
+        """处理目录下所有JSON文件并构建索引
 
-    def merge_all_indexes(self):
-        """合并所有批次的索引（如果需要）"""
-        # 这里可以添加合并索引的逻辑
-        pass
+        worker进程把每个文件分词为局部词id并写成分片（indexes/shards/），只把manifest
+        返回给主进程，不再传递文档列表；主进程按文件顺序把分片的局部词表映射到全局词表，
+        以numpy数组的形式追加到倒排索引。来源文件未变化的分片直接复用，不再重新分词。
 
-    def build_all_indexes(self, data_dir: str, max_workers: int = 4):
-        """处理目录下所有JSON文件并构建索引"""
+        进度记录在构建清单中，每隔commit_interval秒（以及处理完所有文件后）提交一次，
+        文件只有在包含它的提交完成后才算处理完。中断后重新运行会从上一次提交处继续，
+        FAISS向量按自己的检查点恢复，不会重新编码。已有的索引在新索引发布前保持可用。
+        Args:
+            data_dir: 数据目录
+            max_workers: 分词进程数
+            commit_interval: 两次提交之间的最短间隔（秒）
+        """
         start_time = datetime.now()
         self.logger.info(f"开始处理目录: {data_dir}")
         
-        # 查找所有JSON文件
-        json_files = self.find_all_json_files(data_dir)
+        # 查找所有JSON文件（排序后文档id与文件顺序一致）
+        json_files = sorted(self.find_all_json_files(data_dir))
         total_files = len(json_files)
         self.logger.info(f"找到 {total_files} 个JSON文件")
-        
-        # 确保索引目录存在且清空旧索引
-        if os.path.exists(self.bm25_path):
-            os.remove(self.bm25_path)
-        if os.path.exists(self.bm25s_path):
-            shutil.rmtree(self.bm25s_path, ignore_errors=True)
-            
-        # 并行处理文件
-        all_results = []
-        total_docs = 0
-        with tqdm(total=total_files, desc="处理JSON文件") as pbar:
+
+        pending = self.open_build(json_files)
+        if pending is None:
+            return
+
+        # 并行分词，主进程按文件顺序合并分片
+        last_commit = time.monotonic()
+        build_start = time.perf_counter()
+        docs_indexed = bytes_read = 0
+        with tqdm(total=total_files, initial=total_files - len(pending), desc="处理JSON文件") as pbar:
             with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                futures = {
-                    executor.submit(self.process_single_json, json_file): json_file 
-                    for json_file in json_files
-                }
-                
-                for future in as_completed(futures):
-                    file = futures[future]
+                jobs = []
+                for json_file in pending:
+                    shard_path = self.shard_path_for(json_file)
+                    manifest = read_manifest(shard_path)
+                    if manifest is not None:
+                        self.logger.info(f"复用已有分片: {json_file}")
+                        future = None
+                    else:
+                        future = executor.submit(tokenize_file, json_file, shard_path)
+                    jobs.append((json_file, shard_path, manifest, future))
+
+                for json_file, shard_path, manifest, future in jobs:
+                    entry = self._file_entry(json_file)
                     try:
-                        batch_results = future.result()
-                        if batch_results:
-                            # 直接处理这个文件的结果，而不是收集所有结果
-                            self.merge_document_lists([batch_results])
-                            doc_count = sum(len(docs) for batch in batch_results 
-                                         if isinstance(batch, tuple) and len(batch) == 2 
-                                         for docs in [batch[0]])
-                            total_docs += doc_count
-                            
-                        pbar.update(1)
-                        self.logger.info(f"已处理文档数: {total_docs}")
-                        self.log_memory_usage()
+                        if future is not None:
+                            manifest = future.result()
+                            METRICS.observe('build_stage_seconds', manifest['tokenize_seconds'], stage='tokenize')
                     except Exception as e:
-                        self.logger.error(f"处理文件 {file} 失败: {str(e)}")
-                        pbar.update(1)
-        
-        # 可选：合并所有批次的索引
-        # self.merge_all_indexes()
+                        # 文件读取或分词失败时没有追加任何内容，不作为已处理提交，下次运行时重试
+                        self.logger.error(f"处理文件 {json_file} 失败: {str(e)}")
+                        entry['error'] = str(e)
+                        self.build_manifest['failed'].append(entry)
+                    else:
+                        # 追加到一半失败会让索引与文档不一致，直接中止，重启后从上次提交处继续
+                        with METRICS.timer('build_stage_seconds', stage='index'):
+                            self.index_shard(shard_path, manifest)
+                        entry['num_docs'] = manifest['num_docs']
+                        docs_indexed += manifest['num_docs']
+                        bytes_read += entry['size']
+                        elapsed = time.perf_counter() - build_start
+                        METRICS.inc('build_documents_total', manifest['num_docs'])
+                        METRICS.inc('build_bytes_read_total', entry['size'])
+                        METRICS.set('build_documents_per_second', docs_indexed / elapsed)
+                        self.logger.info(f"已处理文档数: {self.sparse_index.num_docs} "
+                                         f"({docs_indexed / elapsed:.0f} docs/s, "
+                                         f"{bytes_read / elapsed / 1024 / 1024:.1f} MB/s)")
+                        self.build_manifest['files'].append(entry)
+                    pbar.update(1)
+                    if time.monotonic() - last_commit >= commit_interval:
+                        self.commit_build()
+                        last_commit = time.monotonic()
+
+        self.commit_build()
+        failed = [entry['path'] for entry in self.build_manifest['failed']]
+        if failed:
+            # 不发布不完整的索引；已提交的文件保留在构建目录中，修复后重新运行只处理失败的文件
+            self.logger.error(f"{len(failed)} 个文件处理失败，索引未发布，修复后重新运行: {failed}")
+            return
+        self.publish_build()
         
         end_time = datetime.now()
         duration = end_time - start_time
+        self.log_memory_usage()
         self.logger.info(f"索引构建完成! 总用时: {duration}")
+        if METRICS.enabled:
+            METRICS.write(self.metrics_path)
+            self.logger.info(f"构建指标已写入 {self.metrics_path}")
 
 if __name__ == "__main__":
     # 获取当前脚本的绝对路径
@@ -391,6 +527,7 @@ if __name__ == "__main__":
     data_dir = os.path.join(current_dir, "", "decompressed_files")
     index_dir = os.path.join(current_dir, "indexes")
     
+    configure_metrics()
     builder = IndexBuilder(index_dir=index_dir, batch_size=1000)
     builder.logger.info(f"当前工作目录: {os.getcwd()}")
     builder.logger.info(f"数据目录: {data_dir}")
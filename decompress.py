@@ -1,49 +1,82 @@
 import os
 import bz2
 import json
-import shutil
 from multiprocessing import Pool, cpu_count
-from typing import List, Tuple
+from typing import Iterator, Tuple
 
-def process_single_file(args: Tuple[str, str, str]) -> None:
+def clean_paragraph(paragraph) -> str:
+    """段落（句子列表）拼接后去除链接标记，转小写并合并空白"""
+    text_content = ' '.join(paragraph)
+    text_content = text_content.replace('<a href="', '').replace('">', ' ').replace('</a>', '')
+    return ' '.join(text_content.lower().split())
+
+
+def article_documents(article: dict) -> Iterator[dict]:
+    """把一篇文章拆成检索单元：标题一条，每个非空段落一条"""
+    title = article['title'].lower()
+    yield {'id': article['id'], 'type': 'title', 'text': title}
+    for paragraph in article['text']:
+        if not paragraph:
+            continue
+        processed_text = clean_paragraph(paragraph)
+        if processed_text:
+            yield {'id': article['id'], 'type': 'paragraph', 'text': processed_text, 'title': title}
+
+
+def output_path_for(bz2_path: str, root_dir: str, output_dir: str) -> str:
+    """bz2分片对应的JSONL输出路径（保持相对目录结构）"""
+    relative_path = os.path.relpath(os.path.dirname(bz2_path), root_dir)
+    base_name = os.path.basename(bz2_path)[:-4]  # 移除.bz2
+    if base_name.endswith('.json'):
+        base_name = base_name[:-5]
+    return os.path.join(output_dir, relative_path, base_name + '.jsonl')
+
+
+def prepare_shard(bz2_path: str, root_dir: str, output_dir: str, remove_source: bool = True) -> int:
+    """流式解压、清洗一个bz2分片，每个检索单元写成JSONL中的一行
+
+    逐行读取、逐条写出，内存占用与分片大小无关。先写入临时文件，
+    完成后再改名，中断时不会留下不完整的输出。
+    Returns:
+        int: 写出的文档数
+    """
+    output_path = output_path_for(bz2_path, root_dir, output_dir)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = output_path + '.tmp'
+
+    num_docs = 0
+    with bz2.open(bz2_path, 'rt', encoding='utf-8') as source, \
+            open(tmp_path, 'w', encoding='utf-8') as dest:
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                article = json.loads(line)
+            except json.JSONDecodeError as je:
+                print(f"Error parsing JSON line in {bz2_path}: {str(je)}")
+                continue
+            for document in article_documents(article):
+                dest.write(json.dumps(document, ensure_ascii=False))
+                dest.write('\n')
+                num_docs += 1
+    os.replace(tmp_path, output_path)
+
+    if remove_source:
+        # 删除原始文件
+        os.remove(bz2_path)
+    return num_docs
+
+
+def process_single_file(args: Tuple[str, str, str]) -> Tuple[str, int]:
     """处理单个bz2文件的worker函数"""
     bz2_path, root_dir, output_dir = args
     try:
-        # 生成输出文件路径
-        dirpath = os.path.dirname(bz2_path)
-        filename = os.path.basename(bz2_path)
-        relative_path = os.path.relpath(dirpath, root_dir)
-        target_dir = os.path.join(output_dir, relative_path)
-        
-        os.makedirs(target_dir, exist_ok=True)
-        
-        # 设置输出文件路径
-        base_name = filename[:-4]  # 移除.bz2
-        if not base_name.endswith('.json'):
-            base_name += '.json'
-        output_path = os.path.join(target_dir, base_name)
-        
-        # 处理文件
-        json_objects = []
-        with bz2.open(bz2_path, 'rt', encoding='utf-8') as source:
-            for line in source:
-                try:
-                    json_obj = json.loads(line.strip())
-                    json_objects.append(json_obj)
-                except json.JSONDecodeError as je:
-                    print(f"Error parsing JSON line in {bz2_path}: {str(je)}")
-                    continue
-        
-        # 写入文件
-        with open(output_path, 'w', encoding='utf-8') as dest:
-            json.dump(json_objects, dest, ensure_ascii=False, indent=2)
-        
-        # 删除原始文件
-        os.remove(bz2_path)
-        print(f"Processed: {bz2_path}")
-        
+        num_docs = prepare_shard(bz2_path, root_dir, output_dir)
+        return bz2_path, num_docs
     except Exception as e:
         print(f"Error processing {bz2_path}: {str(e)}")
+        return bz2_path, -1
 
 def decompress_and_remove(root_dir: str, output_dir: str, batch_size: int = 10) -> None:
     # 转换为绝对路径
@@ -79,13 +112,16 @@ def decompress_and_remove(root_dir: str, output_dir: str, batch_size: int = 10)
     # 准备参数
     process_args = [(f, root_dir, output_dir) for f in bz2_files]
     
-    # 批量处理文件
+    # 每个worker一次处理一个分片并流式写出，主进程只接收 (文件名, 文档数)
+    processed = 0
+    total_docs = 0
     with Pool(processes=num_processes) as pool:
-        for i in range(0, len(process_args), batch_size):
-            batch = process_args[i:i + batch_size]
-            print(f"\nProcessing batch {i//batch_size + 1} of {(total_files + batch_size - 1)//batch_size}")
-            pool.map(process_single_file, batch)
-            print(f"Completed batch {i//batch_size + 1}")
+        for bz2_path, num_docs in pool.imap_unordered(process_single_file, process_args):
+            processed += 1
+            if num_docs >= 0:
+                total_docs += num_docs
+                print(f"Processed ({processed}/{total_files}): {bz2_path}, {num_docs} documents")
+    print(f"Completed: {total_docs} documents written to {output_dir}")
 
 if __name__ == "__main__":
     root_directory = "./data/enwiki-20171001-pages-meta-current-withlinks-processed"
@@ -1,9 +1,10 @@
 import os
 import pickle
-import faiss
 from retriever.rank_bm25_retriever import RankBM25Retriever
-from retriever.faiss_retriever import FaissRetriever
 from retriever.bm25s_retriever import BM25SRetriever
+from retriever.hybrid_retriever import HybridRetriever
+from retriever.query_cache import CachedRetriever, load_query_cache_config, unwrap_retriever
+from retriever.analyzer import DEFAULT_ANALYZER
 
 class IndexLoader:
     def __init__(self, index_dir="/home/hhl/rag_test/rag_demo/indexes"):
@@ -12,19 +13,38 @@ class IndexLoader:
         self.bm25_retriever = None
         self.faiss_retriever = None
         self.bm25s_retriever = None
+        self.hybrid_retriever = None
         self.rank_bm25_retriever = RankBM25Retriever()
         
     def load_bm25_index(self):
-        """加载BM25索引"""
-        bm25_path = os.path.join(self.index_dir, "bm25.pkl")
+        """加载BM25索引（内存映射，毫秒级启动）"""
+        bm25_path = os.path.join(self.index_dir, "bm25")
+        if not os.path.exists(bm25_path):
+            # 兼容旧版本的pickle格式
+            bm25_path = os.path.join(self.index_dir, "bm25.pkl")
         if not os.path.exists(bm25_path):
             raise FileNotFoundError(f"BM25 index not found at {bm25_path}")
             
         print(f"Loading BM25 index from {bm25_path}")
         self.bm25_retriever = RankBM25Retriever.load(bm25_path)
     
-    def load_faiss_index(self):
-        """加载FAISS索引"""
+    def load_faiss_index(self, gpu=True):
+        """加载FAISS索引（IndexBuilder构建的 faiss/ 目录，文档按需读取）
+
+        faiss和编码模型只在这里（以及第一次查询时）导入和加载，只用BM25的进程不受影响。
+        Args:
+            gpu: 为False时索引留在CPU（多进程服务在fork之后由各工作进程调用 move_to_gpu）
+        """
+        from retriever.faiss_retriever import FaissRetriever
+
+        faiss_path = os.path.join(self.index_dir, "faiss")
+        if os.path.isdir(faiss_path):
+            print(f"Loading FAISS index from {faiss_path}")
+            self.faiss_retriever = FaissRetriever()
+            self.faiss_retriever.load(faiss_path, gpu)
+            return
+
+        # 兼容旧版本的 faiss.index + faiss_docs.pkl
         faiss_index_path = os.path.join(self.index_dir, "faiss.index")
         faiss_docs_path = os.path.join(self.index_dir, "faiss_docs.pkl")
         
@@ -34,6 +54,7 @@ class IndexLoader:
         print(f"Loading FAISS index from {self.index_dir}")
         
         # 加载索引
+        import faiss
         index = faiss.read_index(faiss_index_path)
         
         # 加载文档数据
@@ -42,8 +63,8 @@ class IndexLoader:
             
         # 创建检索器实例
         self.faiss_retriever = FaissRetriever(raw_docs=data["raw_docs"])  # 使用关键字参数
-        self.faiss_retriever.index = index
-        self.faiss_retriever.dimension = data["dimension"]
+        # 按配置设置查询参数（nprobe/efSearch），并在可用时移到GPU
+        self.faiss_retriever.set_index(index, gpu)
     
     def load_bm25s_index(self):
         """加载BM25S索引"""
@@ -52,11 +73,45 @@ class IndexLoader:
             raise FileNotFoundError(f"BM25S index not found at {bm25s_path}")
             
         print(f"Loading BM25S index from {bm25s_path}")
-        # 创建空的检索器实例
-        self.bm25s_retriever = BM25SRetriever()
         # 加载保存的索引
-        self.bm25s_retriever.load(bm25s_path)
+        self.bm25s_retriever = BM25SRetriever.load(bm25s_path)
     
+    def build_hybrid_retriever(self, fusion='rrf', weights=None, timeout=None):
+        """用已加载的检索器构建混合检索器（并行查询，按文档id融合）
+        Args:
+            fusion: 'rrf' 或 'weighted'
+            weights: {检索器名: 权重}
+            timeout: 每个检索器的时间预算（秒）
+        """
+        retrievers = {
+            name: unwrap_retriever(retriever) for name, retriever in (
+                ('bm25', self.bm25_retriever),
+                ('bm25s', self.bm25s_retriever),
+                ('faiss', self.faiss_retriever),
+            ) if retriever is not None
+        }
+        self.hybrid_retriever = HybridRetriever(retrievers, weights=weights, fusion=fusion, timeout=timeout)
+        return self.hybrid_retriever
+
+    def enable_query_cache(self, config=None, config_path=None):
+        """按配置（config.yaml中的query_cache段）用 CachedRetriever 包装已加载的检索器
+
+        FAISS检索器同时获得查询向量缓存（混合检索器中的FAISS也会用到）。
+        Args:
+            config: 覆盖配置文件的dict
+            config_path: 配置文件路径，默认为 config/config.yaml
+        Returns:
+            bool: 是否启用了查询缓存
+        """
+        config = load_query_cache_config(config_path, config)
+        if not config['enabled']:
+            return False
+        for name in ('bm25_retriever', 'bm25s_retriever', 'faiss_retriever', 'hybrid_retriever'):
+            retriever = getattr(self, name)
+            if retriever is not None and not isinstance(retriever, CachedRetriever):
+                setattr(self, name, CachedRetriever(retriever, config))
+        return True
+
     def load_all_indexes(self):
         """加载所有索引"""
         self.load_bm25_index()
@@ -79,7 +134,7 @@ def main():
         
         # BM25检索结果
         print("\nBM25 Results:")
-        tokenized_query = query.lower().split()  # 对查询进行分词
+        tokenized_query = DEFAULT_ANALYZER.tokenize(query)  # 对查询进行分词（与建索引时相同）
         bm25_results = loader.bm25_retriever.search(tokenized_query, top_k=top_k)
         for i, result in enumerate(bm25_results, 1):
             if isinstance(result, dict):
@@ -102,7 +157,7 @@ def main():
 
         # RankBM25检索结果
         print("\nRankBM25 Results:")
-        tokenized_query = query.lower().split()  # 对查询进行分词
+        tokenized_query = DEFAULT_ANALYZER.tokenize(query)  # 对查询进行分词（与建索引时相同）
         rank_bm25_results = loader.rank_bm25_retriever.search(tokenized_query, top_k=top_k)  # 改用search方法
         for i, result in enumerate(rank_bm25_results, 1):
             if isinstance(result, dict):
@@ -113,6 +168,14 @@ def main():
             print(f"\n{i}. {preview}")
         
             
+        # 混合检索结果（各检索器并行执行，RRF融合）
+        print("\nHybrid Results:")
+        hybrid_results = loader.build_hybrid_retriever().search(query, top_k=top_k)
+        for i, result in enumerate(hybrid_results, 1):
+            doc_text = result['document']
+            preview = doc_text[:200] + "..." if len(doc_text) > 200 else doc_text
+            print(f"\n{i}. [{', '.join(result['scores'])}] {preview}")
+
         # FAISS检索结果
         print("\nFAISS Results:")
         # faiss_results = loader.faiss_retriever.retrieve(query, top_k=top_k)
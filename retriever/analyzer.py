@@ -0,0 +1,118 @@
+from array import array
+import numpy as np
+from .storage import save_array, load_array
+from .vocabulary import save_vocabulary, MmapVocabulary
+
+
+class Analyzer:
+    """把文本切分为词：可选转小写，然后按空白切分
+
+    建索引和查询必须使用同一个Analyzer，否则查询词无法与索引中的词匹配。
+    """
+
+    def __init__(self, lowercase=True):
+        self.lowercase = lowercase
+
+    def tokenize(self, text):
+        """把一个文本切分为词列表"""
+        if self.lowercase:
+            text = text.lower()
+        return text.split()
+
+    def __call__(self, text):
+        return self.tokenize(text)
+
+    def encode(self, texts, vocab):
+        """把一批文本编码为词id，不为每个文档保留词列表
+        Args:
+            texts: 文本的可迭代对象
+            vocab: 词 -> 词id 的映射（dict或MmapVocabulary），新词按出现顺序追加
+        Returns:
+            (token_ids, lengths): 所有文本的词id拼接成的uint32数组，以及每个文本的词数
+        """
+        token_ids = array('I')
+        lengths = array('q')
+        for text in texts:
+            tokens = self.tokenize(text)
+            token_ids.extend(vocab.setdefault(token, len(vocab)) for token in tokens)
+            lengths.append(len(tokens))
+        return np.array(token_ids, dtype=np.uint32), np.array(lengths, dtype=np.int64)
+
+
+DEFAULT_ANALYZER = Analyzer()
+
+
+class TokenizedCorpus:
+    """以整数词id存储的已分词语料
+
+    所有文档的词id拼接为一个uint32数组，第i个文档为 token_ids[offsets[i]:offsets[i+1]]，
+    词id是 terms 中的下标。每个词只占4字节，没有“每个文档一个词列表”的Python对象开销，
+    构建倒排表时可以直接对整个数组做向量化的 unique/bincount。
+
+    目录结构（save/load）：
+        vocab_*.npy    词表（见 save_vocabulary）
+        token_ids.npy  词id
+        offsets.npy    每个文档在 token_ids 中的起止位置
+    """
+
+    def __init__(self, terms, token_ids, offsets):
+        """
+        Args:
+            terms: 按词id排列的词
+            token_ids: 所有文档的词id拼接成的数组
+            offsets: 长度为文档数+1的位置数组
+        """
+        self.terms = terms
+        self.token_ids = token_ids
+        self.offsets = offsets
+
+    @classmethod
+    def from_lengths(cls, terms, token_ids, lengths):
+        """由每个文档的词数构造"""
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(terms, np.asarray(token_ids, dtype=np.uint32), offsets)
+
+    @classmethod
+    def from_texts(cls, texts, analyzer=DEFAULT_ANALYZER):
+        """对文本分词并编码"""
+        vocab = {}
+        token_ids, lengths = analyzer.encode(texts, vocab)
+        return cls.from_lengths(list(vocab), token_ids, lengths)
+
+    @classmethod
+    def from_tokens(cls, tokenized_docs):
+        """由已分词的文档（词列表）构造"""
+        vocab = {}
+        lengths = np.fromiter((len(doc) for doc in tokenized_docs), dtype=np.int64, count=len(tokenized_docs))
+        token_ids = np.fromiter((vocab.setdefault(token, len(vocab)) for doc in tokenized_docs for token in doc),
+                                dtype=np.uint32, count=int(lengths.sum()))
+        return cls.from_lengths(list(vocab), token_ids, lengths)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        """第index个文档的词列表"""
+        ids = self.token_ids[self.offsets[index]:self.offsets[index + 1]]
+        return [self.terms[term_id] for term_id in ids]
+
+    @property
+    def lengths(self):
+        """每个文档的词数"""
+        return np.diff(self.offsets)
+
+    @property
+    def num_tokens(self):
+        return int(self.offsets[-1])
+
+    def save(self, directory):
+        save_vocabulary(self.terms, directory)
+        save_array(directory, "token_ids", self.token_ids)
+        save_array(directory, "offsets", self.offsets)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """加载语料，词id和位置数组默认以只读内存映射方式打开"""
+        return cls(list(MmapVocabulary(directory)), load_array(directory, "token_ids", mmap),
+                   load_array(directory, "offsets", mmap))
@@ -0,0 +1,291 @@
+import os
+import re
+import json
+import math
+import time
+import numpy as np
+import faiss
+import yaml
+from .faiss_index import (DEFAULT_CONFIG_PATH, METRIC_TYPES, create_index, train_index, add_vectors,
+                          prepare_vectors, rerank_exact, set_search_params)
+
+# 每个聚类至少需要这么多训练向量，否则faiss的k-means会告警且聚类质量差
+MIN_POINTS_PER_CENTROID = 39
+# PQ每个子空间有256个码字
+PQ_CENTROIDS = 256
+
+
+def reservoir_sample(items, size, seed=0):
+    """从可迭代对象中均匀抽样size项（蓄水池抽样），只保留被抽中的项"""
+    rng = np.random.default_rng(seed)
+    sample = []
+    for seen, item in enumerate(items):
+        if seen < size:
+            sample.append(item)
+        else:
+            j = rng.integers(0, seen + 1)
+            if j < size:
+                sample[j] = item
+    return sample
+
+
+def split_sample(num_rows, num_database, num_queries, seed=0):
+    """随机选出互不重叠的库向量行号和查询向量行号（均升序）"""
+    num_database = min(num_database, num_rows - num_queries)
+    if num_database <= 0:
+        raise ValueError(f"need more than {num_queries} vectors, got {num_rows}")
+    rows = np.random.default_rng(seed).choice(num_rows, num_database + num_queries, replace=False)
+    return np.sort(rows[:num_database]), np.sort(rows[num_database:])
+
+
+def exact_neighbors(database, queries, k, metric='l2'):
+    """用 IndexFlat 精确检索，返回每个查询的top-k向量下标（作为recall的基准）"""
+    index = faiss.IndexFlat(database.shape[1], METRIC_TYPES[metric])
+    index.add(database)
+    return index.search(queries, k)[1]
+
+
+def recall_at_k(found, truth, k):
+    """found 的前k个结果中出现在精确top-k中的比例（对所有查询取平均）"""
+    hits = sum(len(np.intersect1d(row[:k], expected[:k])) for row, expected in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def index_size_bytes(index):
+    """索引序列化后的字节数，近似其常驻内存"""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def _power_of_two_near(value):
+    return 2 ** max(0, round(math.log2(max(value, 1))))
+
+
+def default_factories(num_vectors, dimension):
+    """按向量数和维度给出候选索引类型
+
+    标量量化取 SQfp16、SQ8；IVF的nlist取 sqrt(n) 和 4*sqrt(n) 附近的2的幂
+    （每个聚类至少39个训练向量），并在较大的nlist上尝试SQ8；PQ的码长（子空间数）
+    取能整除维度的 d/8、d/16，d/8 时另加OPQ旋转；HNSW取 M=16、32。
+    """
+    factories = ["SQfp16", "SQ8"]
+    for scale in (1, 4):
+        nlist = _power_of_two_near(scale * math.sqrt(num_vectors))
+        if 2 <= nlist <= num_vectors // MIN_POINTS_PER_CENTROID and f"IVF{nlist},Flat" not in factories:
+            factories.append(f"IVF{nlist},Flat")
+    ivf = [factory.split(',')[0] for factory in factories if factory.startswith('IVF')]
+    if ivf:
+        factories.append(f"{ivf[-1]},SQ8")
+    if ivf and num_vectors >= PQ_CENTROIDS * MIN_POINTS_PER_CENTROID:
+        for divisor in (8, 16):
+            m = dimension // divisor
+            if m >= 4 and dimension % m == 0:
+                factories.append(f"{ivf[-1]},PQ{m}")
+                if divisor == 8:
+                    factories.append(f"OPQ{m},{ivf[-1]},PQ{m}")
+    factories += ["HNSW16", "HNSW32"]
+    return factories
+
+
+def default_search_grid(factory):
+    """索引类型对应的查询参数组合：IVF扫描nprobe，HNSW扫描efSearch，其他索引没有查询参数"""
+    match = re.search(r'IVF(\d+)', factory)
+    if match:
+        nlist = int(match.group(1))
+        return [{'nprobe': nprobe} for nprobe in (1, 2, 4, 8, 16, 32, 64, 128, 256) if nprobe <= nlist]
+    if factory.startswith('HNSW'):
+        return [{'efSearch': ef} for ef in (16, 32, 64, 128, 256)]
+    return [{}]
+
+
+def _latencies(search, queries):
+    latencies = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        search(queries[i:i + 1])
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1000
+
+
+def evaluate_index(factory, database, queries, truth, k, config, search_grid=None, latency_queries=200,
+                   rerank_factors=()):
+    """构建一个索引并扫描其查询参数
+    Args:
+        factory: index_factory字符串
+        database: 库向量（已经过 prepare_vectors）
+        queries: 查询向量（已经过 prepare_vectors）
+        truth: exact_neighbors 的结果
+        k: recall@k 的k
+        config: FAISS配置（metric、train_sample_size、add_batch_size等）
+        search_grid: 查询参数组合的列表，默认为 default_search_grid(factory)
+        latency_queries: 逐条查询测量延迟时使用的查询数
+        rerank_factors: 另外评估精确重排（取 k × factor 个候选，用原始向量重排）的候选倍数，
+                        Flat索引不评估重排
+    Returns:
+        list: 每个查询参数组合（及重排倍数，0为不重排）一个dict
+              （recall、延迟分位数、吞吐量、索引大小、构建时间）
+    """
+    config = dict(config, index_factory=factory, normalize=False)
+    start = time.perf_counter()
+    index = create_index(database.shape[1], config)
+    train_index(index, database, config)
+    add_vectors(index, database, config)
+    build_s = time.perf_counter() - start
+    size = index_size_bytes(index)
+
+    def searcher(factor):
+        if not factor:
+            return lambda batch: index.search(batch, k)[1]
+        return lambda batch: rerank_exact(batch, index.search(batch, k * factor)[1], database, k, config)[1]
+
+    factors = [0] + ([factor for factor in rerank_factors if factor] if factory != 'Flat' else [])
+    results = []
+    for params in (search_grid or default_search_grid(factory)):
+        set_search_params(index, dict(config, search=params))
+        for factor in factors:
+            search = searcher(factor)
+            start = time.perf_counter()
+            found = search(queries)
+            batch_qps = len(queries) / (time.perf_counter() - start)
+            latencies = _latencies(search, queries[:latency_queries])
+            results.append({
+                'index_factory': factory,
+                'search': dict(params),
+                'rerank': factor,
+                'recall': recall_at_k(found, truth, k),
+                'latency_p50_ms': float(np.percentile(latencies, 50)),
+                'latency_p99_ms': float(np.percentile(latencies, 99)),
+                'batch_qps': batch_qps,
+                'index_bytes': size,
+                'build_s': build_s,
+            })
+    return results
+
+
+def tune(vectors, query_vectors, k=10, config=None, factories=None, latency_queries=200, log=print,
+         rerank_factors=()):
+    """对一组向量评估候选索引
+    Args:
+        vectors: 库向量矩阵
+        query_vectors: 查询向量矩阵
+        k: recall@k 的k
+        config: FAISS配置（load_faiss_config的结果）
+        factories: 候选索引类型，默认为 default_factories；基准 Flat 总会包含在结果中
+        latency_queries: 逐条查询测量延迟时使用的查询数
+        log: 每个参数组合评估完后调用，参数为一行说明
+        rerank_factors: 另外评估精确重排的候选倍数（见 evaluate_index）
+    Returns:
+        list: 所有参数组合的结果（见 evaluate_index）
+    """
+    database = prepare_vectors(vectors, config)
+    queries = prepare_vectors(query_vectors, config)
+    truth = exact_neighbors(database, queries, k, config['metric'])
+    factories = list(factories or default_factories(len(database), database.shape[1]))
+    if 'Flat' not in factories:
+        factories.insert(0, 'Flat')
+
+    results = []
+    for factory in factories:
+        for result in evaluate_index(factory, database, queries, truth, k, config,
+                                     latency_queries=latency_queries, rerank_factors=rerank_factors):
+            results.append(result)
+            if log is not None:
+                log(format_result(result))
+    return results
+
+
+def _dominates(a, b):
+    better_or_equal = (a['recall'] >= b['recall'] and a['latency_p50_ms'] <= b['latency_p50_ms']
+                       and a['index_bytes'] <= b['index_bytes'])
+    strictly_better = (a['recall'] > b['recall'] or a['latency_p50_ms'] < b['latency_p50_ms']
+                       or a['index_bytes'] < b['index_bytes'])
+    return better_or_equal and strictly_better
+
+
+def pareto_frontier(results):
+    """recall越高、p50延迟和索引大小越小越好，返回不被其他结果支配的结果（按recall降序）"""
+    frontier = [a for a in results if not any(_dominates(b, a) for b in results)]
+    return sorted(frontier, key=lambda r: (-r['recall'], r['latency_p50_ms']))
+
+
+def choose_setting(results, target_recall):
+    """选择recall达到目标的结果中p50延迟最低的（其次索引最小）；都达不到时选recall最高的"""
+    frontier = pareto_frontier(results)
+    reached = [r for r in frontier if r['recall'] >= target_recall]
+    if reached:
+        return min(reached, key=lambda r: (r['latency_p50_ms'], r['index_bytes']))
+    return max(frontier, key=lambda r: (r['recall'], -r['latency_p50_ms']))
+
+
+def format_result(result):
+    params = ','.join(f"{name}={value}" for name, value in result['search'].items())
+    if result.get('rerank'):
+        params = ','.join(filter(None, [params, f"rerank={result['rerank']}"]))
+    return (f"{result['index_factory']:<22} {params or '-':<22} recall={result['recall']:.4f} "
+            f"p50={result['latency_p50_ms']:.3f}ms p99={result['latency_p99_ms']:.3f}ms "
+            f"qps={result['batch_qps']:.0f} size={result['index_bytes'] / 2 ** 20:.1f}MB "
+            f"build={result['build_s']:.2f}s")
+
+
+def _yaml_scalar(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def write_faiss_config(setting, path=None):
+    """把选定的 index_factory、查询参数和精确重排设置写回FAISS配置文件
+
+    只替换对应键所在行的值，保留文件中的其他内容和注释；文件中没有某个键时
+    按yaml重写整个faiss段（注释会丢失）。
+    Args:
+        setting: choose_setting 的结果（含 index_factory、search，以及可选的 rerank）
+        path: 配置文件路径，默认为 retriever/faiss_config.yaml
+    """
+    path = path or DEFAULT_CONFIG_PATH
+    updates = dict(setting['search'], index_factory=setting['index_factory'])
+    rerank = {}
+    if 'rerank' in setting:
+        rerank = {'enabled': bool(setting['rerank'])}
+        if setting['rerank']:
+            rerank['k_factor'] = setting['rerank']
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    missing = {}
+    for section, values in (('search', updates), ('rerank', rerank)):
+        for key, value in values.items():
+            # rerank段的键（enabled等）可能与其他段重名，只在 "rerank:" 之后查找
+            offset = 0
+            if section == 'rerank':
+                header = re.search(r'^\s*rerank:[ \t]*(#.*)?$', text, re.MULTILINE)
+                if header is None:
+                    missing.setdefault(section, {})[key] = value
+                    continue
+                offset = header.end()
+            pattern = re.compile(rf'^(\s*{re.escape(key)}:[ \t]*)([^#\n]*?)([ \t]*#.*)?$', re.MULTILINE)
+            replaced, count = pattern.subn(lambda m: m.group(1) + _yaml_scalar(value) + (m.group(3) or ''),
+                                           text[offset:], count=1)
+            if count == 0:
+                missing.setdefault(section, {})[key] = value
+            else:
+                text = text[:offset] + replaced
+
+    if missing:
+        data = yaml.safe_load(text) or {}
+        faiss_config = data.setdefault('faiss', {})
+        for section, values in missing.items():
+            for key, value in values.items():
+                if key == 'index_factory':
+                    faiss_config[key] = value
+                else:
+                    faiss_config.setdefault(section, {})[key] = value
+        text = yaml.safe_dump(data, allow_unicode=True, sort_keys=False)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
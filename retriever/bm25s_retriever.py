@@ -1,80 +1,113 @@
-from rank_bm25 import BM25Okapi  # 替换为更可靠的BM25实现
-import numpy as np
 import json
 import os
+import tempfile
+from .inverted_index import InvertedIndex
+from .analyzer import DEFAULT_ANALYZER
+from .document_store import DocumentStore, save_documents, open_documents
+from .storage import replace_directory
+from .parallel import parallel_map
+from .metrics import METRICS
 
 class BM25SRetriever:
     def __init__(self, documents=None, raw_documents=None):
         """初始化检索器"""
-        self.documents = documents if documents else []
-        self.raw_documents = raw_documents if raw_documents else []
+        # 文档文本只保存在原始文档（raw_documents）中
+        # 复制传入的列表，避免与调用方（或其他检索器）共用同一个list而被重复追加
+        self.raw_documents = raw_documents if isinstance(raw_documents, DocumentStore) else list(raw_documents or [])
         self.bm25 = None
+        # 索引内容变化时递增，查询缓存据此使旧结果失效
+        self.index_version = 0
         if documents:
-            self._build_index()
+            self._build_index(documents)
             
-    def _build_index(self):
-        """构建BM25索引"""
-        # 对文档进行分词
-        tokenized_corpus = [doc.split() for doc in self.documents]
-        self.bm25 = BM25Okapi(tokenized_corpus)
+    def _build_index(self, documents):
+        """构建BM25倒排索引（分词后直接编码为词id）"""
+        self.bm25 = InvertedIndex()
+        self.bm25.add_texts(documents, DEFAULT_ANALYZER)
         
+    @classmethod
+    def from_index(cls, index, raw_documents):
+        """用已构建好的倒排索引和原始文档创建检索器（如IndexBuilder合并分片后）"""
+        instance = cls(raw_documents=raw_documents)
+        instance.bm25 = index
+        return instance
+
     def add_documents(self, new_documents, new_raw_documents):
-        """添加新文档到索引"""
-        if not self.documents:
-            self.documents = new_documents
-            self.raw_documents = new_raw_documents
+        """添加新文档到索引（增量更新，不重建已有倒排表）"""
+        self.raw_documents.extend(new_raw_documents)
+        if self.bm25 is None:
+            self._build_index(new_documents)
         else:
-            self.documents.extend(new_documents)
-            self.raw_documents.extend(new_raw_documents)
-        self._build_index()  # 重新构建索引
+            self.bm25.add_texts(new_documents, DEFAULT_ANALYZER)
+        self.index_version += 1
         
-    def search(self, query, top_k=10):
+    def search(self, query, top_k=10, prune=True):
         """搜索最相关的文档"""
         if not self.bm25:
             return []
             
         # 对查询进行分词
-        tokenized_query = query.lower().split()
+        with METRICS.timer('query_stage_seconds', retriever='bm25s', stage='tokenize'):
+            tokenized_query = DEFAULT_ANALYZER.tokenize(query)
         
-        # 获取文档得分
-        doc_scores = self.bm25.get_scores(tokenized_query)
-        
-        # 获取top_k个最相关文档的索引
-        top_indices = np.argsort(doc_scores)[-top_k:][::-1]
+        # 只对包含查询词的文档打分，并取top_k
+        with METRICS.timer('query_stage_seconds', retriever='bm25s', stage='index_search'):
+            top_indices, top_scores = self.bm25.top_k(tokenized_query, top_k, prune=prune)
+
+        # 只读取top_k命中的文档
+        with METRICS.timer('query_stage_seconds', retriever='bm25s', stage='doc_fetch'):
+            raw_documents = [self.raw_documents[idx] for idx in top_indices]
         
         # 构建结果
-        results = []
-        for idx in top_indices:
-            results.append({
-                'score': float(doc_scores[idx]),  # 转换为Python float
-                'document': self.documents[idx],
-                'metadata': self.raw_documents[idx]
-            })
+        with METRICS.timer('query_stage_seconds', retriever='bm25s', stage='format'):
+            results = [{
+                'doc_id': int(idx),
+                'score': float(score),  # 转换为Python float
+                'document': raw_document.get('text', ''),
+                'metadata': raw_document
+            } for idx, score, raw_document in zip(top_indices, top_scores, raw_documents)]
+        METRICS.inc('queries_total', retriever='bm25s')
             
         return results
         
+    def search_batch(self, queries, top_k=10, num_workers=None, prune=True):
+        """批量搜索，多个查询在线程池中并行执行，结果顺序与输入一致"""
+        return parallel_map(lambda query: self.search(query, top_k, prune=prune),
+                            queries, num_workers)
+
     def save(self, path):
-        """保存索引到文件"""
-        os.makedirs(path, exist_ok=True)
-        
-        # 保存文档数据
-        save_data = {
-            'documents': self.documents,
-            'raw_documents': self.raw_documents
-        }
-        
-        save_path = os.path.join(path, "index_data.json")
-        with open(save_path, 'w', encoding='utf-8') as f:
-            json.dump(save_data, f, ensure_ascii=False)
-            
+        """保存索引到目录
+        倒排索引为可内存映射的数组，原始文档压缩保存在 raw_documents/ 下
+        （是共享的文档存储时只保存链接）。先写入临时目录再整体替换，
+        目录中已有的倒排表段以硬链接复用，只写入新段。
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=".bm25s-", dir=parent)
+        if self.bm25 is not None:
+            self.bm25.save(tmp_path, previous=path)
+        save_documents(self.raw_documents, os.path.join(tmp_path, "raw_documents"),
+                       os.path.join(path, "raw_documents"))
+        replace_directory(tmp_path, path)
+
     @classmethod
     def load(cls, path):
-        """从文件加载索引"""
-        save_path = os.path.join(path, "index_data.json")
-        
-        if not os.path.exists(save_path):
+        """从目录加载索引（内存映射，文档按需读取）；兼容旧的index_data.json"""
+        legacy_path = os.path.join(path, "index_data.json")
+        if os.path.exists(legacy_path):
+            return cls._load_json(legacy_path)
+        if not os.path.exists(os.path.join(path, "raw_documents")):
             return cls()
-            
+
+        instance = cls()
+        if InvertedIndex.exists(path):
+            instance.bm25 = InvertedIndex.load(path)
+        instance.raw_documents = open_documents(os.path.join(path, "raw_documents"))
+        return instance
+
+    @classmethod
+    def _load_json(cls, save_path):
+        """加载旧版本保存的index_data.json"""
         with open(save_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
             
@@ -87,12 +120,12 @@ class BM25SRetriever:
 
     def get_document_count(self):
         """获取索引中的文档数量"""
-        return len(self.documents)
+        return len(self.raw_documents)
 
     def get_statistics(self):
         """获取索引统计信息"""
         return {
-            'document_count': len(self.documents),
+            'document_count': len(self.raw_documents),
             'has_index': self.bm25 is not None,
-            'average_document_length': np.mean([len(doc.split()) for doc in self.documents]) if self.documents else 0
+            'average_document_length': self.bm25.avgdl if self.bm25 is not None else 0
         }
@@ -0,0 +1,5 @@
+import os
+
+# 项目配置文件 config/config.yaml（query_cache、service、metrics等段）
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   "config", "config.yaml")
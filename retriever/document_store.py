@@ -0,0 +1,286 @@
+import os
+import json
+import zlib
+import shutil
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+from .storage import save_array, load_array, write_json, read_json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DOCUMENT_STORE_FORMAT_VERSION = 2
+DEFAULT_BLOCK_SIZE = 16       # 每个压缩块包含的文档数（越大压缩率越高，随机读取越慢）
+DEFAULT_CACHE_BLOCKS = 256    # 解压后缓存的块数
+
+# 已打开的文档目录，同一目录只映射一次，被所有检索器共享
+_open_stores = weakref.WeakValueDictionary()
+_open_lock = threading.Lock()
+
+
+def default_codec():
+    """安装了zstandard时使用zstd，否则使用标准库zlib"""
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("This document store is zstd-compressed; install 'zstandard' to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class _StoredDocuments:
+    """已保存到磁盘的文档（内存映射），同一目录的所有 DocumentStore 共享一个实例"""
+
+    def __init__(self, directory):
+        self._blocks = OrderedDict()    # 块号 -> 解压后的JSON行列表
+        self._lock = threading.Lock()
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            meta = read_json(meta_path)
+            if meta.get('format_version') != DOCUMENT_STORE_FORMAT_VERSION:
+                raise ValueError(f"Unsupported document store version: {meta.get('format_version')}")
+            self.codec = meta['codec']
+            self.block_size = meta['block_size']
+            self.num_docs = meta['num_docs']
+            self.offsets = load_array(directory, "block_offsets")
+            data_path = os.path.join(directory, "blocks.bin")
+        else:
+            # 旧格式：每个文档一行的未压缩JSONL
+            self.codec = None
+            self.block_size = None
+            self.offsets = load_array(directory, "doc_offsets")
+            self.num_docs = len(self.offsets) - 1
+            data_path = os.path.join(directory, "documents.jsonl")
+        with open(data_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self.data = np.memmap(f, dtype=np.uint8, mode='r') if size else np.zeros(0, dtype=np.uint8)
+
+    def _block(self, block_id):
+        """解压一个块，返回其中文档的JSON行"""
+        with self._lock:
+            lines = self._blocks.get(block_id)
+            if lines is not None:
+                self._blocks.move_to_end(block_id)
+                return lines
+        start, end = self.offsets[block_id], self.offsets[block_id + 1]
+        lines = _decompress(self.data[start:end].tobytes(), self.codec).split(b'\n')
+        with self._lock:
+            self._blocks[block_id] = lines
+            while len(self._blocks) > DEFAULT_CACHE_BLOCKS:
+                self._blocks.popitem(last=False)
+        return lines
+
+    def get(self, doc_id):
+        if self.block_size is None:
+            start, end = self.offsets[doc_id], self.offsets[doc_id + 1]
+            return json.loads(self.data[start:end].tobytes())
+        block_id, row = divmod(doc_id, self.block_size)
+        return json.loads(self._block(block_id)[row])
+
+
+class DocumentStore:
+    """按整数文档id寻址的压缩文档存储
+
+    磁盘格式（format_version 2）：
+        meta.json           格式版本、压缩算法、每块文档数、文档数
+        blocks.bin          依次存放的压缩块，每块为 block_size 个文档的JSON行
+        block_offsets.npy   每块在 blocks.bin 中的起始偏移（多一个结尾偏移）
+
+    打开时只内存映射偏移数组和 blocks.bin，文档在被访问时才解压和解析，
+    最近解压的块保存在一个小的LRU缓存中。同一目录被多次打开（如多个检索器
+    链接到同一份文档）时共享同一份映射和缓存。旧格式（documents.jsonl +
+    doc_offsets.npy）仍可读取。新追加的文档先保存在各自实例的内存中，随 save() 一起写出。
+    """
+
+    def __init__(self, documents=None):
+        self.directory = None
+        self._stored = None
+        self._pending = list(documents) if documents else []
+
+    @classmethod
+    def open(cls, directory):
+        """以懒加载方式打开已保存的文档存储"""
+        # 目录被重新保存（替换）后文件的inode会变化，不会共享旧的映射
+        meta_path = os.path.join(directory, "meta.json")
+        stat = os.stat(meta_path if os.path.exists(meta_path) else os.path.join(directory, "doc_offsets.npy"))
+        key = (os.path.realpath(directory), stat.st_ino, stat.st_mtime_ns)
+        with _open_lock:
+            stored = _open_stores.get(key)
+            if stored is None:
+                stored = _StoredDocuments(directory)
+                _open_stores[key] = stored
+
+        store = cls()
+        store.directory = os.path.abspath(directory)
+        store._stored = stored
+        return store
+
+    @property
+    def _num_stored(self):
+        return self._stored.num_docs if self._stored is not None else 0
+
+    def __len__(self):
+        return self._num_stored + len(self._pending)
+
+    def __getitem__(self, doc_id):
+        doc_id = int(doc_id)
+        if doc_id < 0:
+            doc_id += len(self)
+        if doc_id >= self._num_stored:
+            return self._pending[doc_id - self._num_stored]
+        return self._stored.get(doc_id)
+
+    def __iter__(self):
+        for doc_id in range(len(self)):
+            yield self[doc_id]
+
+    def append(self, document):
+        self._pending.append(document)
+
+    def extend(self, documents):
+        self._pending.extend(documents)
+
+    def save(self, directory, codec=None, block_size=DEFAULT_BLOCK_SIZE):
+        """流式压缩写出所有文档（目标目录不能是当前打开的目录）
+        Args:
+            directory: 目标目录
+            codec: 'zstd' 或 'zlib'，默认安装了zstandard时使用zstd
+            block_size: 每个压缩块包含的文档数
+        """
+        codec = codec or default_codec()
+        os.makedirs(directory, exist_ok=True)
+        num_blocks = (len(self) + block_size - 1) // block_size
+        offsets = np.zeros(num_blocks + 1, dtype=np.int64)
+        with open(os.path.join(directory, "blocks.bin"), 'wb') as f:
+            position = 0
+            for block_id in range(num_blocks):
+                start = block_id * block_size
+                lines = [json.dumps(self[doc_id], ensure_ascii=False).encode('utf-8')
+                         for doc_id in range(start, min(start + block_size, len(self)))]
+                block = _compress(b'\n'.join(lines), codec)
+                f.write(block)
+                position += len(block)
+                offsets[block_id + 1] = position
+        save_array(directory, "block_offsets", offsets)
+        write_json(os.path.join(directory, "meta.json"), {
+            'format_version': DOCUMENT_STORE_FORMAT_VERSION,
+            'codec': codec,
+            'block_size': block_size,
+            'num_docs': len(self),
+        })
+
+
+def save_documents(documents, directory, target=None):
+    """保存检索器的原始文档
+
+    documents 是已保存在 target 之外的共享文档存储（且没有未保存的追加）时，
+    只写入指向它的 link.json，多个检索器共用一份文档；否则写出完整的文档存储。
+    Args:
+        documents: 文档列表或 DocumentStore
+        directory: 写入的目录（可以是临时目录）
+        target: directory 最终被替换到的路径，用于计算相对链接，默认为 directory
+    """
+    target = os.path.abspath(target or directory)
+    target = os.path.join(os.path.realpath(os.path.dirname(target)), os.path.basename(target))
+    if isinstance(documents, DocumentStore) and documents.directory and not documents._pending:
+        source = os.path.realpath(documents.directory)
+        if not (source + os.sep).startswith(target + os.sep):
+            os.makedirs(directory, exist_ok=True)
+            write_json(os.path.join(directory, "link.json"), {'path': os.path.relpath(source, target)})
+            return
+    if not isinstance(documents, DocumentStore):
+        documents = DocumentStore(documents)
+    documents.save(directory)
+
+
+def open_documents(directory):
+    """打开 save_documents 写入的文档（跟随 link.json 打开共享的文档存储）"""
+    link_path = os.path.join(directory, "link.json")
+    if os.path.exists(link_path):
+        directory = os.path.normpath(os.path.join(directory, read_json(link_path)['path']))
+    return DocumentStore.open(directory)
+
+
+class DocumentWriter:
+    """向目录流式追加未压缩的文档（旧格式），完成后可用 DocumentStore.open() 打开
+
+    构建过程中偏移量写在 doc_offsets.i64（原始int64数组，可追加），
+    finish() 时另存为 doc_offsets.npy，之后仍可继续追加。与 VectorStore 一样，
+    调用方在检查点中记录 len(writer)，恢复时用 truncate() 丢弃未提交的文档。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._documents_path = os.path.join(directory, "documents.jsonl")
+        self._offsets_path = os.path.join(directory, "doc_offsets.i64")
+        if not os.path.exists(self._offsets_path):
+            np.zeros(1, dtype=np.int64).tofile(self._offsets_path)
+            open(self._documents_path, 'wb').close()
+        self._count = os.path.getsize(self._offsets_path) // 8 - 1
+        self._position = int(np.fromfile(self._offsets_path, dtype=np.int64, offset=8 * self._count)[0])
+
+    def __len__(self):
+        return self._count
+
+    def extend(self, documents):
+        """追加一批文档"""
+        offsets = []
+        with open(self._documents_path, 'ab') as f:
+            f.truncate(self._position)
+            for document in documents:
+                line = json.dumps(document, ensure_ascii=False).encode('utf-8') + b'\n'
+                f.write(line)
+                self._position += len(line)
+                offsets.append(self._position)
+        with open(self._offsets_path, 'ab') as f:
+            f.truncate(8 * (self._count + 1))
+            np.asarray(offsets, dtype=np.int64).tofile(f)
+        self._count += len(offsets)
+
+    def append_directory(self, directory):
+        """追加另一个 DocumentWriter 目录中的全部文档（直接复制字节，不解析JSON）"""
+        offsets = np.fromfile(os.path.join(directory, "doc_offsets.i64"), dtype=np.int64)
+        with open(self._documents_path, 'ab') as f, \
+                open(os.path.join(directory, "documents.jsonl"), 'rb') as source:
+            f.truncate(self._position)
+            shutil.copyfileobj(source, f, 1 << 20)
+        with open(self._offsets_path, 'ab') as f:
+            f.truncate(8 * (self._count + 1))
+            (offsets[1:] + self._position).tofile(f)
+        self._position += int(offsets[-1])
+        self._count += len(offsets) - 1
+
+    def flush(self):
+        """把已追加的文档写到磁盘（在记录检查点之前调用）"""
+        for path in (self._documents_path, self._offsets_path):
+            with open(path, 'rb+') as f:
+                os.fsync(f.fileno())
+
+    def truncate(self, count):
+        """丢弃第count个之后的文档"""
+        if count >= self._count:
+            return
+        self._position = int(np.fromfile(self._offsets_path, dtype=np.int64, offset=8 * count)[0])
+        with open(self._offsets_path, 'rb+') as f:
+            f.truncate(8 * (count + 1))
+        with open(self._documents_path, 'rb+') as f:
+            f.truncate(self._position)
+        self._count = count
+
+    def finish(self):
+        """写出 doc_offsets.npy，之后目录可由 DocumentStore.open() 打开"""
+        save_array(self.directory, "doc_offsets", np.fromfile(self._offsets_path, dtype=np.int64))
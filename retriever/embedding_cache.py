@@ -0,0 +1,216 @@
+import os
+import hashlib
+import threading
+import numpy as np
+from .storage import write_json_atomic, read_json
+
+CACHE_FORMAT_VERSION = 2
+
+
+def embedding_key(text, model_name, max_length, pooling):
+    """缓存键：(模型名, max_length, 池化方式, 文本) 的哈希，任一项变化都不会命中旧向量"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (model_name, str(max_length), pooling, text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """基于内容哈希的持久化向量缓存
+
+    目录结构：
+        meta.json      格式版本、向量维度
+        vectors.f32    float32向量矩阵，以 np.memmap 读写，按槽位寻址
+        index.npz      容量，已用槽位的键（16字节哈希，[n, 16]的uint8矩阵）、
+                       键对应的槽位、最近一次访问的逻辑时间（用于LRU淘汰）
+
+    条目数达到 max_entries 时淘汰最久未使用的 evict_fraction 比例的条目。
+    index.npz 先写临时文件再替换；被淘汰的槽位在淘汰结果写入 index.npz 之后才复用，
+    中断时磁盘上的索引不会指向已被覆盖的向量。
+    """
+
+    def __init__(self, path, dimension, max_entries=1000000, evict_fraction=0.1):
+        """打开或创建缓存
+        Args:
+            path: 缓存目录
+            dimension: 向量维度
+            max_entries: 最多缓存的向量数
+            evict_fraction: 缓存满时一次淘汰的比例
+        """
+        self.path = path
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.evict_fraction = evict_fraction
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._slots = {}        # key -> 槽位
+        self._ticks = {}        # key -> 最近访问时间
+        self._free = []         # 可写入的槽位
+        self._released = []     # 已淘汰、淘汰结果尚未写入磁盘的槽位，flush后才可复用
+        self._clock = 0
+        self._capacity = 0
+        self._vectors = None
+        self._load()
+
+    def _load(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+        meta = read_json(meta_path)
+        if meta.get('format_version') != CACHE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding cache version: {meta.get('format_version')}")
+        if meta['dimension'] != self.dimension:
+            raise ValueError(f"Embedding cache at {self.path} has dimension {meta['dimension']}, "
+                             f"expected {self.dimension}")
+
+        with np.load(os.path.join(self.path, "index.npz")) as index:
+            keys = [row.tobytes() for row in index['keys']]
+            slots, ticks = index['slots'], index['ticks']
+            self._capacity = int(index['capacity'])
+        self._slots = {key: int(slot) for key, slot in zip(keys, slots)}
+        self._ticks = {key: int(tick) for key, tick in zip(keys, ticks)}
+        self._clock = int(ticks.max()) + 1 if len(ticks) else 0
+        used = set(self._slots.values())
+        self._free = [slot for slot in reversed(range(self._capacity)) if slot not in used]
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+',
+                                  shape=(self._capacity, self.dimension))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _grow(self, needed):
+        """按倍增扩大向量文件（文件为稀疏文件，未写入的部分不占磁盘）"""
+        capacity = min(self.max_entries, max(needed, 2 * self._capacity, 1024))
+        if capacity <= self._capacity:
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self._vectors_path, 'ab') as f:
+            f.truncate(capacity * self.dimension * 4)
+        # 空闲槽位从列表末尾取出，倒序放入使新槽位按顺序使用
+        self._free[:0] = reversed(range(self._capacity, capacity))
+        self._capacity = capacity
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+',
+                                  shape=(self._capacity, self.dimension))
+
+    def _evict(self, needed):
+        """淘汰最久未使用的条目，至少腾出needed个槽位（_flush之后才可复用）"""
+        count = min(len(self._slots), max(needed, int(self.max_entries * self.evict_fraction)))
+        if count <= 0:
+            return
+        keys = list(self._ticks)
+        ticks = np.fromiter(self._ticks.values(), dtype=np.int64, count=len(keys))
+        for i in np.argpartition(ticks, count - 1)[:count]:
+            key = keys[i]
+            self._released.append(self._slots.pop(key))
+            del self._ticks[key]
+        self.evictions += count
+
+    def get_many(self, keys):
+        """批量查找
+        Returns:
+            (vectors, missing): vectors为[len(keys), dimension]的矩阵，未命中的行为0；
+                                missing为未命中的位置列表
+        """
+        with self._lock:
+            vectors = np.zeros((len(keys), self.dimension), dtype=np.float32)
+            found, slots, missing = [], [], []
+            for i, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is None:
+                    missing.append(i)
+                    continue
+                found.append(i)
+                slots.append(slot)
+                self._ticks[key] = self._clock
+            self._clock += 1
+            if found:
+                vectors[found] = self._vectors[slots]
+            self.hits += len(found)
+            self.misses += len(missing)
+            return vectors, missing
+
+    def put_many(self, keys, vectors):
+        """批量写入（超过max_entries时先淘汰旧条目）"""
+        with self._lock:
+            new_keys = list(dict.fromkeys(key for key in keys if key not in self._slots))
+            needed = len(new_keys) - len(self._free)
+            if needed > 0:
+                self._grow(self._capacity + needed)
+                needed = len(new_keys) - len(self._free)
+            if needed > 0:
+                self._evict(needed)
+                # 先持久化淘汰结果，再覆盖被淘汰的槽位
+                self._flush()
+
+            # 只写入能放下的部分（单批超过max_entries时丢弃多余的）
+            rows = {key: i for i, key in enumerate(keys)}
+            for key in new_keys[:len(self._free)]:
+                slot = self._free.pop()
+                self._vectors[slot] = vectors[rows[key]]
+                self._slots[key] = slot
+                self._ticks[key] = self._clock
+            self._clock += 1
+
+    def encode(self, texts, encode_fn, model_name, max_length, pooling):
+        """读取缓存，只对未命中的文本调用encode_fn，结果顺序与texts一致
+        Args:
+            texts: 文本列表
+            encode_fn: 编码函数，输入文本列表，返回[n, dimension]的向量
+            model_name, max_length, pooling: 参与缓存键计算的编码配置
+        """
+        keys = [embedding_key(text, model_name, max_length, pooling) for text in texts]
+        vectors, missing = self.get_many(keys)
+        if missing:
+            encoded = np.asarray(encode_fn([texts[i] for i in missing]), dtype=np.float32)
+            vectors[missing] = encoded
+            self.put_many([keys[i] for i in missing], encoded)
+        return vectors
+
+    def flush(self):
+        """把向量和键索引写回磁盘"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # 向量先落盘，再原子地替换索引：索引引用的槽位都已写入
+        if self._vectors is not None:
+            self._vectors.flush()
+        keys = list(self._slots)
+        index_path = os.path.join(self.path, "index.npz")
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     capacity=np.int64(self._capacity),
+                     keys=np.frombuffer(b''.join(keys), dtype=np.uint8).reshape(len(keys), 16),
+                     slots=np.fromiter((self._slots[key] for key in keys), dtype=np.int64, count=len(keys)),
+                     ticks=np.fromiter((self._ticks[key] for key in keys), dtype=np.int64, count=len(keys)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_path)
+        write_json_atomic(os.path.join(self.path, "meta.json"), {
+            'format_version': CACHE_FORMAT_VERSION,
+            'dimension': self.dimension,
+        })
+        self._free.extend(self._released)
+        self._released = []
+
+    def stats(self):
+        """命中率统计"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._slots),
+            'capacity': self._capacity,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,171 @@
+import os
+import re
+import warnings
+import numpy as np
+
+# torch        PyTorch fp32（默认）
+# torch_int8   PyTorch动态int8量化（Linear层的权重量化为int8，激活在运行时量化）
+# onnx         导出为ONNX后用ONNX Runtime执行（fp32）
+# onnx_int8    ONNX Runtime动态int8量化
+ENCODER_BACKENDS = ('torch', 'torch_int8', 'onnx', 'onnx_int8')
+
+# onnx_dir 未配置时导出的ONNX模型保存在这里，按模型名分目录
+DEFAULT_ONNX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "rag_demo", "onnx")
+
+
+def mean_pool(hidden_states, attention_mask):
+    """按attention mask做平均池化，padding不参与，编码结果与批内其他文本无关"""
+    mask = attention_mask.unsqueeze(-1).to(hidden_states.dtype)
+    summed = (hidden_states * mask).sum(dim=1)
+    return summed / mask.sum(dim=1).clamp(min=1e-9)
+
+
+def mean_pool_numpy(hidden_states, attention_mask):
+    """mean_pool 的numpy版本"""
+    mask = attention_mask[..., None].astype(hidden_states.dtype)
+    summed = (hidden_states * mask).sum(axis=1)
+    return summed / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+class TorchBackend:
+    """PyTorch前向：输入为int64的numpy矩阵，输出平均池化后的float32向量"""
+    name = 'torch'
+
+    def __init__(self, model, num_threads=None):
+        """
+        Args:
+            model: HuggingFace模型（输出last_hidden_state）
+            num_threads: torch的intra-op线程数（整个进程共享），为None时不修改
+        """
+        import torch
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = model.eval()
+        self.hidden_size = model.config.hidden_size
+
+    def __call__(self, inputs):
+        import torch
+
+        tensors = {name: torch.from_numpy(values) for name, values in inputs.items()}
+        with torch.inference_mode():
+            outputs = self.model(**tensors)
+            return mean_pool(outputs.last_hidden_state, tensors['attention_mask']).float().cpu().numpy()
+
+
+class TorchInt8Backend(TorchBackend):
+    """PyTorch动态int8量化：只量化Linear层，无需校准数据，CPU上通常快1.5~2倍"""
+    name = 'torch_int8'
+
+    def __init__(self, model, num_threads=None):
+        import torch
+
+        with warnings.catch_warnings():
+            # torch.ao.quantization 已标记为弃用（迁移到torchao），动态量化仍可用
+            warnings.simplefilter('ignore')
+            model = torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+        super().__init__(model, num_threads)
+
+
+class OnnxBackend:
+    """ONNX Runtime前向（CPUExecutionProvider），输出last_hidden_state后用numpy池化"""
+    name = 'onnx'
+
+    def __init__(self, model_path, hidden_size, num_threads=None):
+        """
+        Args:
+            model_path: export_onnx（或quantize_onnx）生成的 .onnx 文件
+            hidden_size: 模型的隐藏层维度
+            num_threads: 会话的intra-op线程数，为None时由ONNX Runtime决定
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.model_path = model_path
+        self.hidden_size = hidden_size
+
+    def __call__(self, inputs):
+        feeds = {name: values for name, values in inputs.items() if name in self.input_names}
+        hidden_states = self.session.run(None, feeds)[0]
+        return mean_pool_numpy(hidden_states, inputs['attention_mask']).astype(np.float32)
+
+
+def onnx_model_dir(model_name, onnx_dir=None):
+    """模型导出目录：<onnx_dir>/<模型名中的路径分隔符替换为__>"""
+    return os.path.join(onnx_dir or DEFAULT_ONNX_DIR, re.sub(r'[^\w.-]+', '__', model_name.strip('/')))
+
+
+def export_onnx(model, tokenizer, path, opset=17):
+    """把HuggingFace模型导出为ONNX（批大小和序列长度为动态维度），先写临时文件再替换"""
+    import torch
+
+    sample = tokenizer(["export sample text"], return_tensors='pt')
+    names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in names + ['last_hidden_state']}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with torch.inference_mode():
+        torch.onnx.export(model.eval(), ({name: sample[name] for name in names},), tmp_path,
+                          input_names=names, output_names=['last_hidden_state'],
+                          dynamic_axes=dynamic_axes, opset_version=opset, dynamo=False)
+    os.replace(tmp_path, path)
+
+
+def quantize_onnx(path, quantized_path):
+    """ONNX Runtime动态int8量化（权重为int8，激活在运行时量化）"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    tmp_path = quantized_path + ".tmp"
+    quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, quantized_path)
+
+
+def load_encoder_backend(model_name, config):
+    """按配置加载分词器和编码后端
+    Args:
+        model_name: HuggingFace模型名或本地目录
+        config: FAISS配置中的encoding段（backend、num_threads、onnx_dir）
+    Returns:
+        tuple: (tokenizer, backend)；ONNX后端第一次使用时导出（及量化）模型，之后直接加载导出的文件
+    """
+    from transformers import AutoTokenizer, AutoModel, AutoConfig
+
+    backend = config['backend']
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unsupported encoder backend: {backend} (expected one of {list(ENCODER_BACKENDS)})")
+    num_threads = config['num_threads']
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == 'torch':
+        return tokenizer, TorchBackend(AutoModel.from_pretrained(model_name), num_threads)
+    if backend == 'torch_int8':
+        return tokenizer, TorchInt8Backend(AutoModel.from_pretrained(model_name), num_threads)
+
+    directory = onnx_model_dir(model_name, config['onnx_dir'])
+    path = os.path.join(directory, "model.onnx")
+    if not os.path.exists(path):
+        print(f"Exporting {model_name} to {path}...")
+        export_onnx(AutoModel.from_pretrained(model_name), tokenizer, path)
+    if backend == 'onnx_int8':
+        quantized_path = os.path.join(directory, "model.int8.onnx")
+        if not os.path.exists(quantized_path):
+            print(f"Quantizing {path} to int8...")
+            quantize_onnx(path, quantized_path)
+        path = quantized_path
+    return tokenizer, OnnxBackend(path, AutoConfig.from_pretrained(model_name).hidden_size, num_threads)
+
+
+def cosine_parity(reference, vectors):
+    """逐行比较两组向量（如fp32基准与量化后端的编码结果）的余弦相似度
+    Returns:
+        dict: min_cosine / mean_cosine
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    vectors = np.asarray(vectors, dtype=np.float64)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors, axis=1)
+    cosine = (reference * vectors).sum(axis=1) / np.maximum(norms, 1e-12)
+    return {'min_cosine': float(cosine.min()), 'mean_cosine': float(cosine.mean())}
@@ -0,0 +1,89 @@
+import numpy as np
+from .metrics import METRICS
+from .encoder_backends import TorchBackend
+
+
+def plan_batches(lengths, max_tokens=16384, max_batch_size=256):
+    """按长度分桶并在token预算下组批
+
+    文本按token数从长到短排序，相邻（长度相近）的文本放入同一批，
+    每批满足 批大小 × 批内最大长度 <= max_tokens，padding浪费很少。
+    最长的批最先编码，显存/内存不足会在一开始暴露。
+    Args:
+        lengths: 每个文本的token数
+        max_tokens: 每批padding后的token总数上限（单个文本超过上限时单独成批）
+        max_batch_size: 每批最多的文本数
+    Returns:
+        list: 每批文本在输入中的下标（np.ndarray）
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(-lengths, kind='stable')
+    batches = []
+    start = 0
+    while start < len(order):
+        # 批内第一个文本最长，决定整批padding后的长度
+        longest = max(int(lengths[order[start]]), 1)
+        size = max(1, min(max_batch_size, max_tokens // longest))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+class BucketedEncoder:
+    """长度分桶的动态批编码器
+
+    先对全部文本做一次不padding的分词得到长度，按 plan_batches 组批，
+    每批只padding到批内最长文本，由编码后端（见 encoder_backends）前向并池化，
+    按原始顺序写回结果。
+    """
+
+    def __init__(self, tokenizer, model, max_length=512, max_tokens=16384, max_batch_size=256):
+        """
+        Args:
+            tokenizer: HuggingFace分词器
+            model: 编码后端（TorchBackend、OnnxBackend等），或HuggingFace模型（按TorchBackend执行）
+            max_length: 单个文本的最大token数，超出部分截断
+            max_tokens: 每批padding后的token总数上限
+            max_batch_size: 每批最多的文本数
+        """
+        self.tokenizer = tokenizer
+        self.backend = model if hasattr(model, 'hidden_size') else TorchBackend(model)
+        self.hidden_size = self.backend.hidden_size
+        self.max_length = max_length
+        self.max_tokens = max_tokens
+        self.max_batch_size = max_batch_size
+
+    def _pad(self, features, rows):
+        """把分好词的若干文本padding到批内最长，返回int64的模型输入矩阵"""
+        width = max(len(features['input_ids'][i]) for i in rows)
+        inputs = {}
+        for name, values in features.items():
+            pad_value = self.tokenizer.pad_token_id if name == 'input_ids' else 0
+            batch = np.full((len(rows), width), pad_value, dtype=np.int64)
+            for j, i in enumerate(rows):
+                batch[j, :len(values[i])] = values[i]
+            inputs[name] = batch
+        return inputs
+
+    def encode(self, texts):
+        """编码文本列表
+        Returns:
+            np.ndarray: [len(texts), hidden_size]的float32矩阵，行顺序与texts一致
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.hidden_size), dtype=np.float32)
+
+        with METRICS.timer('encoder_stage_seconds', stage='tokenize'):
+            features = self.tokenizer(texts, truncation=True, max_length=self.max_length, padding=False)
+            features = {name: features[name] for name in ('input_ids', 'attention_mask', 'token_type_ids')
+                        if name in features}
+        lengths = [len(ids) for ids in features['input_ids']]
+        METRICS.inc('encoded_texts_total', len(texts))
+        METRICS.inc('encoded_tokens_total', sum(lengths))
+
+        embeddings = np.empty((len(texts), self.hidden_size), dtype=np.float32)
+        with METRICS.timer('encoder_stage_seconds', stage='model'):
+            for rows in plan_batches(lengths, self.max_tokens, self.max_batch_size):
+                embeddings[rows] = self.backend(self._pad(features, rows))
+        return embeddings
@@ -0,0 +1,188 @@
+import os
+import yaml
+import numpy as np
+import faiss
+from .encoder_backends import ENCODER_BACKENDS
+
+# retriever/faiss_config.yaml
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "faiss_config.yaml")
+
+DEFAULT_FAISS_CONFIG = {
+    'use_gpu': False,
+    'gpu_id': 0,
+    'mmap': True,
+    'index_factory': "Flat",
+    'metric': "l2",
+    'normalize': False,
+    'train_sample_size': 100000,
+    'add_batch_size': 100000,
+    'search': {
+        'nprobe': None,
+        'efSearch': None,
+    },
+    'rerank': {
+        'enabled': False,
+        'k_factor': 4,
+    },
+    'embedding_cache': {
+        'path': None,
+        'max_entries': 2000000,
+    },
+    'encoding': {
+        'max_tokens': 16384,
+        'max_batch_size': 256,
+        'chunk_size': 8192,
+        'backend': "torch",
+        'num_threads': None,
+        'onnx_dir': None,
+    },
+}
+
+METRIC_TYPES = {
+    'l2': faiss.METRIC_L2,
+    'ip': faiss.METRIC_INNER_PRODUCT,
+}
+
+
+def _merge_config(config, updates):
+    """合并配置，嵌套的dict（如search）按键合并"""
+    for key, value in updates.items():
+        if isinstance(config.get(key), dict) and isinstance(value, dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+
+
+def load_faiss_config(path=None, overrides=None):
+    """读取FAISS配置（yaml中的faiss段），缺省项使用DEFAULT_FAISS_CONFIG
+    Args:
+        path: 配置文件路径，默认为 retriever/faiss_config.yaml
+        overrides: 覆盖配置文件的dict
+    """
+    config = {k: dict(v) if isinstance(v, dict) else v for k, v in DEFAULT_FAISS_CONFIG.items()}
+
+    path = path or DEFAULT_CONFIG_PATH
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            _merge_config(config, (yaml.safe_load(f) or {}).get('faiss') or {})
+    if overrides:
+        _merge_config(config, overrides)
+
+    if config['metric'] not in METRIC_TYPES:
+        raise ValueError(f"Unsupported FAISS metric: {config['metric']} (expected one of {list(METRIC_TYPES)})")
+    if config['encoding']['backend'] not in ENCODER_BACKENDS:
+        raise ValueError(f"Unsupported encoder backend: {config['encoding']['backend']} "
+                         f"(expected one of {list(ENCODER_BACKENDS)})")
+    return config
+
+
+def read_index(path, mmap=False):
+    """读取索引文件
+    Args:
+        path: faiss.write_index 写出的文件
+        mmap: 以只读内存映射方式打开，向量编码和倒排表留在页缓存中，多个进程共享同一份物理内存。
+              新版faiss使用 IO_FLAG_MMAP_IFC（Flat/SQ/PQ编码和IVF倒排表都映射），
+              旧版使用 IO_FLAG_MMAP（只映射IVF倒排表）；映射的索引不能再添加向量。
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    flag = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+    return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+
+
+def gpu_available():
+    """当前faiss是否为GPU版本且存在可用GPU"""
+    return hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0
+
+
+def create_index(dimension, config):
+    """按配置中的index factory字符串创建CPU索引，如 Flat / IVF4096,Flat / IVF4096,PQ64 / HNSW32"""
+    return faiss.index_factory(dimension, config['index_factory'], METRIC_TYPES[config['metric']])
+
+
+def prepare_vectors(vectors, config):
+    """转换为连续的float32矩阵，需要时做L2归一化（内积即余弦相似度）"""
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    if config['normalize']:
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def train_index(index, vectors, config, seed=0):
+    """IVF/PQ等索引需要训练，从向量中无放回采样 train_sample_size 条作为训练集"""
+    if index.is_trained:
+        return
+    num_vectors = len(vectors)
+    sample_size = min(num_vectors, config['train_sample_size'])
+    if sample_size < num_vectors:
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(num_vectors, sample_size, replace=False))
+        training = vectors[sample]
+    else:
+        training = vectors[:]
+    index.train(prepare_vectors(training, config))
+
+
+def add_vectors(index, vectors, config):
+    """分批把向量加入索引（vectors 可以是内存映射的数组）"""
+    batch_size = config['add_batch_size']
+    for start in range(0, len(vectors), batch_size):
+        index.add(prepare_vectors(vectors[start:start + batch_size], config))
+
+
+def rerank_exact(queries, indices, vectors, top_k, config):
+    """用原始float32向量对压缩索引（SQ/PQ等）返回的候选精确重排
+    Args:
+        queries: 已经过 prepare_vectors 的查询矩阵
+        indices: index.search 返回的候选下标（-1表示空位）
+        vectors: 原始文档向量，可以是内存映射的数组（只读取候选行，且按行号顺序读取）
+        top_k: 重排后每个查询保留的结果数
+        config: FAISS配置（metric、normalize）
+    Returns:
+        (distances, indices): [len(queries), top_k]，含义与 index.search 相同（l2为距离的平方）
+    """
+    l2 = config['metric'] == 'l2'
+    rows = np.unique(indices[indices >= 0])
+    stored = prepare_vectors(vectors[rows], config)
+    distances = np.full((len(queries), top_k), np.inf if l2 else -np.inf, dtype='float32')
+    result = np.full((len(queries), top_k), -1, dtype='int64')
+    for i, (query, candidates) in enumerate(zip(queries, indices)):
+        candidates = candidates[candidates >= 0]
+        candidate_vectors = stored[np.searchsorted(rows, candidates)]
+        if l2:
+            scores = ((candidate_vectors - query) ** 2).sum(axis=1)
+            order = np.argsort(scores, kind='stable')[:top_k]
+        else:
+            scores = candidate_vectors @ query
+            order = np.argsort(-scores, kind='stable')[:top_k]
+        distances[i, :len(order)] = scores[order]
+        result[i, :len(order)] = candidates[order]
+    return distances, result
+
+
+def set_search_params(index, config, on_gpu=False):
+    """设置查询参数：IVF索引的nprobe，HNSW索引的efSearch；不适用的参数被忽略"""
+    params = faiss.GpuParameterSpace() if on_gpu else faiss.ParameterSpace()
+    for name, value in config['search'].items():
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            # 该参数不适用于当前索引类型（如Flat索引的nprobe）
+            pass
+
+
+def to_gpu(index, config):
+    """配置启用GPU且GPU可用时把索引移到GPU，否则原样返回CPU索引
+    Returns:
+        (index, gpu_resources): gpu_resources需要与GPU索引同生命周期保存
+    """
+    if not config['use_gpu']:
+        return index, None
+    if not gpu_available():
+        print("Warning: GPU version of FAISS or GPU device not available, falling back to CPU")
+        return index, None
+    resources = faiss.StandardGpuResources()
+    return faiss.index_cpu_to_gpu(resources, config['gpu_id'], index), resources
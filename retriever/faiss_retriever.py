@@ -5,139 +5,237 @@ import faiss
 from tqdm import tqdm
 import os
 import pickle
-from transformers import AutoTokenizer, AutoModel
-import torch
+import tempfile
+import threading
+from .embedding_cache import EmbeddingCache
+from .document_store import save_documents, open_documents
+from .vector_store import VectorStore
+from .storage import replace_directory
+from .encoding import BucketedEncoder
+from .encoder_backends import load_encoder_backend
+from .metrics import METRICS
+from .faiss_index import (load_faiss_config, create_index, train_index, add_vectors, read_index,
+                          prepare_vectors, rerank_exact, set_search_params, to_gpu)
 
 class FaissRetriever(Retriever):
-    def __init__(self, texts=None, raw_docs=None, model_name="bert-base-uncased"):
+    def __init__(self, texts=None, raw_docs=None, model_name="bert-base-uncased",
+                 config_path=None, config=None):
         """初始化FAISS检索器
         Args:
             texts: 文档文本列表(可选)
             raw_docs: 原始文档列表(可选)
-            model_name: 选择加载的HuggingFace模型（默认为BERT）
+            model_name: 选择加载的HuggingFace模型（默认为BERT），第一次编码时才加载，
+                        编码后端（torch / torch_int8 / onnx / onnx_int8）由配置的encoding.backend决定
+            config_path: FAISS配置文件路径，默认为 retriever/faiss_config.yaml
+            config: 覆盖配置文件的dict（如 {'index_factory': 'HNSW32'}）
         """
         print("Initializing FaissRetriever...")
         
-        # 默认使用GPU
-        self.use_gpu = True  # 默认启用GPU
-        self.gpu_id = 0  # 使用GPU 0
+        # 索引类型、距离、训练及查询参数均来自配置；默认在CPU上构建和查询
+        self.config = load_faiss_config(config_path, config)
+        self.use_gpu = self.config['use_gpu']
+        self.gpu_id = self.config['gpu_id']
+        self._gpu_resources = None
         
-        # 初始化编码器和其他属性 
-        print("Loading model...")
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
+        # 编码器在第一次编码时加载：只加载已保存索引的进程在查询前不导入torch/transformers
+        self.model_name = model_name
+        self.max_length = 512
+        self.pooling = "mean"
+        self._encoder = None
+        self._encoder_lock = threading.Lock()
+        self._embedding_cache = None
 
-        # Load success
-        print("Model loaded successfully.")
         self.raw_docs = raw_docs
         self.index = None
         self.dimension = None
+        # 启用精确重排时的原始float32向量（加载时为内存映射的 vectors/），否则为None
+        self.vectors = None
+        # 索引变化时递增，查询缓存据此使旧结果失效
+        self.index_version = 0
+        # 查询向量缓存（LRUCache，由CachedRetriever设置），为None时不缓存
+        self.query_embedding_cache = None
         
         # 如果提供了文本，则构建新索引
         if texts is not None:
             print("Building FAISS index...")
             self._build_index(texts)
 
-    def _to_gpu(self, index):
-        """将索引转移到GPU"""
-        print("Moving index to GPU...")
-        try:
-            # 尝试导入GPU版本的faiss
-            res = faiss.StandardGpuResources()
-            gpu_index = faiss.index_cpu_to_gpu(res, self.gpu_id, index)
-            return gpu_index
-        except (ImportError, AttributeError):
-            print("Warning: GPU version of FAISS not available, falling back to CPU")
-            return index
+    def set_index(self, index, gpu=True):
+        """设置CPU索引：应用查询参数，配置启用GPU且可用时移到GPU
+        Args:
+            index: CPU索引
+            gpu: 为False时留在CPU，之后调用 move_to_gpu（多进程服务在fork之后移到GPU）
+        """
+        if gpu and self.use_gpu:
+            print("Moving index to GPU...")
+            index, self._gpu_resources = to_gpu(index, self.config)
+        set_search_params(index, self.config, on_gpu=self._gpu_resources is not None)
+        self.index = index
+        self.dimension = index.d
+        self.index_version += 1
+
+    @property
+    def on_gpu(self):
+        return self._gpu_resources is not None
+
+    def move_to_gpu(self):
+        """配置启用GPU、索引仍在CPU上时把索引移到GPU（set_index(..., gpu=False) 之后调用）"""
+        if self.use_gpu and self.index is not None and not self.on_gpu:
+            self.set_index(self.index)
+
+    def load_encoder(self):
+        """加载分词器和编码后端（已加载时直接返回），可在启动时调用以免第一个查询等待模型加载"""
+        if self._encoder is None:
+            with self._encoder_lock:
+                if self._encoder is None:
+                    encoding = self.config['encoding']
+                    print(f"Loading model ({encoding['backend']} backend)...")
+                    tokenizer, backend = load_encoder_backend(self.model_name, encoding)
+                    self._encoder = BucketedEncoder(tokenizer, backend, self.max_length,
+                                                    encoding['max_tokens'], encoding['max_batch_size'])
+                    print("Model loaded successfully.")
+        return self._encoder
+
+    @property
+    def encoder(self):
+        return self.load_encoder()
+
+    @property
+    def tokenizer(self):
+        return self.load_encoder().tokenizer
 
     def _encode_batch(self, batch):
-        """通过模型编码文本"""
-        inputs = self.tokenizer(batch, padding=True, truncation=True, return_tensors="pt", max_length=512)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            embeddings = outputs.last_hidden_state.mean(dim=1).cpu().numpy()  # 获取句子级别的嵌入
-        return embeddings
+        """通过模型编码文本（按长度分桶动态组批，结果顺序与输入一致）"""
+        return self.encoder.encode(batch)
+
+    @property
+    def embedding_cache(self):
+        """按配置打开的文档向量缓存，未配置时为None"""
+        cache_config = self.config['embedding_cache']
+        if self._embedding_cache is None and cache_config['path']:
+            self._embedding_cache = EmbeddingCache(
+                cache_config['path'], self.encoder.hidden_size, cache_config['max_entries'])
+        return self._embedding_cache
+
+    def encode_documents(self, texts):
+        """编码文档文本（分词后的列表先拼接为字符串），启用向量缓存时只编码缓存中没有的文本"""
+        texts = [' '.join(doc) if isinstance(doc, list) else doc for doc in texts]
+        cache = self.embedding_cache
+        if cache is None:
+            return self._encode_batch(texts)
+        # 量化后端的向量与fp32不同，缓存键中加入后端名（fp32沿用原来的键）
+        backend = self.config['encoding']['backend']
+        model_key = self.model_name if backend == 'torch' else f"{self.model_name}@{backend}"
+        return cache.encode(texts, self._encode_batch, model_key, self.max_length, self.pooling)
 
     def _build_index(self, texts):
-        """构建FAISS索引，使用GPU加速"""
+        """构建FAISS索引（索引类型由配置决定，可选GPU加速）"""
         print("Encoding documents with transformer...")
-        text_vectors = []
+        text_vectors = None
         
-        # 分批处理以节省内存
-        batch_size = 64
-        for i in tqdm(range(0, len(texts), batch_size), desc="Encoding batches"):
-            batch = texts[i:i + batch_size]
-            # 确保batch中的文本都是字符串
-            batch = [' '.join(doc) if isinstance(doc, list) else doc for doc in batch]
-            # 批量编码
-            vectors = self._encode_batch(batch)
-            text_vectors.extend(vectors)
-        
-        print("Converting to numpy array...")
-        self.text_vectors = np.array(text_vectors).astype('float32')
-        self.dimension = self.text_vectors.shape[1]
-        
-        print(f"Building FAISS index with dimension {self.dimension}...")
+        # 每次取chunk_size个文本，在块内按长度分桶组批；结果直接写入预分配的矩阵，
+        # 不先收集到列表再整体复制
+        chunk_size = self.config['encoding']['chunk_size']
+        for i in tqdm(range(0, len(texts), chunk_size), desc="Encoding chunks"):
+            vectors = self.encode_documents(texts[i:i + chunk_size])
+            if text_vectors is None:
+                text_vectors = np.empty((len(texts), vectors.shape[1]), dtype='float32')
+            text_vectors[i:i + len(vectors)] = vectors
+        if text_vectors is None:
+            raise ValueError("No documents to index")
+
+        if self.embedding_cache is not None:
+            self.embedding_cache.flush()
+            print(f"Embedding cache: {self.embedding_cache.stats()}")
         
-        # 构建Faiss索引，使用GPU加速
-        res = faiss.StandardGpuResources()  # 创建GPU资源
-        cpu_index = faiss.IndexFlatL2(self.dimension)  # 创建一个L2距离的索引
-        self.index = faiss.index_cpu_to_gpu(res, self.gpu_id, cpu_index)  # 将索引移到GPU
+        self.index_vectors(text_vectors)
+
+    def index_vectors(self, vectors):
+        """用文档向量构建FAISS索引
+        Args:
+            vectors: [n, dimension]的向量矩阵，可以是内存映射的数组
+                     （训练只读取采样部分，添加时分批读取）
+        """
+        self.dimension = vectors.shape[1]
+        print(f"Building FAISS index '{self.config['index_factory']}' with dimension {self.dimension}...")
         
+        # 在CPU上创建、训练并添加向量（IVF/PQ需要训练，Flat/HNSW不需要）
+        cpu_index = create_index(self.dimension, self.config)
+        print("Training FAISS index...")
+        train_index(cpu_index, vectors, self.config)
         print("Adding vectors to FAISS index...")
-        # 分批添加向量
-        batch_size = 1000
-        total_batches = (len(self.text_vectors) + batch_size - 1) // batch_size
-        
-        for i in tqdm(range(0, len(self.text_vectors), batch_size), 
-                     desc="Adding vectors to FAISS index",
-                     total=total_batches):
-            batch = self.text_vectors[i:i + batch_size]
-            self.index.add(batch)  # 批量添加向量到索引
+        add_vectors(cpu_index, vectors, self.config)
+        self.set_index(cpu_index)
+        self.vectors = vectors if self.config['rerank']['enabled'] else None
         
         print(f"FAISS index built successfully with {self.index.ntotal} vectors")
 
-    def save(self, path: str):
-        """保存检索器到文件"""
+    def save(self, path: str, vectors=None):
+        """保存检索器到目录
+        Args:
+            path: 保存目录，包含 faiss.index、documents/（按需读取的压缩文档存储，
+                  是共享的文档存储时只保存链接）、retriever_data.pkl，以及原始向量 vectors/。
+                  先写入临时目录再整体替换。
+            vectors: 保存到 vectors/ 的原始向量，默认为精确重排使用的向量（未启用时不保存）；
+                     VectorStore 内存映射的向量以硬链接保存，不重新写入
+        """
         print("Saving FAISS index and data...")
-        # 创建保存目录
-        os.makedirs(path, exist_ok=True)
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=".faiss-", dir=parent)
         
         # 保存FAISS索引
         print("Saving FAISS index...")
         try:
             # 检查是否是GPU索引
-            if hasattr(self.index, 'getDevice'):  # GPU index check
+            if self._gpu_resources is not None:
                 print("Converting GPU index to CPU for saving...")
                 cpu_index = faiss.index_gpu_to_cpu(self.index)
             else:
                 cpu_index = self.index
                 
             # 保存CPU索引
-            faiss.write_index(cpu_index, os.path.join(path, "faiss.index"))
+            faiss.write_index(cpu_index, os.path.join(tmp_path, "faiss.index"))
             print("FAISS index saved successfully")
         except Exception as e:
             print(f"Error saving FAISS index: {e}")
             raise  # Re-raise the exception for proper error handling
         
-        # 保存其他数据
-        with open(os.path.join(path, "retriever_data.pkl"), 'wb') as f:
+        # 保存文档和其他数据
+        save_documents(self.raw_docs, os.path.join(tmp_path, "documents"), os.path.join(path, "documents"))
+        vectors = self.vectors if vectors is None else vectors
+        if vectors is not None:
+            self._save_vectors(vectors, os.path.join(tmp_path, "vectors"))
+        with open(os.path.join(tmp_path, "retriever_data.pkl"), 'wb') as f:
             pickle.dump({
-                'raw_docs': self.raw_docs,
                 'dimension': self.dimension
             }, f)
+        replace_directory(tmp_path, path)
 
-    def load(self, path: str):
-        """从文件加载检索器"""
+    @staticmethod
+    def _save_vectors(vectors, directory):
+        """保存原始向量：来自VectorStore的内存映射（如已加载的 vectors/）时链接其文件，否则写入"""
+        source = os.path.dirname(vectors.filename) if isinstance(vectors, np.memmap) and vectors.filename else None
+        if source is not None and os.path.exists(os.path.join(source, "meta.json")):
+            store = VectorStore(source)
+            if vectors.offset == 0 and vectors.shape == (len(store), store.dimension):
+                store.link(directory)
+                return
+        VectorStore(directory).append(vectors)
+
+    def load(self, path: str, gpu: bool = True):
+        """从目录加载检索器（配置mmap为true时索引以只读内存映射方式打开，文档按需读取）；
+        兼容旧版本pickle保存的raw_docs
+        Args:
+            path: 索引目录
+            gpu: 为False时索引留在CPU，之后调用 move_to_gpu
+        """
         print("Loading FAISS index and data...")
         # 加载FAISS索引
         try:
-            index = faiss.read_index(os.path.join(path, "faiss.index"))
-            if self.use_gpu:
-                # 如果启用GPU，将索引移至GPU
-                self.index = self._to_gpu(index)
-            else:
-                self.index = index
+            index = read_index(os.path.join(path, "faiss.index"), self.config['mmap'])
+            # 应用查询参数，配置启用GPU且可用时移至GPU
+            self.set_index(index, gpu)
             print("FAISS index loaded successfully.")
         except Exception as e:
             print(f"Error loading FAISS index: {e}")
@@ -145,31 +243,99 @@ class FaissRetriever(Retriever):
         # 加载其他数据
         with open(os.path.join(path, "retriever_data.pkl"), 'rb') as f:
             data = pickle.load(f)
+        self.dimension = data['dimension']
+        documents_path = os.path.join(path, "documents")
+        if os.path.isdir(documents_path):
+            self.raw_docs = open_documents(documents_path)
+        else:
             self.raw_docs = data['raw_docs']
-            self.dimension = data['dimension']
+
+        index_mb = os.path.getsize(os.path.join(path, "faiss.index")) / 2 ** 20
+        print(f"FAISS index: {index_mb:.1f} MB{' (memory-mapped)' if self.config['mmap'] else ''}")
+        self.vectors = None
+        if self.config['rerank']['enabled']:
+            self._open_rerank_vectors(os.path.join(path, "vectors"))
+
+    def _open_rerank_vectors(self, vectors_path):
+        """以内存映射方式打开精确重排使用的原始向量；缺失或与索引不一致时不重排"""
+        if not os.path.isdir(vectors_path):
+            print(f"Warning: re-ranking enabled but {vectors_path} not found, searching without re-ranking")
+            return
+        vectors = VectorStore(vectors_path).vectors()
+        if self.index is None or len(vectors) != self.index.ntotal or vectors.shape[1] != self.dimension:
+            print(f"Warning: {vectors_path} does not match the FAISS index, searching without re-ranking")
+            return
+        self.vectors = vectors
+        print(f"Re-ranking top {self.config['rerank']['k_factor']}x candidates from "
+              f"{vectors.nbytes / 2 ** 20:.1f} MB of memory-mapped vectors")
+
+    def encode_queries(self, queries, batch_size=64):
+        """分批编码查询；设置了query_embedding_cache时只编码缓存中没有的查询"""
+        cache = self.query_embedding_cache
+        vectors = [None] * len(queries)
+        if cache is not None:
+            vectors = [cache.get(query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        for start in range(0, len(missing), batch_size):
+            rows = missing[start:start + batch_size]
+            for i, vector in zip(rows, self._encode_batch([queries[i] for i in rows])):
+                vectors[i] = vector
+                if cache is not None:
+                    cache.put(queries[i], vector)
+        return np.vstack(vectors)
+
+    def _format_document(self, doc):
+        """把原始文档格式化为返回给调用方的文本"""
+        if doc.get('type') == 'title':
+            return f"Title: {doc['text']}"
+        elif doc.get('type') == 'paragraph':
+            return f"Title: {doc['title']}\nContent: {doc['text']}"
+        return str(doc)
+
+    def search_batch(self, queries, top_k: int = 5, batch_size: int = 64):
+        """批量检索：查询分批编码后，整个查询矩阵一次性交给 index.search
+        Args:
+            queries: 查询字符串列表
+            top_k: 每个查询返回的文档数
+            batch_size: 编码时每批的查询数
+        Returns:
+            list: 与输入顺序一致，每项为dict列表（score越大越相关：L2距离取负，内积保持不变）
+        """
+        if not queries:
+            return []
+        with METRICS.timer('query_stage_seconds', retriever='faiss', stage='encode'):
+            query_vectors = prepare_vectors(self.encode_queries(queries, batch_size), self.config)
+        # L2距离越小越相关，内积越大越相关
+        sign = -1.0 if self.config['metric'] == 'l2' else 1.0
+
+        # 启用精确重排时先从压缩索引多取候选，再用原始向量重排
+        rerank = self.vectors is not None
+        candidates = top_k * self.config['rerank']['k_factor'] if rerank else top_k
+        with METRICS.timer('query_stage_seconds', retriever='faiss', stage='index_search'):
+            distances, indices = self.index.search(query_vectors, candidates)
+        if rerank:
+            with METRICS.timer('query_stage_seconds', retriever='faiss', stage='rerank'):
+                distances, indices = rerank_exact(query_vectors, indices, self.vectors, top_k, self.config)
+
+        # 同一批中多个查询命中的文档只读取一次；idx < 0 表示索引中的向量不足top_k个
+        with METRICS.timer('query_stage_seconds', retriever='faiss', stage='doc_fetch'):
+            docs = {int(idx): self.raw_docs[idx] for idx in np.unique(indices[indices >= 0])}
+
+        with METRICS.timer('query_stage_seconds', retriever='faiss', stage='format'):
+            results = [[{
+                'doc_id': int(idx),
+                'score': sign * float(distance),
+                'document': self._format_document(docs[idx]),
+                'metadata': docs[idx]
+            } for distance, idx in zip(row_distances, row_indices.tolist()) if idx >= 0]
+                for row_distances, row_indices in zip(distances, indices)]
+        METRICS.inc('queries_total', len(queries), retriever='faiss')
+        return results
+
+    def search(self, query: str, top_k: int = 5):
+        """检索单个查询，返回与BM25检索器相同格式的dict列表"""
+        return self.search_batch([query], top_k)[0]
 
     def retrieve(self, query: str, top_k: int = 5):
-        """检索相关文档"""
-        print("Retrieving documents for query...")
-        # 编码查询
-        query_vector = self._encode_batch([query])
-        query_vector = np.array([query_vector[0]]).astype('float32')
-        
-        # 搜索最相似的文档
-        distances, indices = self.index.search(query_vector, top_k)
-        
-        print(f"Found {len(indices[0])} relevant documents.")
-        
-        # 返回原始文档
-        results = []
-        for idx in indices[0]:
-            doc = self.raw_docs[idx]
-            if doc.get('type') == 'title':
-                result = f"Title: {doc['text']}"
-            elif doc.get('type') == 'paragraph':
-                result = f"Title: {doc['title']}\nContent: {doc['text']}"
-            else:
-                result = str(doc)
-            results.append(result)
-            
-        return results
\ No newline at end of file
+        """检索相关文档，返回格式化后的文档文本列表"""
+        return [result['document'] for result in self.search(query, top_k)]
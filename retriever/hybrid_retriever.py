@@ -0,0 +1,204 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from .retriever import Retriever
+from .rank_bm25_retriever import RankBM25Retriever
+from .analyzer import DEFAULT_ANALYZER
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+FUSION_METHODS = ('rrf', 'weighted')
+
+
+def _doc_key(result):
+    """融合时的文档键：各检索器基于同一语料时用doc_id，否则用原始文档内容"""
+    if 'doc_id' in result:
+        return result['doc_id']
+    metadata = result.get('metadata') or {}
+    return metadata.get('id'), metadata.get('type'), result.get('document')
+
+
+def reciprocal_rank_fusion(ranked_lists, weights, k=60):
+    """RRF融合：score(d) = Σ w / (k + rank)，rank从1开始
+    Args:
+        ranked_lists: {检索器名: 按相关度排序的结果列表}
+        weights: {检索器名: 权重}
+        k: 平滑常数，越大排名靠后的文档影响越大
+    Returns:
+        dict: 文档键 -> 融合得分
+    """
+    fused = {}
+    for name, results in ranked_lists.items():
+        for rank, result in enumerate(results, 1):
+            key = _doc_key(result)
+            fused[key] = fused.get(key, 0.0) + weights[name] / (k + rank)
+    return fused
+
+
+def weighted_score_fusion(ranked_lists, weights):
+    """加权分数融合：每个检索器的分数先按其候选集min-max归一化到[0, 1]再加权求和"""
+    fused = {}
+    for name, results in ranked_lists.items():
+        if not results:
+            continue
+        scores = [result['score'] for result in results]
+        low, high = min(scores), max(scores)
+        for result in results:
+            normalized = (result['score'] - low) / (high - low) if high > low else 1.0
+            key = _doc_key(result)
+            fused[key] = fused.get(key, 0.0) + weights[name] * normalized
+    return fused
+
+
+class HybridRetriever(Retriever):
+    """并行查询多个检索器（稀疏 + 稠密），按文档融合结果
+
+    每个检索器在自己的线程中执行，总延迟约等于最慢的单个检索器；
+    超过时间预算的检索器被跳过（其线程在后台继续执行完当前查询），
+    结果只由按时返回的检索器融合而成。超时的查询执行完之前，该检索器的后续查询
+    直接跳过，不会排队等待，也不会占用其他检索器的线程。
+    """
+
+    def __init__(self, retrievers, weights=None, fusion='rrf', rrf_k=60, timeout=None,
+                 num_candidates=None, query_transforms=None):
+        """
+        Args:
+            retrievers: {名称: 检索器}，检索器需要实现 search(query, top_k)
+            weights: {名称: 权重}，默认均为1
+            fusion: 融合方式，'rrf'（倒数排名融合）或 'weighted'（加权分数融合）
+            rrf_k: RRF的平滑常数
+            timeout: 每个检索器的时间预算（秒），可以是数值或 {名称: 秒}；None为不限时
+            num_candidates: 每个检索器取回的候选数，默认为 top_k
+            query_transforms: {名称: 函数}，把查询字符串转换为该检索器的输入；
+                              RankBM25Retriever 默认使用 DEFAULT_ANALYZER 分词
+        """
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unsupported fusion method: {fusion} (expected one of {list(FUSION_METHODS)})")
+        self.retrievers = dict(retrievers)
+        self.weights = {name: 1.0 for name in self.retrievers}
+        self.weights.update(weights or {})
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.timeout = timeout
+        self.num_candidates = num_candidates
+        self.query_transforms = {
+            name: DEFAULT_ANALYZER.tokenize for name, retriever in self.retrievers.items()
+            if isinstance(retriever, RankBM25Retriever)
+        }
+        self.query_transforms.update(query_transforms or {})
+        self.timeouts = {name: 0 for name in self.retrievers}
+        self.errors = {name: 0 for name in self.retrievers}
+        self.skipped = {name: 0 for name in self.retrievers}
+        # 每个检索器一个线程，超时的检索器只阻塞自己的线程
+        self._executors = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"hybrid-{name}")
+                           for name in self.retrievers}
+        self._overrunning = {}  # 名称 -> 超时后仍在执行的future
+
+    @property
+    def index_version(self):
+        """各检索器 index_version 组成的tuple，任一检索器的索引变化时随之变化（查询缓存据此失效）"""
+        return tuple((name, getattr(retriever, 'index_version', None)) for name, retriever in self.retrievers.items())
+
+    def _budget(self, name):
+        if isinstance(self.timeout, dict):
+            return self.timeout.get(name)
+        return self.timeout
+
+    def _search_one(self, name, queries, top_k):
+        retriever = self.retrievers[name]
+        transform = self.query_transforms.get(name)
+        if transform is not None:
+            with METRICS.timer('query_stage_seconds', retriever=name, stage='tokenize'):
+                queries = [transform(query) for query in queries]
+        if hasattr(retriever, 'search_batch'):
+            return retriever.search_batch(queries, top_k=top_k)
+        return [retriever.search(query, top_k=top_k) for query in queries]
+
+    def _gather(self, queries, top_k):
+        """并行执行所有检索器，返回 {名称: 每个查询的结果列表}
+
+        超时、出错或上一次超时的查询仍在执行的检索器不在其中。
+        """
+        start = time.perf_counter()
+        futures = {}
+        for name in self.retrievers:
+            overrunning = self._overrunning.get(name)
+            if overrunning is not None:
+                if not overrunning.done():
+                    self.skipped[name] += 1
+                    METRICS.inc('retriever_skipped_total', retriever=name)
+                    logger.warning(f"retriever '{name}' is still running a timed-out query, skipped")
+                    continue
+                del self._overrunning[name]
+            futures[name] = self._executors[name].submit(self._search_one, name, queries, top_k)
+        gathered = {}
+        for name, future in futures.items():
+            budget = self._budget(name)
+            remaining = None if budget is None else max(0.0, start + budget - time.perf_counter())
+            try:
+                gathered[name] = future.result(timeout=remaining)
+            except TimeoutError:
+                self._overrunning[name] = future
+                self.timeouts[name] += 1
+                METRICS.inc('retriever_timeouts_total', retriever=name)
+                logger.warning(f"retriever '{name}' exceeded its {budget}s budget, skipped")
+            except Exception as e:
+                self.errors[name] += 1
+                METRICS.inc('retriever_errors_total', retriever=name)
+                logger.warning(f"retriever '{name}' failed: {e}")
+        return gathered
+
+    def _fuse(self, ranked_lists, top_k):
+        if self.fusion == 'rrf':
+            fused = reciprocal_rank_fusion(ranked_lists, self.weights, self.rrf_k)
+        else:
+            fused = weighted_score_fusion(ranked_lists, self.weights)
+
+        # 每个文档保留第一个返回它的检索器的结果，并记录各检索器的原始分数
+        merged = {}
+        for name, results in ranked_lists.items():
+            for result in results:
+                key = _doc_key(result)
+                if key not in merged:
+                    merged[key] = dict(result, scores={})
+                merged[key]['scores'][name] = result['score']
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [dict(merged[key], score=score) for key, score in ranked]
+
+    def search_batch(self, queries, top_k=5):
+        """批量检索：各检索器各自执行一次 search_batch（并行），再逐个查询融合
+        Returns:
+            list: 与输入顺序一致，每项为dict列表，score为融合得分，
+                  scores为 {检索器名: 原始分数}
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        gathered = self._gather(queries, self.num_candidates or top_k)
+        with METRICS.timer('query_stage_seconds', retriever='hybrid', stage='fusion'):
+            return [
+                self._fuse({name: results[i] for name, results in gathered.items()}, top_k)
+                for i in range(len(queries))
+            ]
+
+    def search(self, query, top_k=5):
+        """检索单个查询，返回融合后的dict列表"""
+        return self.search_batch([query], top_k)[0]
+
+    def retrieve(self, query, top_k=5):
+        """检索相关文档，返回文档文本列表"""
+        return [result['document'] for result in self.search(query, top_k)]
+
+    def save(self, path):
+        """把每个检索器保存到 path/<名称>"""
+        for name, retriever in self.retrievers.items():
+            retriever.save(os.path.join(path, name))
+
+    def load(self, path):
+        """从 path/<名称> 加载每个检索器（兼容实例方法和类方法形式的load）"""
+        for name, retriever in self.retrievers.items():
+            loaded = retriever.load(os.path.join(path, name))
+            if loaded is not None:
+                self.retrievers[name] = loaded
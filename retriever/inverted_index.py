@@ -0,0 +1,685 @@
+import os
+import uuid
+import shutil
+import threading
+import numpy as np
+from .storage import save_array, load_array, write_json, read_json
+from .vocabulary import save_vocabulary, MmapVocabulary
+from .merge_policy import TieredMergePolicy
+from .analyzer import DEFAULT_ANALYZER, TokenizedCorpus
+from .metrics import METRICS
+
+# 磁盘索引格式版本，格式不兼容地变化时递增
+# 版本2: 倒排表段增加块信息(block_*)，版本1的段在加载时补算
+INDEX_FORMAT_VERSION = 2
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+
+# 倒排表分块大小（用于Block-Max剪枝）
+BLOCK_SIZE = 128
+
+SEGMENT_ARRAYS = ('term_ids', 'indptr', 'doc_ids', 'tfs',
+                  'block_ptr', 'block_last_doc', 'block_max_tf', 'block_min_dl')
+
+
+def _ensure_capacity(array, size):
+    """按倍增策略扩容数组，保证追加的均摊代价为O(1)"""
+    if not array.flags.writeable:
+        # 内存映射的只读数组在第一次修改时复制到内存
+        array = np.array(array)
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _raw_idf(num_docs, df):
+    """BM25Okapi的idf（未做负值处理）"""
+    return np.log(num_docs - df + 0.5) - np.log(df + 0.5)
+
+
+def _build_blocks(indptr, doc_ids, tfs, posting_dl):
+    """把每个词的倒排表按BLOCK_SIZE切块，记录每块的最后文档id、最大tf和最短文档长度
+
+    BM25单词得分随tf增大、随文档长度增大而减小，因此用(最大tf, 最短长度)
+    算出的得分是块内任意文档得分的上界，且与avgdl的取值无关。
+    """
+    counts = np.diff(indptr)
+    num_blocks = (counts + BLOCK_SIZE - 1) // BLOCK_SIZE
+    block_ptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(num_blocks, out=block_ptr[1:])
+    if not len(doc_ids):
+        empty = np.zeros(0, dtype=np.uint32)
+        return block_ptr, empty, empty, empty.astype(np.int32)
+
+    block_terms = np.repeat(np.arange(len(counts)), num_blocks)
+    block_rank = np.arange(block_ptr[-1]) - block_ptr[block_terms]
+    starts = indptr[block_terms] + BLOCK_SIZE * block_rank
+    ends = np.minimum(starts + BLOCK_SIZE, indptr[block_terms + 1])
+
+    block_last_doc = np.asarray(doc_ids[ends - 1], dtype=np.uint32)
+    block_max_tf = np.maximum.reduceat(np.asarray(tfs), starts).astype(np.uint32)
+    block_min_dl = np.minimum.reduceat(posting_dl, starts).astype(np.int32)
+    return block_ptr, block_last_doc, block_max_tf, block_min_dl
+
+
+class PostingSegment:
+    """不可变的CSR倒排表段
+
+    覆盖一段连续的文档id区间。term_ids 为段内出现过的词id（升序），
+    第 i 个词的倒排表为 doc_ids[indptr[i]:indptr[i+1]]，组内按文档id升序。
+    每个词的倒排表另外按BLOCK_SIZE分块，块信息位于
+    block_*[block_ptr[i]:block_ptr[i+1]]，用于top-k查询时的动态剪枝。
+    """
+
+    def __init__(self, term_ids, indptr, doc_ids, tfs, doc_start, num_docs, blocks, name=None):
+        self.term_ids = term_ids
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_start = doc_start
+        self.num_docs = num_docs
+        self.block_ptr, self.block_last_doc, self.block_max_tf, self.block_min_dl = blocks
+        # 段目录名，第一次保存时生成；段不可变，同名的段目录内容相同
+        self.name = name
+
+    @property
+    def num_postings(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, token_ids, lengths, doc_start):
+        """由一批文档的词id构建倒排表段
+        Args:
+            token_ids: 所有文档词id拼接成的数组
+            lengths: 每个文档的词数
+            doc_start: 第一个文档的全局id
+        """
+        num_docs = len(lengths)
+        local_docs = np.repeat(np.arange(num_docs, dtype=np.int64), lengths)
+        width = max(num_docs, 1)
+
+        # (词id, 文档id) 组合键排序去重，得到按词分组、组内按文档有序的倒排表
+        keys, tfs = np.unique(np.asarray(token_ids, dtype=np.int64) * width + local_docs, return_counts=True)
+        posting_terms = keys // width
+        term_ids, starts = np.unique(posting_terms, return_index=True)
+
+        indptr = np.empty(len(term_ids) + 1, dtype=np.int64)
+        indptr[:-1] = starts
+        indptr[-1] = len(keys)
+        local_doc_ids = keys % width
+        doc_ids = (local_doc_ids + doc_start).astype(np.uint32)
+        tfs = tfs.astype(np.uint32)
+        blocks = _build_blocks(indptr, doc_ids, tfs, np.asarray(lengths)[local_doc_ids])
+        return cls(term_ids, indptr, doc_ids, tfs, doc_start, num_docs, blocks)
+
+    @classmethod
+    def merge(cls, segments, doc_len):
+        """合并若干个文档区间相邻、按顺序排列的段
+        Args:
+            segments: 待合并的段
+            doc_len: 全局文档长度数组（用于重建块信息）
+        """
+        posting_terms = np.concatenate([np.repeat(s.term_ids, np.diff(s.indptr)) for s in segments])
+        doc_ids = np.concatenate([s.doc_ids for s in segments])
+        tfs = np.concatenate([s.tfs for s in segments])
+
+        # 各段按文档顺序排列，稳定排序后每个词的倒排表仍按文档id有序
+        order = np.argsort(posting_terms, kind='stable')
+        posting_terms = posting_terms[order]
+        term_ids, starts = np.unique(posting_terms, return_index=True)
+
+        indptr = np.empty(len(term_ids) + 1, dtype=np.int64)
+        indptr[:-1] = starts
+        indptr[-1] = len(posting_terms)
+        doc_ids, tfs = doc_ids[order], tfs[order]
+        blocks = _build_blocks(indptr, doc_ids, tfs, doc_len[doc_ids])
+        return cls(term_ids, indptr, doc_ids, tfs,
+                   segments[0].doc_start, sum(s.num_docs for s in segments), blocks)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in SEGMENT_ARRAYS:
+            save_array(directory, name, getattr(self, name))
+
+    def link(self, source, directory):
+        """用硬链接复制已保存的段目录（不支持硬链接时复制文件）"""
+        os.makedirs(directory, exist_ok=True)
+        for filename in os.listdir(source):
+            try:
+                os.link(os.path.join(source, filename), os.path.join(directory, filename))
+            except OSError:
+                shutil.copy2(os.path.join(source, filename), os.path.join(directory, filename))
+
+    @classmethod
+    def load(cls, directory, doc_start, num_docs, doc_len, mmap=True):
+        arrays = {}
+        for name in SEGMENT_ARRAYS:
+            if os.path.exists(os.path.join(directory, f"{name}.npy")):
+                arrays[name] = load_array(directory, name, mmap)
+        if 'block_ptr' in arrays:
+            blocks = tuple(arrays[name] for name in SEGMENT_ARRAYS[4:])
+        else:
+            # 格式版本1没有块信息，加载时在内存中补算
+            blocks = _build_blocks(arrays['indptr'], arrays['doc_ids'], arrays['tfs'],
+                                   doc_len[arrays['doc_ids']])
+        return cls(arrays['term_ids'], arrays['indptr'], arrays['doc_ids'], arrays['tfs'],
+                   doc_start, num_docs, blocks, name=os.path.basename(directory))
+
+    def find(self, term_id):
+        """返回词在本段中的位置，不存在时返回-1"""
+        pos = np.searchsorted(self.term_ids, term_id)
+        if pos >= len(self.term_ids) or self.term_ids[pos] != term_id:
+            return -1
+        return pos
+
+    def postings(self, term_id):
+        """返回某个词在本段中的 (doc_ids, tfs)，不存在时返回None"""
+        pos = self.find(term_id)
+        if pos < 0:
+            return None
+        start, end = self.indptr[pos], self.indptr[pos + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+
+def _kth_largest(scores, k):
+    """第k大的得分，不足k个时返回0"""
+    if len(scores) < k:
+        return 0.0
+    return float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+
+def _select_top_k(doc_ids, scores, top_k):
+    """部分排序取top_k，结果按得分降序"""
+    if len(scores) > top_k:
+        selected = np.argpartition(-scores, top_k - 1)[:top_k]
+        doc_ids, scores = doc_ids[selected], scores[selected]
+    order = np.argsort(-scores, kind='stable')
+    return doc_ids[order], scores[order]
+
+
+class _QueryTerm:
+    """top-k查询中的一个查询词"""
+
+    def __init__(self, term_id, weight, parts, block_last, block_ub):
+        self.term_id = term_id
+        self.weight = weight
+        # [(段, 词在段中的位置)]
+        self.parts = parts
+        # 各块最后一个文档id及块内得分上界（各段依次拼接，文档id有序）
+        self.block_last = block_last
+        self.block_ub = block_ub
+        self.upper_bound = float(block_ub.max())
+
+
+class InvertedIndex:
+    """基于倒排表的BM25索引
+
+    全局维护词表、文档频率(df)、文档长度；倒排表由若干不可变的
+    PostingSegment 组成。追加文档时只为新文档构建一个新段并增量更新
+    统计量，新段立即可查询，因此每批的代价只与批大小相关。
+    idf、avgdl等统计量是全局的，不论段如何划分，得分都与一次性构建的索引完全一致。
+    段按 TieredMergePolicy 合并，可以在后台线程中进行。
+    查询时只对包含查询词的文档打分，打分公式与 rank_bm25.BM25Okapi 一致。
+
+    并发：段列表写时复制，追加和合并只替换列表，查询开始时取一次快照，
+    因此查询不会被追加或后台合并阻塞。追加、强制合并、保存应由同一个线程调用。
+    """
+
+    def __init__(self, k1=1.5, b=0.75, epsilon=0.25, merge_factor=8, merge_policy=None,
+                 background_merge=False):
+        """初始化空索引
+        Args:
+            k1: BM25参数k1
+            b: BM25参数b
+            epsilon: 负idf的下限系数（与BM25Okapi相同）
+            merge_factor: 每层允许的段数及一次最多合并的段数（merge_policy为None时使用）
+            merge_policy: 段合并策略，默认为 TieredMergePolicy(merge_factor, merge_factor)
+            background_merge: 是否在后台线程中合并段（追加文档时不等待合并）
+        """
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.merge_factor = merge_factor
+        self.merge_policy = merge_policy or TieredMergePolicy(merge_factor, merge_factor)
+        self.background_merge = background_merge
+
+        self.vocab = {}
+        self.segments = []
+        self._lock = threading.Lock()
+        self._merge_thread = None
+        self._merge_error = None
+        self._df = np.zeros(0, dtype=np.int64)
+        self._doc_len = np.zeros(0, dtype=np.int32)
+        self._num_docs = 0
+        self._total_len = 0
+        self._average_idf = None
+        # 从磁盘加载时的idf表，索引被修改后失效
+        self._idf_table = None
+
+    @classmethod
+    def from_corpus(cls, tokenized_corpus, **params):
+        """从已分词的语料构建索引
+        Args:
+            tokenized_corpus: TokenizedCorpus，或已分词的文档列表（每个文档是词列表）
+            params: BM25参数（k1, b, epsilon）
+        """
+        index = cls(**params)
+        index.add_documents(tokenized_corpus)
+        return index
+
+    @property
+    def num_docs(self):
+        return self._num_docs
+
+    @property
+    def vocab_size(self):
+        return len(self.vocab)
+
+    @property
+    def doc_len(self):
+        return self._doc_len[:self._num_docs]
+
+    @property
+    def df(self):
+        return self._df[:len(self.vocab)]
+
+    @property
+    def avgdl(self):
+        return self._total_len / self._num_docs if self._num_docs else 0.0
+
+    def add_documents(self, tokenized_docs):
+        """增量追加文档，代价只与新增文档数量相关
+        Args:
+            tokenized_docs: 已分词的文档列表，或 TokenizedCorpus
+        """
+        if isinstance(tokenized_docs, TokenizedCorpus):
+            self.add_corpus(tokenized_docs)
+            return
+        if not tokenized_docs:
+            return
+        vocab = self.vocab
+        num_new = len(tokenized_docs)
+        lengths = np.fromiter((len(doc) for doc in tokenized_docs), dtype=np.int64, count=num_new)
+
+        # 词 -> 词id，新词追加到词表末尾
+        token_ids = np.fromiter(
+            (vocab.setdefault(token, len(vocab)) for doc in tokenized_docs for token in doc),
+            dtype=np.int64, count=int(lengths.sum())
+        )
+        self._append(token_ids, lengths)
+
+    def add_texts(self, texts, analyzer=DEFAULT_ANALYZER):
+        """对文本分词并追加，词直接编码为词id，不构造每个文档的词列表"""
+        token_ids, lengths = analyzer.encode(texts, self.vocab)
+        if len(lengths):
+            self._append(token_ids, lengths)
+
+    def add_corpus(self, corpus):
+        """追加 TokenizedCorpus（如分词worker写出的分片），其词表先映射到全局词表，
+        词id的转换是一次数组下标操作"""
+        if len(corpus) == 0:
+            return
+        vocab = self.vocab
+        mapping = np.fromiter((vocab.setdefault(term, len(vocab)) for term in corpus.terms),
+                              dtype=np.uint32, count=len(corpus.terms))
+        self._append(mapping[corpus.token_ids], corpus.lengths)
+
+    def _append(self, token_ids, lengths):
+        """以词id数组的形式追加一批文档"""
+        segment = PostingSegment.build(token_ids, lengths, self._num_docs)
+
+        # 增量更新文档频率与文档长度
+        self._df = _ensure_capacity(self._df, len(self.vocab))
+        self._df[segment.term_ids] += np.diff(segment.indptr)
+        self._doc_len = _ensure_capacity(self._doc_len, self._num_docs + len(lengths))
+        self._doc_len[self._num_docs:self._num_docs + len(lengths)] = lengths
+        self._num_docs += len(lengths)
+        self._total_len += int(lengths.sum())
+        self._average_idf = None
+        self._idf_table = None
+
+        with self._lock:
+            self.segments = self.segments + [segment]
+        self._schedule_merges()
+
+    def _find_merge(self):
+        """按合并策略选择下一组要合并的段，返回 (段列表快照, start, end) 或None"""
+        segments = self.segments
+        found = self.merge_policy.find_merge([s.num_docs for s in segments])
+        return None if found is None else (segments, *found)
+
+    def _merge(self, segments, start, end):
+        """合并 segments[start:end]，完成后替换段列表中的这些段
+
+        同一时间只有一个合并在进行，追加只在列表末尾添加段，因此这些段的位置不会变化。
+        """
+        with METRICS.timer('segment_merge_seconds'):
+            merged = PostingSegment.merge(segments[start:end], self._doc_len)
+        METRICS.inc('segment_merges_total')
+        METRICS.inc('segment_merged_docs_total', merged.num_docs)
+        with self._lock:
+            current = self.segments
+            self.segments = current[:start] + [merged] + current[end:]
+
+    def _schedule_merges(self):
+        """追加文档后检查是否需要合并：前台合并直接执行，后台合并启动合并线程"""
+        if not self.background_merge:
+            while (merge := self._find_merge()) is not None:
+                self._merge(*merge)
+            return
+        with self._lock:
+            if self._merge_thread is None and self._find_merge() is not None:
+                self._merge_thread = threading.Thread(target=self._merge_loop, name="segment-merge", daemon=True)
+                self._merge_thread.start()
+
+    def _merge_loop(self):
+        """后台合并线程：合并到合并策略不再选出段为止"""
+        while True:
+            with self._lock:
+                merge = self._find_merge()
+                if merge is None:
+                    self._merge_thread = None
+                    return
+            try:
+                self._merge(*merge)
+            except Exception as e:
+                # 合并失败时原有的段保持不变，错误在 wait_for_merges 时抛出
+                with self._lock:
+                    self._merge_error = e
+                    self._merge_thread = None
+                return
+
+    def wait_for_merges(self):
+        """等待后台合并完成；后台合并失败时抛出其异常"""
+        while (thread := self._merge_thread) is not None:
+            thread.join()
+        if self._merge_error is not None:
+            error, self._merge_error = self._merge_error, None
+            raise error
+
+    def force_merge(self, max_segments=1):
+        """把所有段合并为至多max_segments个（选择文档数最少的相邻段合并）"""
+        self.wait_for_merges()
+        segments = self.segments
+        width = len(segments) - max(max_segments, 1) + 1
+        if width < 2:
+            return
+        sizes = [s.num_docs for s in segments]
+        start = min(range(len(segments) - width + 1), key=lambda i: sum(sizes[i:i + width]))
+        self._merge(segments, start, start + width)
+
+    def _idf(self, term_id):
+        """单个词的idf，与BM25Okapi一致：负idf替换为 epsilon * 平均idf"""
+        if self._idf_table is not None:
+            return self._idf_table[term_id]
+        idf = _raw_idf(self._num_docs, self._df[term_id])
+        if idf < 0:
+            if self._average_idf is None:
+                # 平均idf依赖整个词表，仅在需要时计算并缓存到下次追加
+                self._average_idf = float(_raw_idf(self._num_docs, self.df.astype(np.float64)).mean())
+            idf = self.epsilon * self._average_idf
+        return idf
+
+    def _idf_array(self):
+        """整个词表的idf数组"""
+        idf = _raw_idf(self._num_docs, self.df.astype(np.float64))
+        if len(idf):
+            idf[idf < 0] = self.epsilon * idf.mean()
+        return idf
+
+    def _term_ids(self, query_tokens):
+        """查询词 -> 词id（忽略未登录词，保留重复词）"""
+        term_ids = (self.vocab.get(token) for token in query_tokens)
+        return [term_id for term_id in term_ids if term_id is not None]
+
+    def _term_postings(self, term_id, segments):
+        """拼接所有段中某个词的倒排表（段按文档顺序排列，结果仍有序）"""
+        parts = [p for p in (s.postings(term_id) for s in segments) if p is not None]
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def _bm25(self, idf, tf, dl):
+        """BM25单词得分"""
+        k1, b = self.k1, self.b
+        return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / self.avgdl))
+
+    def score(self, query_tokens):
+        """只对包含查询词的文档打分
+        Args:
+            query_tokens: 已分词的查询
+        Returns:
+            (doc_ids, scores): 命中文档id（升序）及其BM25得分
+        """
+        term_ids = self._term_ids(query_tokens)
+        if not term_ids or not self._num_docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        segments = self.segments
+        return self._accumulate(
+            [self._term_postings(term_id, segments) for term_id in term_ids],
+            [self._idf(term_id) for term_id in term_ids]
+        )
+
+    def top_k(self, query_tokens, top_k=10, prune=True):
+        """返回得分最高的top_k个文档
+        Args:
+            query_tokens: 已分词的查询
+            top_k: 返回的文档数量
+            prune: 是否使用基于得分上界的动态剪枝（结果与穷举一致）
+        Returns:
+            (doc_ids, scores): 按得分降序排列
+        """
+        if top_k <= 0 or not self._num_docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        if prune:
+            segments = self.segments
+            terms = self._query_terms(query_tokens, segments)
+            # 单个词无可剪枝；权重非正时上界不成立，退回穷举
+            if len(terms) > 1 and all(term.weight > 0 for term in terms):
+                return self._pruned_top_k(terms, top_k, segments)
+        doc_ids, scores = self.score(query_tokens)
+        return _select_top_k(doc_ids, scores, top_k)
+
+    def _query_terms(self, query_tokens, segments):
+        """合并重复查询词，为每个词收集各段的位置和块上界"""
+        term_ids, counts = np.unique(np.asarray(self._term_ids(query_tokens), dtype=np.int64), return_counts=True)
+        terms = []
+        for term_id, count in zip(term_ids, counts):
+            # BM25Okapi对重复的查询词重复计分
+            weight = self._idf(term_id) * count
+            parts = [(seg, pos) for seg, pos in ((seg, seg.find(term_id)) for seg in segments) if pos >= 0]
+            block_last = np.concatenate([
+                seg.block_last_doc[seg.block_ptr[pos]:seg.block_ptr[pos + 1]] for seg, pos in parts])
+            block_max_tf = np.concatenate([
+                seg.block_max_tf[seg.block_ptr[pos]:seg.block_ptr[pos + 1]] for seg, pos in parts])
+            block_min_dl = np.concatenate([
+                seg.block_min_dl[seg.block_ptr[pos]:seg.block_ptr[pos + 1]] for seg, pos in parts])
+            block_ub = self._bm25(weight, block_max_tf.astype(np.float64), block_min_dl)
+            terms.append(_QueryTerm(term_id, weight, parts, block_last, block_ub))
+        return terms
+
+    def _term_contribution(self, term, candidates):
+        """在某个词的倒排表中查找候选文档的tf并计算得分（不遍历整个倒排表）
+        Args:
+            term: _QueryTerm
+            candidates: 升序排列的候选文档id
+        """
+        tf = np.zeros(len(candidates), dtype=np.float64)
+        for seg, pos in term.parts:
+            start, end = seg.indptr[pos], seg.indptr[pos + 1]
+            docs = seg.doc_ids[start:end]
+            lo = np.searchsorted(candidates, docs[0])
+            hi = np.searchsorted(candidates, docs[-1], side='right')
+            if lo == hi:
+                continue
+            sub = candidates[lo:hi]
+            idx = np.searchsorted(docs, sub)
+            hit = docs[idx] == sub
+            tf[lo:hi][hit] = seg.tfs[start:end][idx[hit]]
+        scores = self._bm25(term.weight, tf, self._doc_len[candidates])
+        scores[tf == 0] = 0.0
+        return scores
+
+    def _pruned_top_k(self, terms, top_k, segments):
+        """MaxScore + Block-Max 剪枝的精确top-k
+
+        1. 取上界最大的词的倒排表中局部得分最高的k个文档，精确打分得到阈值θ；
+        2. 按上界升序累加，累计上界仍小于θ的词为“非必要词”：
+           只含非必要词的文档不可能进入top-k，其倒排表不需要遍历；
+        3. 只遍历必要词的倒排表得到候选及其部分得分，并用部分得分提高θ；
+        4. 用非必要词的词级上界和候选所在块的块最大得分估计上界，
+           上界小于θ的候选直接丢弃；
+        5. 剩余候选按上界从大到小在非必要词的倒排表中二分查找tf，
+           每补全一个词后再用剩余上界剪枝一次，最后取top-k。
+        """
+        terms = sorted(terms, key=lambda term: term.upper_bound)
+        doc_len = self._doc_len
+
+        # 1. 估计阈值
+        first = terms[-1]
+        docs, tfs = self._term_postings(first.term_id, segments)
+        partial = self._bm25(first.weight, tfs.astype(np.float64), doc_len[docs])
+        if len(docs) > top_k:
+            docs = docs[np.argpartition(-partial, top_k - 1)[:top_k]]
+        seeds = np.sort(docs).astype(np.int64)
+        seed_scores = sum(self._term_contribution(term, seeds) for term in terms)
+        theta = _kth_largest(seed_scores, top_k)
+
+        # 2. 划分必要词与非必要词
+        bounds = np.cumsum([term.upper_bound for term in terms])
+        num_optional = int(np.searchsorted(bounds, theta, side='left'))
+        optional, essential = terms[:num_optional], terms[num_optional:]
+        if not essential:
+            return _select_top_k(seeds, seed_scores, top_k)
+
+        # 3. 遍历必要词的倒排表；得分只会增加，部分得分的第k大值也是θ的下界
+        candidates, scores = self._accumulate(
+            [self._term_postings(term.term_id, segments) for term in essential],
+            [term.weight for term in essential]
+        )
+        theta = max(theta, _kth_largest(scores, top_k))
+        if not optional:
+            return _select_top_k(candidates, scores, top_k)
+
+        # 4. 词级上界与块级上界剪枝
+        remaining = float(bounds[num_optional - 1])
+        keep = scores + remaining >= theta
+        candidates, scores = candidates[keep], scores[keep]
+        upper = scores.copy()
+        for term in optional:
+            idx = np.searchsorted(term.block_last, candidates)
+            inside = idx < len(term.block_last)
+            upper[inside] += term.block_ub[idx[inside]]
+        keep = upper >= theta
+        candidates, scores = candidates[keep], scores[keep]
+
+        # 5. 补全非必要词的得分
+        for term in reversed(optional):
+            scores += self._term_contribution(term, candidates)
+            remaining -= term.upper_bound
+            keep = scores + remaining >= theta
+            candidates, scores = candidates[keep], scores[keep]
+
+        return _select_top_k(candidates, scores, top_k)
+
+    def _accumulate(self, postings, weights):
+        """累加多个词的BM25得分
+        Args:
+            postings: [(doc_ids, tfs)]
+            weights: 每个词的权重（idf乘以查询词频）
+        Returns:
+            (doc_ids, scores): 命中文档id（升序）及累加得分
+        """
+        docs = np.concatenate([p[0] for p in postings])
+        contributions = np.concatenate([
+            self._bm25(weight, tfs.astype(np.float64), self._doc_len[p_docs])
+            for (p_docs, tfs), weight in zip(postings, weights)
+        ])
+        if len(docs) * 8 > self._num_docs:
+            # 命中较多时用稠密数组累加，避免排序
+            hit = np.zeros(self._num_docs, dtype=bool)
+            hit[docs] = True
+            doc_ids = np.flatnonzero(hit)
+            scores = np.bincount(docs, weights=contributions, minlength=self._num_docs)[doc_ids]
+        else:
+            doc_ids, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=contributions, minlength=len(doc_ids))
+        return doc_ids.astype(np.int64), scores
+
+    def save(self, directory, previous=None):
+        """保存为版本化的目录格式，所有数组均可内存映射加载
+        Args:
+            directory: 保存目录（不能是当前索引内存映射的目录）
+            previous: 之前保存过的索引目录；其中已有的段以硬链接复用，只写入新段
+
+        目录结构：
+            meta.json                   格式版本、BM25参数、全局统计量、段列表
+            vocab_*.npy                 词表（见 vocabulary.save_vocabulary）
+            df.npy / doc_len.npy / idf.npy
+            segments/<n>/*.npy          每个倒排表段的CSR数组及块信息
+        """
+        os.makedirs(directory, exist_ok=True)
+        save_vocabulary(self.vocab, directory)
+        save_array(directory, "df", self.df)
+        save_array(directory, "doc_len", self.doc_len)
+        save_array(directory, "idf", self._idf_array())
+
+        saved = {}
+        if previous is not None and InvertedIndex.exists(previous):
+            saved = {seg['name']: seg for seg in read_json(os.path.join(previous, "meta.json"))['segments']}
+
+        segments = []
+        for segment in self.segments:
+            if segment.name is None:
+                segment.name = uuid.uuid4().hex[:16]
+            entry = {'name': segment.name, 'doc_start': segment.doc_start,
+                     'num_docs': segment.num_docs, 'num_postings': segment.num_postings}
+            target = os.path.join(directory, "segments", segment.name)
+            if saved.get(segment.name) == entry:
+                segment.link(os.path.join(previous, "segments", segment.name), target)
+            else:
+                segment.save(target)
+            segments.append(entry)
+
+        write_json(os.path.join(directory, "meta.json"), {
+            'format_version': INDEX_FORMAT_VERSION,
+            'k1': self.k1,
+            'b': self.b,
+            'epsilon': self.epsilon,
+            'merge_factor': self.merge_factor,
+            'num_docs': self._num_docs,
+            'total_len': self._total_len,
+            'vocab_size': self.vocab_size,
+            'segments': segments
+        })
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """加载索引，默认以只读内存映射方式打开所有数组
+        Args:
+            directory: 索引目录
+            mmap: 是否内存映射（多个进程可通过页缓存共享同一份索引）
+        """
+        meta = read_json(os.path.join(directory, "meta.json"))
+        if meta.get('format_version') not in SUPPORTED_FORMAT_VERSIONS:
+            raise ValueError(f"Unsupported index format version: {meta.get('format_version')}")
+
+        index = cls(k1=meta['k1'], b=meta['b'], epsilon=meta['epsilon'], merge_factor=meta['merge_factor'])
+        index.vocab = MmapVocabulary(directory)
+        index._df = load_array(directory, "df", mmap)
+        index._doc_len = load_array(directory, "doc_len", mmap)
+        index._idf_table = load_array(directory, "idf", mmap)
+        index._num_docs = meta['num_docs']
+        index._total_len = meta['total_len']
+        index.segments = [
+            PostingSegment.load(os.path.join(directory, "segments", seg['name']),
+                                seg['doc_start'], seg['num_docs'], index._doc_len, mmap)
+            for seg in meta['segments']
+        ]
+        return index
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, "meta.json"))
@@ -0,0 +1,73 @@
+import math
+
+
+class TieredMergePolicy:
+    """分层段合并策略（参考Lucene的TieredMergePolicy）
+
+    段按文档数分层：最小一层的段大小为最小的段（至少floor_docs），每上一层乘以max_merge_at_once，
+    每层最多允许segments_per_tier个段。段总数超过这个预算时，在文档区间相邻的
+    至多max_merge_at_once个段中选出大小最均衡（最大段占比最小）、总量较小的一组合并。
+    合并后的段不会超过max_segment_docs，大于它一半的段不再参与合并。
+    """
+
+    def __init__(self, segments_per_tier=8, max_merge_at_once=8, floor_docs=1000, max_segment_docs=5_000_000):
+        """
+        Args:
+            segments_per_tier: 每层允许的段数，越小段越少（查询越快），合并越频繁
+            max_merge_at_once: 一次最多合并的段数
+            floor_docs: 小于该文档数的段按该大小计，避免大量极小的段
+            max_segment_docs: 合并产生的段的文档数上限
+        """
+        if segments_per_tier < 2 or max_merge_at_once < 2:
+            raise ValueError("segments_per_tier and max_merge_at_once must be at least 2")
+        self.segments_per_tier = segments_per_tier
+        self.max_merge_at_once = max_merge_at_once
+        self.floor_docs = floor_docs
+        self.max_segment_docs = max_segment_docs
+
+    def _floored(self, size):
+        return max(size, self.floor_docs)
+
+    def allowed_segments(self, sizes):
+        """给定各段文档数，返回不需要合并时允许存在的段数"""
+        eligible = [size for size in sizes if size <= self.max_segment_docs // 2]
+        remaining = sum(self._floored(size) for size in eligible)
+        # 最小一层从最小的段（至少floor_docs）开始计
+        level = max(min(eligible, default=0), self.floor_docs, 1)
+        allowed = len(sizes) - len(eligible)
+        while True:
+            count = remaining / level
+            if count < self.segments_per_tier or level >= self.max_segment_docs:
+                allowed += math.ceil(count)
+                break
+            allowed += self.segments_per_tier
+            remaining -= self.segments_per_tier * level
+            level = min(self.max_segment_docs, level * self.max_merge_at_once)
+        return max(allowed, self.segments_per_tier)
+
+    def find_merge(self, sizes):
+        """选择下一次要合并的段
+        Args:
+            sizes: 按文档区间排列的各段文档数
+        Returns:
+            (start, end): 合并 sizes[start:end] 这些相邻的段；不需要合并时返回None
+        """
+        if len(sizes) <= self.allowed_segments(sizes):
+            return None
+        best, best_score = None, None
+        for start in range(len(sizes)):
+            total = 0
+            largest = 0
+            for end in range(start + 1, min(len(sizes), start + self.max_merge_at_once) + 1):
+                size = sizes[end - 1]
+                if size > self.max_segment_docs // 2 or total + size > self.max_segment_docs:
+                    break
+                total += self._floored(size)
+                largest = max(largest, self._floored(size))
+                if end - start < 2:
+                    continue
+                # 最大段占比越小（大小越均衡）越好，总量越小越好（影响较弱）
+                score = largest / total * total ** 0.05
+                if best_score is None or score < best_score:
+                    best, best_score = (start, end), score
+        return best
@@ -0,0 +1,280 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+from bisect import bisect_left
+import yaml
+from .config import DEFAULT_CONFIG_PATH
+
+DEFAULT_METRICS_CONFIG = {
+    'enabled': False,
+    'namespace': 'rag',
+}
+
+# 设置该环境变量（1/0）时覆盖配置中的enabled
+METRICS_ENV = "RAG_METRICS"
+
+# 计时直方图的桶上限（秒）
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def load_metrics_config(path=None, overrides=None):
+    """读取指标配置（config.yaml中的metrics段），缺省项使用DEFAULT_METRICS_CONFIG
+    Args:
+        path: 配置文件路径，默认为 config/config.yaml
+        overrides: 覆盖配置文件的dict
+    """
+    config = dict(DEFAULT_METRICS_CONFIG)
+    path = path or DEFAULT_CONFIG_PATH
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config.update((yaml.safe_load(f) or {}).get('metrics') or {})
+    if os.environ.get(METRICS_ENV):
+        config['enabled'] = os.environ[METRICS_ENV] not in ('0', 'false', 'False')
+    if overrides:
+        config.update(overrides)
+    return config
+
+
+def peak_rss_bytes():
+    """当前进程的峰值RSS
+
+    Linux上读取 /proc/self/status 的VmHWM（ru_maxrss 在exec后保留父进程的峰值）。
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # macOS上ru_maxrss的单位为字节，Linux上为KB
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def process_memory(pid='self'):
+    """进程的内存占用（字节）
+
+    读取 /proc/<pid>/smaps_rollup：rss 为常驻内存（共享页在每个进程中都计入），
+    pss 把共享页按共享的进程数均摊，uss 为进程独占的页。多个进程映射同一份索引时，
+    各进程 pss 之和才是实际占用的物理内存。不支持的平台返回空dict。
+    """
+    fields = {'Rss:': 'rss', 'Pss:': 'pss', 'Private_Clean:': 'uss', 'Private_Dirty:': 'uss'}
+    memory = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if parts and parts[0] in fields:
+                    name = fields[parts[0]]
+                    memory[name] = memory.get(name, 0) + int(parts[1]) * 1024
+    except OSError:
+        return {}
+    return memory
+
+
+class _NullTimer:
+    """未启用指标时使用的空计时器"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('registry', 'key', 'start')
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class _Histogram:
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self, num_buckets):
+        self.counts = [0] * (num_buckets + 1)    # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    """进程内的计数器、仪表和计时直方图
+
+    指标由名称和标签确定，如 query_stage_seconds{retriever="bm25s", stage="tokenize"}。
+    未启用时 timer() 返回共享的空计时器，inc/observe/set 直接返回，
+    开销只有一次属性检查。可导出为Prometheus文本格式或JSON。
+
+    指标只在本进程内累计。多进程服务中每个工作进程有自己的注册表，并设置
+    labels = {'worker': 编号}，导出的每个指标都带上该标签：每次抓取只返回接受连接的
+    那个工作进程的指标，各工作进程的序列互不覆盖，需要时在Prometheus中按worker求和。
+    """
+
+    def __init__(self, enabled=False, namespace='rag', buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            enabled: 是否记录指标
+            namespace: 导出为Prometheus格式时指标名的前缀
+            buckets: 计时直方图的桶上限（秒），升序
+        """
+        self.enabled = enabled
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        # 附加到所有导出指标的标签（如多进程服务中的 worker）
+        self.labels = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        """按 load_metrics_config 的结果设置是否启用和前缀"""
+        self.enabled = bool(config['enabled'])
+        self.namespace = config['namespace']
+
+    def timer(self, name, **labels):
+        """计时上下文管理器，退出时把耗时（秒）记入直方图name"""
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, _key(name, labels))
+
+    def observe(self, name, value, **labels):
+        """把一个值（如耗时）记入直方图name"""
+        if self.enabled:
+            self._observe(_key(name, labels), value)
+
+    def _observe(self, key, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self.buckets))
+            histogram.counts[index] += 1
+            histogram.count += 1
+            histogram.sum += value
+
+    def inc(self, name, value=1, **labels):
+        """计数器加value"""
+        if self.enabled:
+            key = _key(name, labels)
+            with self._lock:
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """设置仪表的值"""
+        if self.enabled:
+            with self._lock:
+                self._gauges[_key(name, labels)] = value
+
+    def set_max(self, name, value, **labels):
+        """仪表只在value更大时更新（如内存峰值）"""
+        if self.enabled:
+            key = _key(name, labels)
+            with self._lock:
+                self._gauges[key] = max(self._gauges.get(key, value), value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """所有指标的当前值（可JSON序列化）"""
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(self.labels, **dict(labels)), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            gauges = [{'name': name, 'labels': dict(self.labels, **dict(labels)), 'value': value}
+                      for (name, labels), value in sorted(self._gauges.items())]
+            histograms = [{
+                'name': name,
+                'labels': dict(self.labels, **dict(labels)),
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'mean': histogram.sum / histogram.count if histogram.count else 0.0,
+                'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], histogram.counts)),
+            } for (name, labels), histogram in sorted(self._histograms.items())]
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """导出为Prometheus文本格式（直方图的桶为累计计数）"""
+        prefix = f"{self.namespace}_" if self.namespace else ''
+        common = tuple(sorted(self.labels.items()))
+        lines = []
+        with self._lock:
+            for kind, metrics in (('counter', self._counters), ('gauge', self._gauges)):
+                declared = set()
+                for (name, labels), value in sorted(metrics.items()):
+                    labels = common + labels
+                    if name not in declared:
+                        lines.append(f"# TYPE {prefix}{name} {kind}")
+                        declared.add(name)
+                    lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+            declared = set()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                labels = common + labels
+                if name not in declared:
+                    lines.append(f"# TYPE {prefix}{name} histogram")
+                    declared.add(name)
+                cumulative = 0
+                for bound, count in zip(list(self.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{prefix}{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{prefix}{name}_count{_format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """写入文件：扩展名为 .prom 时为Prometheus文本格式，否则为JSON"""
+        data = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+# 进程内共享的指标注册表，默认不启用，由 configure_metrics 按配置启用
+METRICS = MetricsRegistry()
+
+
+def configure_metrics(path=None, overrides=None):
+    """按配置文件（及 RAG_METRICS 环境变量）设置全局 METRICS，返回配置"""
+    config = load_metrics_config(path, overrides)
+    METRICS.configure(config)
+    return config
@@ -0,0 +1,24 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def default_num_workers():
+    """默认并行度：当前进程可用的CPU核数"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def parallel_map(func, items, num_workers=None):
+    """多线程执行func，结果顺序与输入一致
+
+    BM25查询的主要开销在numpy的排序、索引等操作上，这些操作会释放GIL，
+    索引数组是只读的，因此多个线程可以安全地共享同一个检索器。
+    """
+    items = list(items)
+    num_workers = min(num_workers or default_num_workers(), len(items))
+    if num_workers <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(func, items))
@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+from .service import SearchService, load_service_config
+from .metrics import METRICS, process_memory
+
+
+def _set_worker_threads(num_threads):
+    """设置已导入的torch/faiss的线程数（不为此导入它们）"""
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(num_threads)
+    if 'faiss' in sys.modules:
+        sys.modules['faiss'].omp_set_num_threads(num_threads)
+
+
+class PreforkServer:
+    """预先fork的多进程查询服务
+
+    主进程加载索引并绑定监听socket后fork出workers个工作进程，每个工作进程用继承的socket
+    运行自己的 SearchService（事件循环和微批队列），由内核在进程间分配连接。
+    索引以只读内存映射方式打开（倒排表段、文档存储、FAISS索引），其页在页缓存中只有一份，
+    所有工作进程共享，内存不随进程数增加。编码模型和GPU资源（CUDA上下文、torch线程池）
+    不能跨fork使用，由每个工作进程在fork之后加载；主进程中的FAISS索引必须留在CPU上。
+    工作进程退出时主进程等待一段时间（连续快速退出时加倍）后重新fork一个，
+    连续快速退出的次数超过 max_restarts 时停止服务。
+    每个工作进程的 METRICS 各自累计，/metrics 导出的指标带 worker 标签（见 MetricsRegistry）。
+    """
+
+    def __init__(self, loader, config=None, config_path=None):
+        """
+        Args:
+            loader: 已加载检索器的 IndexLoader（fork前加载，FAISS索引用 load_faiss_index(gpu=False)
+                    加载，不要在主进程中加载编码模型或执行查询）
+            config: 覆盖配置文件的dict（如 {'workers': 4}）
+            config_path: 配置文件路径，默认为 config/config.yaml
+        """
+        self.loader = loader
+        self.config = load_service_config(config_path, config)
+        self.num_workers = max(1, int(self.config['workers']))
+        self.worker_threads = self.config['worker_threads'] or max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.workers = {}       # pid -> 编号
+        self.sock = None
+        self._stopping = False
+        self._started = {}      # 编号 -> 启动时间
+        self._failures = {}     # 编号 -> 连续快速退出的次数
+        self._restarts = {}     # 编号 -> 计划重新fork的时间
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def start(self):
+        """绑定监听socket并fork出全部工作进程（主进程中立即返回）"""
+        faiss_retriever = self.loader.faiss_retriever
+        if faiss_retriever is not None and faiss_retriever.on_gpu:
+            raise RuntimeError("The FAISS index is already on the GPU; load it with load_faiss_index(gpu=False) "
+                               "so that each worker moves it to the GPU after fork")
+        self.sock = socket.create_server((self.config['host'], self.config['port']), backlog=1024)
+        self.sock.setblocking(False)
+        for number in range(self.num_workers):
+            self._spawn(number)
+        print(f"Search service listening on port {self.port} with {self.num_workers} workers "
+              f"({self.worker_threads} threads each)")
+
+    def _spawn(self, number):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker(number)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = number
+        self._started[number] = time.monotonic()
+
+    def _run_worker(self, number):
+        # 主进程的信号处理不继承到工作进程：SIGTERM直接退出，SIGINT由主进程处理
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # 指标从fork时的状态开始按工作进程分别累计，以worker标签区分
+        METRICS.labels = dict(METRICS.labels, worker=str(number))
+        faiss_retriever = self.loader.faiss_retriever
+        if faiss_retriever is not None:
+            # GPU资源和编码模型在fork之后各自加载，避免第一批请求等待
+            faiss_retriever.move_to_gpu()
+            faiss_retriever.load_encoder()
+        _set_worker_threads(self.worker_threads)
+        service = SearchService.from_loader(self.loader, self.config)
+        asyncio.run(service.serve_forever(sock=self.sock))
+
+    def worker_memory(self):
+        """{pid: {'rss': ..., 'pss': ..., 'uss': ...}}，单位字节"""
+        return {pid: process_memory(pid) for pid in self.workers}
+
+    def report_memory(self):
+        """打印各工作进程的内存；pss之和为工作进程实际占用的物理内存"""
+        memory = self.worker_memory()
+        lines = [f"  worker {self.workers[pid]} (pid {pid}): " +
+                 " ".join(f"{name}={value / 2 ** 20:.1f}MB" for name, value in sorted(usage.items()))
+                 for pid, usage in memory.items()]
+        total_pss = sum(usage.get('pss', 0) for usage in memory.values())
+        print(f"Worker memory (total pss {total_pss / 2 ** 20:.1f}MB):\n" + "\n".join(lines))
+
+    def stop(self, timeout=10):
+        """向工作进程发送SIGTERM并等待退出"""
+        self._stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            del self.workers[pid]
+        if self.sock is not None:
+            self.sock.close()
+
+    def _reap(self):
+        """回收已退出的工作进程，返回它们的编号"""
+        exited = []
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            number = self.workers.pop(pid, None)
+            if number is not None:
+                exited.append((number, status))
+        return exited
+
+    def _schedule_restart(self, number, status, now):
+        """计划重新fork退出的工作进程：存活不足 crash_window_s 的连续退出使等待时间加倍，
+        次数超过 max_restarts 时抛出RuntimeError"""
+        uptime = now - self._started.pop(number, now)
+        failures = self._failures.get(number, 0) + 1 if uptime < self.config['crash_window_s'] else 1
+        self._failures[number] = failures
+        if failures > self.config['max_restarts']:
+            raise RuntimeError(f"Worker {number} exited {failures} times in a row within "
+                               f"{self.config['crash_window_s']}s of starting, giving up")
+        delay = min(self.config['restart_backoff_s'] * 2 ** (failures - 1), self.config['restart_backoff_max_s'])
+        print(f"Worker {number} exited with status {status} after {uptime:.1f}s, restarting in {delay:.1f}s")
+        self._restarts[number] = now + delay
+
+    def serve_forever(self):
+        """启动工作进程，定期打印内存，退出的工作进程按退避时间重新fork；SIGINT/SIGTERM时停止全部进程
+
+        工作进程反复在启动后很快退出（超过 max_restarts 次）时停止全部进程并抛出RuntimeError。
+        """
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.start()
+        report_interval = self.config['memory_report_s']
+        next_report = time.monotonic() + min(report_interval, 5) if report_interval else None
+        try:
+            while True:
+                now = time.monotonic()
+                for number, status in self._reap():
+                    self._schedule_restart(number, status, now)
+                for number, restart_at in list(self._restarts.items()):
+                    if now >= restart_at:
+                        del self._restarts[number]
+                        self._spawn(number)
+                if next_report is not None and now >= next_report:
+                    self.report_memory()
+                    next_report = now + report_interval
+                time.sleep(0.1)
+        except (KeyboardInterrupt, SystemExit):
+            print("Stopping workers...")
+        finally:
+            self.stop()
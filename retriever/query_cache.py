@@ -0,0 +1,210 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import yaml
+from .config import DEFAULT_CONFIG_PATH
+
+DEFAULT_QUERY_CACHE_CONFIG = {
+    'enabled': True,
+    'result_max_entries': 10000,
+    'result_ttl_seconds': 600,
+    'embedding_max_entries': 50000,
+    'lowercase': False,
+}
+
+
+def load_query_cache_config(path=None, overrides=None):
+    """读取查询缓存配置（config.yaml中的query_cache段），缺省项使用DEFAULT_QUERY_CACHE_CONFIG
+    Args:
+        path: 配置文件路径，默认为 config/config.yaml
+        overrides: 覆盖配置文件的dict
+    """
+    config = dict(DEFAULT_QUERY_CACHE_CONFIG)
+    path = path or DEFAULT_CONFIG_PATH
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config.update((yaml.safe_load(f) or {}).get('query_cache') or {})
+    if overrides:
+        config.update(overrides)
+    return config
+
+
+def unwrap_retriever(retriever):
+    """CachedRetriever 包装的检索器返回被包装的检索器，其余原样返回"""
+    return retriever.retriever if isinstance(retriever, CachedRetriever) else retriever
+
+
+def _copy_results(results):
+    """复制结果列表及其中的dict（含嵌套的metadata、scores），调用方修改结果不会影响缓存"""
+    return [{key: dict(value) if isinstance(value, dict) else value for key, value in result.items()}
+            if isinstance(result, dict) else result for result in results]
+
+
+class LRUCache:
+    """线程安全的LRU缓存，可选TTL，记录命中/未命中/淘汰/过期次数"""
+
+    def __init__(self, max_entries, ttl=None, clock=time.monotonic):
+        """
+        Args:
+            max_entries: 最多缓存的条目数，为0时不缓存
+            ttl: 条目的有效期（秒），为None时不过期
+            clock: 返回当前时间（秒）的函数
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()    # key -> (写入时间, value)，按最近访问排序
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and self.clock() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """命中率统计"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedRetriever:
+    """为任意检索器加上查询缓存
+
+    - 结果缓存：键为 (规范化后的查询, top_k, 其他查询参数, 索引版本)，条目有TTL；
+      被包装检索器的 index_version 变化（追加文档、重建或重新加载索引）时清空。
+    - 查询向量缓存：被包装的检索器有 query_embedding_cache 属性时（如FaissRetriever）
+      注入一个LRU缓存，相同查询不再重复运行编码模型。
+
+    search / search_batch / retrieve 走缓存，返回缓存结果的副本；其余属性和方法转发给
+    被包装的检索器。
+    """
+
+    def __init__(self, retriever, config=None, config_path=None):
+        """
+        Args:
+            retriever: 被包装的检索器（需要实现 search，search_batch 可选）
+            config: 覆盖配置文件的dict（如 {'result_ttl_seconds': 60}）
+            config_path: 配置文件路径，默认为 config/config.yaml
+        """
+        self.retriever = retriever
+        self.config = load_query_cache_config(config_path, config)
+        self.result_cache = LRUCache(self.config['result_max_entries'], self.config['result_ttl_seconds'])
+        self.embedding_cache = LRUCache(self.config['embedding_max_entries'])
+        self._index_version = getattr(retriever, 'index_version', None)
+        self.invalidations = 0
+        if self.config['enabled'] and hasattr(retriever, 'query_embedding_cache'):
+            retriever.query_embedding_cache = self.embedding_cache
+
+    def __getattr__(self, name):
+        return getattr(self.retriever, name)
+
+    def normalize_query(self, query):
+        """字符串查询合并空白字符（可选转小写）；分词后的查询转为tuple"""
+        if isinstance(query, str):
+            query = ' '.join(query.split())
+            return query.lower() if self.config['lowercase'] else query
+        return tuple(query)
+
+    def _current_version(self):
+        """检查索引版本，变化时清空结果缓存"""
+        version = getattr(self.retriever, 'index_version', None)
+        if version != self._index_version:
+            self.result_cache.clear()
+            self._index_version = version
+            self.invalidations += 1
+        return version
+
+    def _key(self, query, top_k, kwargs, version):
+        return self.normalize_query(query), top_k, tuple(sorted(kwargs.items())), version
+
+    @staticmethod
+    def _call_args(top_k, kwargs):
+        # top_k为None时使用被包装检索器自己的默认值
+        return kwargs if top_k is None else dict(kwargs, top_k=top_k)
+
+    def search(self, query, top_k=None, **kwargs):
+        """检索单个查询，结果与被包装检索器的 search 相同"""
+        if not self.config['enabled']:
+            return self.retriever.search(query, **self._call_args(top_k, kwargs))
+        key = self._key(query, top_k, kwargs, self._current_version())
+        results = self.result_cache.get(key)
+        if results is None:
+            results = self.retriever.search(query, **self._call_args(top_k, kwargs))
+            self.result_cache.put(key, _copy_results(results))
+            return results
+        return _copy_results(results)
+
+    def search_batch(self, queries, top_k=None, **kwargs):
+        """批量检索：命中缓存的查询直接返回，其余（去重后）交给被包装检索器的 search_batch"""
+        if not self.config['enabled']:
+            return self.retriever.search_batch(queries, **self._call_args(top_k, kwargs))
+        version = self._current_version()
+        keys = [self._key(query, top_k, kwargs, version) for query in queries]
+        results = [self.result_cache.get(key) for key in keys]
+
+        pending = {}    # key -> 查询，同一批中的重复查询只检索一次
+        for query, key, result in zip(queries, keys, results):
+            if result is None:
+                pending.setdefault(key, query)
+        if pending:
+            if hasattr(self.retriever, 'search_batch'):
+                fetched = self.retriever.search_batch(list(pending.values()), **self._call_args(top_k, kwargs))
+            else:
+                fetched = [self.retriever.search(query, **self._call_args(top_k, kwargs))
+                           for query in pending.values()]
+            fetched = dict(zip(pending, fetched))
+            for key, result in fetched.items():
+                self.result_cache.put(key, _copy_results(result))
+        return [_copy_results(fetched[key] if result is None else result) for key, result in zip(keys, results)]
+
+    def retrieve(self, query, top_k=5):
+        """检索相关文档，返回文档文本列表"""
+        return [result['document'] for result in self.search(query, top_k)]
+
+    def stats(self):
+        """结果缓存与查询向量缓存的统计"""
+        return {
+            'results': self.result_cache.stats(),
+            'query_embeddings': self.embedding_cache.stats(),
+            'invalidations': self.invalidations,
+        }
@@ -1,62 +1,96 @@
-from rank_bm25 import BM25Okapi
-import numpy as np
+import os
 import pickle
+import tempfile
+from .inverted_index import InvertedIndex
+from .document_store import DocumentStore, save_documents, open_documents
+from .storage import replace_directory
+from .parallel import parallel_map
+from .metrics import METRICS
 
 class RankBM25Retriever:
     def __init__(self, tokenized_documents=None, raw_documents=None):
         """初始化检索器"""
-        self.tokenized_documents = tokenized_documents if tokenized_documents else []
-        self.raw_documents = raw_documents if raw_documents else []
+        # 倒排表中已经包含了分词信息，文档文本只保存在原始文档（raw_documents）中
+        # 复制传入的列表，避免与调用方（或其他检索器）共用同一个list而被重复追加
+        self.raw_documents = raw_documents if isinstance(raw_documents, DocumentStore) else list(raw_documents or [])
         self.bm25 = None
+        # 索引内容变化时递增，查询缓存据此使旧结果失效
+        self.index_version = 0
         if tokenized_documents:
-            self._build_index()
-            
-    def _build_index(self):
-        """构建BM25索引"""
-        self.bm25 = BM25Okapi(self.tokenized_documents)
-        
+            self._build_index(tokenized_documents)
+
+    def _build_index(self, tokenized_documents):
+        """构建BM25倒排索引"""
+        self.bm25 = InvertedIndex.from_corpus(tokenized_documents)
+
     def _save_bm25_params(self):
         """保存BM25模型的参数"""
         if self.bm25 is not None:
             return {
-                'idf': self.bm25.idf,
-                'doc_len': self.bm25.doc_len,
-                'avgdl': self.bm25.avgdl,
+                'k1': self.bm25.k1,
+                'b': self.bm25.b,
                 'epsilon': self.bm25.epsilon
             }
         return None
-        
+
     def _load_bm25_params(self, params):
-        """从参数重建BM25模型"""
-        if params and self.tokenized_documents:
-            self._build_index()
-            self.bm25.idf = params['idf']
-            self.bm25.doc_len = params['doc_len']
-            self.bm25.avgdl = params['avgdl']
-            self.bm25.epsilon = params['epsilon']
-            
+        """从参数恢复BM25模型（idf等统计量在查询时由倒排表计算）"""
+        if params and self.bm25 is not None:
+            self.bm25.k1 = params.get('k1', self.bm25.k1)
+            self.bm25.b = params.get('b', self.bm25.b)
+            self.bm25.epsilon = params.get('epsilon', self.bm25.epsilon)
+
+    @classmethod
+    def from_index(cls, index, raw_documents):
+        """用已构建好的倒排索引和原始文档创建检索器（如IndexBuilder合并分片后）"""
+        instance = cls(raw_documents=raw_documents)
+        instance.bm25 = index
+        return instance
+
     def add_documents(self, new_tokenized_docs, new_raw_docs):
-        """添加新文档到索引"""
-        self.tokenized_documents.extend(new_tokenized_docs)
+        """添加新文档到索引（增量更新，不重建已有倒排表）"""
         self.raw_documents.extend(new_raw_docs)
-        self._build_index()
-        
+        if self.bm25 is None:
+            self._build_index(new_tokenized_docs)
+        else:
+            self.bm25.add_documents(new_tokenized_docs)
+        self.index_version += 1
+
     def save(self, path):
-        """保存检索器到文件"""
-        save_data = {
-            'tokenized_documents': self.tokenized_documents,
-            'raw_documents': self.raw_documents,
-            'bm25_params': self._save_bm25_params()
-        }
-        with open(path, 'wb') as f:
-            pickle.dump(save_data, f)
-            
+        """保存检索器到目录
+        Args:
+            path: 保存目录。倒排索引为可内存映射的数组，原始文档压缩保存在
+                  raw_documents/ 下（是共享的文档存储时只保存链接）。
+                  先写入临时目录再整体替换，不会破坏正在被映射的旧索引；
+                  目录中已有的倒排表段以硬链接复用，只写入新段。
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=".bm25-", dir=parent)
+        if self.bm25 is not None:
+            self.bm25.save(tmp_path, previous=path)
+        save_documents(self.raw_documents, os.path.join(tmp_path, "raw_documents"),
+                       os.path.join(path, "raw_documents"))
+        replace_directory(tmp_path, path)
+
     @classmethod
     def load(cls, path):
-        """从文件加载检索器"""
+        """从目录加载检索器（内存映射，文档按需读取）；兼容旧的pickle文件"""
+        if os.path.isfile(path):
+            return cls._load_pickle(path)
+
+        instance = cls()
+        if InvertedIndex.exists(path):
+            instance.bm25 = InvertedIndex.load(path)
+        instance.raw_documents = open_documents(os.path.join(path, "raw_documents"))
+        return instance
+
+    @classmethod
+    def _load_pickle(cls, path):
+        """加载旧版本保存的bm25.pkl"""
         with open(path, 'rb') as f:
             data = pickle.load(f)
-            
+
         instance = cls(
             tokenized_documents=data['tokenized_documents'],
             raw_documents=data['raw_documents']
@@ -64,30 +98,47 @@ class RankBM25Retriever:
         instance._load_bm25_params(data['bm25_params'])
         return instance
 
-    def search(self, tokenized_query, top_k=10):
+    def search(self, tokenized_query, top_k=10, prune=True):
         """搜索最相关的文档
         Args:
             tokenized_query: 已分词的查询词列表
             top_k: 返回的文档数量
+            prune: 是否启用动态剪枝的top-k查询（结果精确）
         Returns:
             list: 包含相关文档的列表，每个文档是一个dict
         """
         if not self.bm25:
             return []
-            
-        # 获取文档得分
-        doc_scores = self.bm25.get_scores(tokenized_query)
-        
-        # 获取top_k个最相关文档的索引
-        top_indices = np.argsort(doc_scores)[-top_k:][::-1]
-        
+
+        # 只对包含查询词的文档打分，并取top_k
+        with METRICS.timer('query_stage_seconds', retriever='bm25', stage='index_search'):
+            top_indices, top_scores = self.bm25.top_k(tokenized_query, top_k, prune=prune)
+
+        # 只读取top_k命中的文档
+        with METRICS.timer('query_stage_seconds', retriever='bm25', stage='doc_fetch'):
+            raw_documents = [self.raw_documents[idx] for idx in top_indices]
+
         # 构建结果
-        results = []
-        for idx in top_indices:
-            results.append({
-                'score': float(doc_scores[idx]),
-                'metadata': self.raw_documents[idx],
-                'document': ' '.join(self.tokenized_documents[idx])
-            })
-            
-        return results
\ No newline at end of file
+        with METRICS.timer('query_stage_seconds', retriever='bm25', stage='format'):
+            results = [{
+                'doc_id': int(idx),
+                'score': float(score),
+                'metadata': raw_document,
+                'document': raw_document.get('text', '')
+            } for idx, score, raw_document in zip(top_indices, top_scores, raw_documents)]
+        METRICS.inc('queries_total', retriever='bm25')
+
+        return results
+
+    def search_batch(self, tokenized_queries, top_k=10, num_workers=None, prune=True):
+        """批量搜索，多个查询在线程池中并行执行
+        Args:
+            tokenized_queries: 已分词的查询列表
+            top_k: 每个查询返回的文档数量
+            num_workers: 并行线程数，默认为可用CPU核数
+            prune: 是否启用动态剪枝的top-k查询
+        Returns:
+            list: 与输入顺序一致的结果列表，每项与 search() 的返回值相同
+        """
+        return parallel_map(lambda query: self.search(query, top_k, prune=prune),
+                            tokenized_queries, num_workers)
@@ -0,0 +1,414 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+import yaml
+from .config import DEFAULT_CONFIG_PATH
+from .query_cache import CachedRetriever, unwrap_retriever
+from .rank_bm25_retriever import RankBM25Retriever
+from .analyzer import DEFAULT_ANALYZER
+from .metrics import METRICS, process_memory
+
+DEFAULT_SERVICE_CONFIG = {
+    'host': '127.0.0.1',
+    'port': 8000,
+    'index_dir': './indexes',
+    'retrievers': ['bm25', 'bm25s'],
+    'default_retriever': None,
+    'default_top_k': 5,
+    'max_top_k': 100,
+    'max_batch_size': 32,
+    'max_wait_ms': 5,
+    'max_queue': 1024,
+    'latency_window': 10000,
+    'workers': 1,
+    'worker_threads': None,
+    'memory_report_s': 60,
+    'restart_backoff_s': 0.5,
+    'restart_backoff_max_s': 30,
+    'crash_window_s': 60,
+    'max_restarts': 5,
+}
+
+# 请求体大小上限（字节）
+MAX_BODY_BYTES = 1 << 20
+
+
+def load_service_config(path=None, overrides=None):
+    """读取查询服务配置（config.yaml中的service段），缺省项使用DEFAULT_SERVICE_CONFIG
+    Args:
+        path: 配置文件路径，默认为 config/config.yaml
+        overrides: 覆盖配置文件的dict
+    """
+    config = dict(DEFAULT_SERVICE_CONFIG)
+    path = path or DEFAULT_CONFIG_PATH
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config.update((yaml.safe_load(f) or {}).get('service') or {})
+    if overrides:
+        config.update(overrides)
+    return config
+
+
+class Overloaded(Exception):
+    """排队的请求已达上限"""
+
+
+class LatencyWindow:
+    """最近若干次耗时的滑动窗口，计算分位数"""
+
+    def __init__(self, size=10000):
+        self._samples = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        """最近窗口内的p50/p99/最大耗时（毫秒）及累计次数"""
+        if not self._samples:
+            return {'count': self.count, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+        samples = np.fromiter(self._samples, dtype=np.float64) * 1000
+        p50, p99 = np.percentile(samples, [50, 99])
+        return {'count': self.count, 'p50_ms': float(p50), 'p99_ms': float(p99), 'max_ms': float(samples.max())}
+
+
+class MicroBatcher:
+    """把并发到达的请求合并为小批，在工作线程中批量处理
+
+    第一个请求到达后最多再等待max_wait秒，凑够max_batch_size个请求立即执行；
+    上一批执行期间到达的请求在队列中累积，负载越高批越大。
+    排队的请求超过max_queue时 submit 抛出 Overloaded（背压），不再无限排队。
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait=0.005, max_queue=1024):
+        """
+        Args:
+            process_batch: 处理函数，输入请求列表，返回等长的结果列表（在工作线程中调用）
+            max_batch_size: 每批最多的请求数
+            max_wait: 凑批的最长等待时间（秒）
+            max_queue: 排队等待的请求数上限
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queue = None
+        self._task = None
+        # 同一个检索器的批依次执行
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch")
+
+        self.batches = 0
+        self.batched_requests = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item):
+        """提交一个请求，返回其结果"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if self._queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{self._queue.qsize()} requests already queued")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self):
+        """取出一批请求：等到第一个请求后，在max_wait内尽量凑满一批"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # 已断开的请求不再处理
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            self.batches += 1
+            self.batched_requests += len(batch)
+            try:
+                results = await loop.run_in_executor(self._executor, self.process_batch,
+                                                     [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'mean_batch_size': self.batched_requests / self.batches if self.batches else 0.0,
+            'queue_depth': self.queue_depth,
+            'rejected': self.rejected,
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+
+def _json_default(value):
+    # numpy标量（如FAISS的距离）转为Python数值
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class SearchService:
+    """异步HTTP查询服务，索引只在启动时加载一次
+
+    每个检索器有一个 MicroBatcher，并发请求合并后调用检索器的 search_batch，
+    FaissRetriever 的查询编码和 index.search 都按批执行。
+
+    接口：
+        POST /search   {"query": "...", "top_k": 5, "retriever": "bm25"}
+        GET  /health   加载的检索器
+        GET  /stats    每个检索器的请求数、p50/p99延迟、平均批大小、队列长度、拒绝数，
+                       以及处理该请求的进程的pid和内存（rss/pss/uss，MB）
+        GET  /metrics  METRICS中的指标（Prometheus文本格式；?format=json 时为JSON）
+    队列已满时返回503（带 Retry-After），客户端应稍后重试。
+    """
+
+    def __init__(self, retrievers, config=None, config_path=None, query_transforms=None):
+        """
+        Args:
+            retrievers: {名称: 检索器}
+            config: 覆盖配置文件的dict（如 {'max_wait_ms': 2}）
+            config_path: 配置文件路径，默认为 config/config.yaml
+            query_transforms: {名称: 函数}，把查询字符串转换为该检索器的输入；
+                              RankBM25Retriever 默认使用 DEFAULT_ANALYZER 分词
+        """
+        if not retrievers:
+            raise ValueError("SearchService needs at least one retriever")
+        self.config = load_service_config(config_path, config)
+        self.retrievers = dict(retrievers)
+        self.default_retriever = self.config['default_retriever'] or next(iter(self.retrievers))
+        self.query_transforms = {
+            name: DEFAULT_ANALYZER.tokenize for name, retriever in self.retrievers.items()
+            if isinstance(unwrap_retriever(retriever), RankBM25Retriever)
+        }
+        self.query_transforms.update(query_transforms or {})
+        self.batchers = {
+            name: MicroBatcher(partial(self._search_batch, name), self.config['max_batch_size'],
+                               self.config['max_wait_ms'] / 1000, self.config['max_queue'])
+            for name in self.retrievers
+        }
+        self.latency = {name: LatencyWindow(self.config['latency_window']) for name in self.retrievers}
+        self.errors = 0
+        self._server = None
+
+    @classmethod
+    def from_loader(cls, loader, config=None, config_path=None):
+        """用 IndexLoader 已加载的检索器创建服务（构建过混合检索器时一并提供）"""
+        retrievers = {
+            name: retriever for name, retriever in (
+                ('bm25', loader.bm25_retriever),
+                ('bm25s', loader.bm25s_retriever),
+                ('faiss', loader.faiss_retriever),
+                ('hybrid', loader.hybrid_retriever),
+            ) if retriever is not None
+        }
+        return cls(retrievers, config, config_path)
+
+    def _search_batch(self, name, items):
+        """在工作线程中执行一批查询；各请求的top_k不同时按最大值检索后截断"""
+        retriever = self.retrievers[name]
+        transform = self.query_transforms.get(name)
+        if transform is None:
+            queries = [query for query, _ in items]
+        else:
+            with METRICS.timer('query_stage_seconds', retriever=name, stage='tokenize'):
+                queries = [transform(query) for query, _ in items]
+        top_k = max(k for _, k in items)
+        if hasattr(retriever, 'search_batch'):
+            results = retriever.search_batch(queries, top_k=top_k)
+        else:
+            results = [retriever.search(query, top_k=top_k) for query in queries]
+        return [result[:k] for result, (_, k) in zip(results, items)]
+
+    async def search(self, query, top_k=None, retriever=None):
+        """检索单个查询（与其他并发请求合并为批）"""
+        name = retriever or self.default_retriever
+        if name not in self.retrievers:
+            raise KeyError(name)
+        top_k = self.config['default_top_k'] if top_k is None else top_k
+        start = time.perf_counter()
+        results = await self.batchers[name].submit((query, top_k))
+        elapsed = time.perf_counter() - start
+        self.latency[name].add(elapsed)
+        METRICS.observe('request_seconds', elapsed, retriever=name)
+        return results
+
+    def stats(self):
+        return {
+            'retrievers': {
+                name: dict(self.latency[name].summary(), **self.batchers[name].stats())
+                for name in self.retrievers
+            },
+            'errors': self.errors,
+            'query_cache': {name: retriever.stats() for name, retriever in self.retrievers.items()
+                            if isinstance(retriever, CachedRetriever)},
+            'pid': os.getpid(),
+            'memory_mb': {name: value / 2 ** 20 for name, value in process_memory().items()},
+        }
+
+    async def _handle_search(self, body):
+        try:
+            request = json.loads(body or b'{}')
+            query = request['query']
+            top_k = int(request.get('top_k', self.config['default_top_k']))
+        except (ValueError, KeyError, TypeError):
+            return HTTPStatus.BAD_REQUEST, {'error': 'expected a JSON body like {"query": "...", "top_k": 5}'}
+        if not isinstance(query, str) or not 1 <= top_k <= self.config['max_top_k']:
+            return HTTPStatus.BAD_REQUEST, {'error': f"query must be a string and 1 <= top_k <= {self.config['max_top_k']}"}
+        name = request.get('retriever') or self.default_retriever
+        if name not in self.retrievers:
+            return HTTPStatus.NOT_FOUND, {'error': f"unknown retriever: {name}", 'retrievers': list(self.retrievers)}
+        start = time.perf_counter()
+        results = await self.search(query, top_k, name)
+        return HTTPStatus.OK, {'retriever': name, 'results': results,
+                               'latency_ms': (time.perf_counter() - start) * 1000}
+
+    def metrics(self, format='prometheus'):
+        """导出METRICS，同时更新各检索器的队列长度和拒绝数"""
+        for name, batcher in self.batchers.items():
+            METRICS.set('service_queue_depth', batcher.queue_depth, retriever=name)
+            METRICS.set('service_rejected_requests', batcher.rejected, retriever=name)
+        return METRICS.snapshot() if format == 'json' else METRICS.to_prometheus()
+
+    async def dispatch(self, method, target, body):
+        """处理一个请求，返回 (状态码, JSON对象或文本)"""
+        url = urlsplit(target)
+        path = url.path
+        try:
+            if path == '/search' and method == 'POST':
+                return await self._handle_search(body)
+            if path == '/health' and method == 'GET':
+                return HTTPStatus.OK, {'status': 'ok', 'retrievers': list(self.retrievers)}
+            if path == '/stats' and method == 'GET':
+                return HTTPStatus.OK, self.stats()
+            if path == '/metrics' and method == 'GET':
+                return HTTPStatus.OK, self.metrics(parse_qs(url.query).get('format', ['prometheus'])[0])
+            if path in ('/search', '/health', '/stats', '/metrics'):
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"{method} not allowed on {path}"}
+            return HTTPStatus.NOT_FOUND, {'error': f"unknown path: {path}"}
+        except Overloaded as e:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': f"overloaded: {e}"}
+        except Exception as e:
+            self.errors += 1
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+
+    async def _handle_connection(self, reader, writer):
+        """HTTP/1.1连接（支持keep-alive），每个请求读完整个请求体后分发"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'request body too large'}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self.dispatch(method, target, body)
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                if isinstance(payload, str):
+                    data, content_type = payload.encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    data = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+                    content_type = "application/json; charset=utf-8"
+                head = [f"HTTP/1.1 {status.value} {status.phrase}",
+                        f"Content-Type: {content_type}",
+                        f"Content-Length: {len(data)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                if status == HTTPStatus.SERVICE_UNAVAILABLE:
+                    head.append("Retry-After: 1")
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=None, port=None, sock=None):
+        """开始监听，返回 asyncio.Server（port为0时由系统分配端口）
+        Args:
+            sock: 已绑定并监听的socket（如预先fork的多个进程共享的socket），指定时忽略host和port
+        """
+        if sock is not None:
+            self._server = await asyncio.start_server(self._handle_connection, sock=sock)
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_connection,
+                self.config['host'] if host is None else host,
+                self.config['port'] if port is None else port,
+            )
+        return self._server
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, host=None, port=None, sock=None):
+        await self.start(host, port, sock)
+        print(f"Search service (pid {os.getpid()}) listening on port {self.port} "
+              f"with retrievers {list(self.retrievers)}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for batcher in self.batchers.values():
+            await batcher.close()
@@ -0,0 +1,96 @@
+import os
+import time
+import shutil
+import numpy as np
+from .storage import write_json, read_json
+from .analyzer import DEFAULT_ANALYZER, TokenizedCorpus
+from .document_store import DocumentWriter
+
+# 版本2: 词id与位置数组改为 TokenizedCorpus 格式（offsets.npy 替代 doc_len.npy）
+SHARD_FORMAT_VERSION = 2
+
+
+def write_shard(documents, directory, source=None, chunk_size=10000, analyzer=DEFAULT_ANALYZER):
+    """把文档分词为局部词id并写成分片目录
+
+    目录结构：
+        manifest.json  格式版本、来源文件及其大小/修改时间、文档数、词数、词表大小、分词耗时
+        vocab_*.npy / token_ids.npy / offsets.npy
+                       以局部词id编码的语料（TokenizedCorpus格式）
+        documents/     原始文档（DocumentWriter格式）
+
+    先写入临时目录，完成后再改名，中断时不会留下不完整的分片。
+    Args:
+        documents: 原始文档（dict，分词使用其中的text字段）的可迭代对象
+        directory: 分片目录
+        source: 来源文件路径，记录在manifest中用于判断分片是否过期
+        chunk_size: 每积累多少个文档分词并写一次原始文档
+        analyzer: 分词器
+    Returns:
+        dict: manifest
+    """
+    start = time.perf_counter()
+    tmp_path = directory + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    vocab = {}
+    token_ids, lengths = [], []
+    writer = DocumentWriter(os.path.join(tmp_path, "documents"))
+
+    def flush(chunk):
+        writer.extend(chunk)
+        ids, chunk_lengths = analyzer.encode((document['text'] for document in chunk), vocab)
+        token_ids.append(ids)
+        lengths.append(chunk_lengths)
+
+    chunk = []
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+    writer.finish()
+
+    corpus = TokenizedCorpus.from_lengths(list(vocab), np.concatenate(token_ids), np.concatenate(lengths))
+    corpus.save(tmp_path)
+    manifest = {
+        'format_version': SHARD_FORMAT_VERSION,
+        'source': source,
+        'num_docs': len(corpus),
+        'num_tokens': corpus.num_tokens,
+        'vocab_size': len(corpus.terms),
+        'tokenize_seconds': time.perf_counter() - start,
+    }
+    if source is not None:
+        stat = os.stat(source)
+        manifest.update(source_size=stat.st_size, source_mtime_ns=stat.st_mtime_ns)
+    write_json(os.path.join(tmp_path, "manifest.json"), manifest)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(tmp_path, directory)
+    return manifest
+
+
+def read_manifest(directory):
+    """读取分片的manifest；分片不存在、格式不符或来源文件已变化时返回None"""
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    manifest = read_json(path)
+    if manifest.get('format_version') != SHARD_FORMAT_VERSION:
+        return None
+    source = manifest.get('source')
+    if source is not None:
+        if not os.path.exists(source):
+            return None
+        stat = os.stat(source)
+        if (stat.st_size, stat.st_mtime_ns) != (manifest.get('source_size'), manifest.get('source_mtime_ns')):
+            return None
+    return manifest
+
+
+def load_shard(directory):
+    """读取分片中以局部词id编码的语料（TokenizedCorpus，词id数组为内存映射）"""
+    return TokenizedCorpus.load(directory)
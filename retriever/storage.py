@@ -0,0 +1,49 @@
+import os
+import json
+import shutil
+import numpy as np
+
+
+def save_array(directory, name, array):
+    """以.npy格式保存数组"""
+    np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+
+
+def load_array(directory, name, mmap=True):
+    """加载.npy数组，mmap=True时以只读内存映射方式打开（np.memmap）"""
+    return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r' if mmap else None)
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def write_json_atomic(path, data):
+    """先写临时文件并落盘，再用 os.replace 替换，中断时文件要么是旧内容要么是新内容"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def replace_directory(tmp_path, path):
+    """用写好的临时目录替换目标目录
+
+    旧目录先改名再删除，已经内存映射旧文件的进程不受影响。
+    """
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.isdir(path):
+        os.rename(path, old_path)
+    elif os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
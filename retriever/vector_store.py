@@ -0,0 +1,94 @@
+import os
+import shutil
+import numpy as np
+from .storage import write_json, read_json
+
+VECTOR_STORE_FORMAT_VERSION = 1
+
+
+class VectorStore:
+    """只追加的float32向量文件，供流式构建FAISS索引使用
+
+    目录结构：
+        meta.json     格式版本、向量维度
+        vectors.f32   行优先的float32矩阵，以 np.memmap 读取
+
+    向量直接追加写入文件，不在内存中累积；调用方在检查点中记录 len(store)，
+    恢复时用 truncate() 丢弃检查点之后写入的部分。
+    """
+
+    def __init__(self, path, dimension=None):
+        """打开或创建向量文件
+        Args:
+            path: 存储目录
+            dimension: 向量维度；为None时从已有的meta.json读取，或在第一次append时确定
+        """
+        self.path = path
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._meta_path = os.path.join(path, "meta.json")
+        os.makedirs(path, exist_ok=True)
+
+        if os.path.exists(self._meta_path):
+            meta = read_json(self._meta_path)
+            if meta.get('format_version') != VECTOR_STORE_FORMAT_VERSION:
+                raise ValueError(f"Unsupported vector store version: {meta.get('format_version')}")
+            if dimension is not None and dimension != meta['dimension']:
+                raise ValueError(f"Vector store at {path} has dimension {meta['dimension']}, expected {dimension}")
+            dimension = meta['dimension']
+        self.dimension = dimension
+        self._count = 0
+        if dimension is not None and os.path.exists(self._vectors_path):
+            # 最后一行可能只写了一部分，按整行计数
+            self._count = os.path.getsize(self._vectors_path) // (4 * dimension)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, vectors):
+        """在文件末尾追加一批向量"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError(f"Expected a 2-d array of vectors, got shape {vectors.shape}")
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+            write_json(self._meta_path, {
+                'format_version': VECTOR_STORE_FORMAT_VERSION,
+                'dimension': self.dimension,
+            })
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got {vectors.shape[1]}")
+        with open(self._vectors_path, 'ab') as f:
+            f.truncate(self._count * self.dimension * 4)
+            f.write(vectors.tobytes())
+        self._count += len(vectors)
+
+    def flush(self):
+        """把已追加的向量写到磁盘（在记录检查点之前调用）"""
+        if os.path.exists(self._vectors_path):
+            with open(self._vectors_path, 'rb+') as f:
+                os.fsync(f.fileno())
+
+    def truncate(self, count):
+        """丢弃第count条之后的向量"""
+        if count >= self._count:
+            return
+        with open(self._vectors_path, 'rb+') as f:
+            f.truncate(count * self.dimension * 4)
+        self._count = count
+
+    def vectors(self):
+        """以只读内存映射方式返回[len, dimension]的向量矩阵"""
+        if self._count == 0:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(self._count, self.dimension))
+
+    def link(self, directory):
+        """用硬链接把向量复制到directory（不支持硬链接时复制文件），返回新目录的VectorStore"""
+        os.makedirs(directory, exist_ok=True)
+        for path in (self._meta_path, self._vectors_path):
+            target = os.path.join(directory, os.path.basename(path))
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)
+        return VectorStore(directory)
@@ -0,0 +1,86 @@
+import numpy as np
+from .storage import save_array, load_array
+
+
+def save_vocabulary(terms, directory):
+    """保存词表
+    Args:
+        terms: 按词id顺序排列的词
+        directory: 保存目录
+
+    写出三个数组：
+        vocab_bytes   所有词的UTF-8编码拼接
+        vocab_offsets 第i个词位于 vocab_bytes[offsets[i]:offsets[i+1]]
+        vocab_sorted  按字节序排列的词id，用于二分查找
+    """
+    encoded = [term.encode('utf-8') for term in terms]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term in encoded], out=offsets[1:])
+    # UTF-8字节序与Unicode码点序一致
+    order = sorted(range(len(encoded)), key=encoded.__getitem__)
+
+    save_array(directory, "vocab_bytes", np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    save_array(directory, "vocab_offsets", offsets)
+    save_array(directory, "vocab_sorted", np.asarray(order, dtype=np.int64))
+
+
+class MmapVocabulary:
+    """内存映射的只读词表，支持在其上追加新词
+
+    查找通过在 vocab_sorted 上二分完成，加载时不需要反序列化整个词表。
+    新增的词保存在内存字典中，词id接在已有词之后。
+    """
+
+    def __init__(self, directory):
+        self._bytes = load_array(directory, "vocab_bytes")
+        self._offsets = load_array(directory, "vocab_offsets")
+        self._sorted = load_array(directory, "vocab_sorted")
+        self._base_size = len(self._offsets) - 1
+        self._added = {}
+
+    def _term_bytes(self, term_id):
+        return self._bytes[self._offsets[term_id]:self._offsets[term_id + 1]].tobytes()
+
+    def _lookup(self, term):
+        key = term.encode('utf-8')
+        lo, hi = 0, self._base_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            term_id = int(self._sorted[mid])
+            current = self._term_bytes(term_id)
+            if current == key:
+                return term_id
+            if current < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return self._added.get(term)
+
+    def get(self, term, default=None):
+        term_id = self._lookup(term)
+        return default if term_id is None else term_id
+
+    def __getitem__(self, term):
+        term_id = self._lookup(term)
+        if term_id is None:
+            raise KeyError(term)
+        return term_id
+
+    def __contains__(self, term):
+        return self._lookup(term) is not None
+
+    def setdefault(self, term, term_id):
+        existing = self._lookup(term)
+        if existing is not None:
+            return existing
+        self._added[term] = term_id
+        return term_id
+
+    def __len__(self):
+        return self._base_size + len(self._added)
+
+    def __iter__(self):
+        """按词id顺序遍历所有词"""
+        for term_id in range(self._base_size):
+            yield self._term_bytes(term_id).decode('utf-8')
+        yield from self._added
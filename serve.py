@@ -0,0 +1,55 @@
+import os
+import asyncio
+from main_load_built_index import IndexLoader
+from retriever.service import SearchService, load_service_config
+from retriever.prefork import PreforkServer
+from retriever.metrics import configure_metrics
+
+
+def use_prefork(config):
+    return config['workers'] > 1 and hasattr(os, 'fork')
+
+
+def load_retrievers(config):
+    """按配置中的 retrievers 列表加载索引（只在启动时加载一次）
+
+    多进程服务时FAISS索引留在CPU上、不加载编码模型，由各工作进程在fork之后加载。
+    """
+    prefork = use_prefork(config)
+    loader = IndexLoader(index_dir=config['index_dir'])
+    names = config['retrievers']
+    if 'bm25' in names:
+        loader.load_bm25_index()
+    if 'bm25s' in names:
+        loader.load_bm25s_index()
+    if 'faiss' in names:
+        loader.load_faiss_index(gpu=not prefork)
+        if not prefork:
+            # 编码模型默认在第一次查询时加载，服务启动时预先加载，避免第一批请求等待
+            loader.faiss_retriever.load_encoder()
+    if 'hybrid' in names:
+        loader.build_hybrid_retriever()
+    # 按 query_cache 配置加上结果缓存和查询向量缓存
+    loader.enable_query_cache()
+    return loader
+
+
+def main():
+    configure_metrics()
+    config = load_service_config()
+    loader = load_retrievers(config)
+    if use_prefork(config):
+        # 索引已在主进程中内存映射，fork出的工作进程共享其物理页
+        PreforkServer(loader, config).serve_forever()
+        return
+    if config['workers'] > 1:
+        print("Warning: os.fork is not available, serving with a single process")
+    service = SearchService.from_loader(loader, config)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        print("Search service stopped")
+
+
+if __name__ == "__main__":
+    main()
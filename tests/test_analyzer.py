@@ -0,0 +1,56 @@
+import os
+import unittest
+import tempfile
+import numpy as np
+from retriever.analyzer import Analyzer, TokenizedCorpus
+from retriever.inverted_index import InvertedIndex
+
+
+class TestAnalyzer(unittest.TestCase):
+    def test_tokenize(self):
+        self.assertEqual(Analyzer().tokenize("  The Quick\tfox\n"), ["the", "quick", "fox"])
+        self.assertEqual(Analyzer(lowercase=False)("The fox"), ["The", "fox"])
+
+    def test_encode_extends_vocab(self):
+        vocab = {"fox": 0}
+        token_ids, lengths = Analyzer().encode(["the fox", "", "Fox the end"], vocab)
+        self.assertEqual(vocab, {"fox": 0, "the": 1, "end": 2})
+        self.assertEqual(token_ids.dtype, np.uint32)
+        self.assertEqual(token_ids.tolist(), [1, 0, 0, 1, 2])
+        self.assertEqual(lengths.tolist(), [2, 0, 3])
+
+
+class TestTokenizedCorpus(unittest.TestCase):
+    texts = ["a b a", "", "c B d", "d"]
+
+    def test_from_texts_and_tokens_agree(self):
+        corpus = TokenizedCorpus.from_texts(self.texts)
+        self.assertEqual(len(corpus), 4)
+        self.assertEqual(corpus.num_tokens, 7)
+        self.assertEqual([corpus[i] for i in range(4)], [["a", "b", "a"], [], ["c", "b", "d"], ["d"]])
+        from_tokens = TokenizedCorpus.from_tokens([text.lower().split() for text in self.texts])
+        self.assertEqual(from_tokens.terms, corpus.terms)
+        np.testing.assert_array_equal(from_tokens.token_ids, corpus.token_ids)
+        np.testing.assert_array_equal(from_tokens.offsets, corpus.offsets)
+
+    def test_save_and_load(self):
+        corpus = TokenizedCorpus.from_texts(self.texts)
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus.save(tmp)
+            loaded = TokenizedCorpus.load(tmp)
+            self.assertIsInstance(loaded.token_ids, np.memmap)
+            self.assertEqual(loaded.terms, corpus.terms)
+            self.assertEqual([loaded[i] for i in range(4)], [corpus[i] for i in range(4)])
+
+    def test_index_built_from_corpus_matches_token_lists(self):
+        tokenized = [text.lower().split() for text in self.texts]
+        expected = InvertedIndex.from_corpus(tokenized)
+        index = InvertedIndex.from_corpus(TokenizedCorpus.from_texts(self.texts[:2]))
+        index.add_texts(self.texts[2:])
+        self.assertEqual(index.df.tolist(), expected.df.tolist())
+        for query in (["a"], ["b", "d"], ["missing"]):
+            np.testing.assert_array_equal(index.score(query)[1], expected.score(query)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
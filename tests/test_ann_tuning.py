@@ -0,0 +1,111 @@
+import os
+import shutil
+import unittest
+import tempfile
+import numpy as np
+from retriever.faiss_index import DEFAULT_CONFIG_PATH, load_faiss_config
+from retriever.ann_tuning import (split_sample, exact_neighbors, recall_at_k, default_factories,
+                                  default_search_grid, tune, pareto_frontier, choose_setting,
+                                  write_faiss_config, reservoir_sample)
+
+
+def result(recall, latency, size, factory="IVF16,Flat", search=None):
+    return {'index_factory': factory, 'search': search or {}, 'recall': recall, 'latency_p50_ms': latency,
+            'latency_p99_ms': latency, 'batch_qps': 1.0, 'index_bytes': size, 'build_s': 0.0}
+
+
+class TestAnnTuning(unittest.TestCase):
+    def test_recall_at_k(self):
+        truth = np.array([[1, 2, 3], [4, 5, 6]])
+        found = np.array([[3, 2, 9], [4, -1, -1]])
+        self.assertAlmostEqual(recall_at_k(found, truth, 3), 3 / 6)
+
+    def test_split_sample_is_disjoint(self):
+        database, queries = split_sample(100, 80, 10, seed=1)
+        self.assertEqual((len(database), len(queries)), (80, 10))
+        self.assertFalse(set(database) & set(queries))
+        # 库向量数不足时取剩余的全部
+        self.assertEqual(len(split_sample(50, 80, 10)[0]), 40)
+
+    def test_reservoir_sample(self):
+        sample = reservoir_sample(range(1000), 50, seed=0)
+        self.assertEqual(len(set(sample)), 50)
+        self.assertEqual(reservoir_sample(range(1000), 50, seed=0), sample)
+        self.assertEqual(sorted(reservoir_sample(range(5), 50)), list(range(5)))
+
+    def test_default_candidates(self):
+        factories = default_factories(1_000_000, 768)
+        self.assertEqual(factories, ["SQfp16", "SQ8", "IVF1024,Flat", "IVF4096,Flat", "IVF4096,SQ8",
+                                     "IVF4096,PQ96", "OPQ96,IVF4096,PQ96", "IVF4096,PQ48", "HNSW16", "HNSW32"])
+        # 向量太少时不训练IVF/PQ
+        self.assertEqual(default_factories(50, 64), ["SQfp16", "SQ8", "HNSW16", "HNSW32"])
+        self.assertEqual(default_search_grid("OPQ8,IVF4,PQ8"), default_search_grid("IVF4,Flat"))
+        self.assertEqual(default_search_grid("IVF4,Flat"), [{'nprobe': 1}, {'nprobe': 2}, {'nprobe': 4}])
+        self.assertEqual(default_search_grid("Flat"), [{}])
+
+    def test_pareto_frontier_and_choice(self):
+        results = [
+            result(1.0, 1.0, 100, "Flat"),
+            result(0.99, 0.2, 100, search={'nprobe': 8}),
+            result(0.90, 0.1, 100, search={'nprobe': 2}),
+            result(0.90, 0.3, 100, search={'nprobe': 4}),      # 被nprobe=2支配
+            result(0.80, 0.1, 10, "IVF16,PQ4"),
+        ]
+        frontier = pareto_frontier(results)
+        self.assertEqual([r['recall'] for r in frontier], [1.0, 0.99, 0.90, 0.80])
+        self.assertEqual(choose_setting(results, 0.95)['search'], {'nprobe': 8})
+        self.assertEqual(choose_setting(results, 0.85)['search'], {'nprobe': 2})
+        self.assertEqual(choose_setting(results, 1.1)['index_factory'], "Flat")
+
+    def test_tune_measures_recall_against_flat(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(2100, 16)).astype('float32')
+        config = load_faiss_config(overrides={'use_gpu': False})
+        results = tune(vectors[:2000], vectors[2000:], 5, config, ["IVF16,Flat", "HNSW16"],
+                       latency_queries=10, log=None)
+        by_setting = {(r['index_factory'], tuple(r['search'].items())): r for r in results}
+        self.assertEqual(by_setting[("Flat", ())]['recall'], 1.0)
+        # 扫描全部聚类时IVF等价于精确检索
+        self.assertEqual(by_setting[("IVF16,Flat", (('nprobe', 16),))]['recall'], 1.0)
+        self.assertLess(by_setting[("IVF16,Flat", (('nprobe', 1),))]['recall'], 1.0)
+        truth = exact_neighbors(vectors[:2000], vectors[2000:], 5)
+        self.assertEqual(truth.shape, (100, 5))
+
+    def test_rerank_improves_compressed_recall(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(2100, 16)).astype('float32')
+        config = load_faiss_config(overrides={'use_gpu': False})
+        results = tune(vectors[:2000], vectors[2000:], 5, config, ["PQ4x4"], latency_queries=10, log=None,
+                       rerank_factors=[8])
+        by_rerank = {r['rerank']: r for r in results if r['index_factory'] == "PQ4x4"}
+        self.assertGreater(by_rerank[8]['recall'], by_rerank[0]['recall'])
+        self.assertEqual(by_rerank[8]['index_bytes'], by_rerank[0]['index_bytes'])
+        # Flat本身是精确的，不评估重排
+        self.assertEqual([r['rerank'] for r in results if r['index_factory'] == "Flat"], [0])
+
+    def test_write_config_keeps_comments(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "faiss_config.yaml")
+            shutil.copy(DEFAULT_CONFIG_PATH, path)
+            write_faiss_config(dict(result(0.99, 0.2, 100, "IVF1024,PQ8", {'nprobe': 32}), rerank=8), path)
+            config = load_faiss_config(path)
+            self.assertEqual((config['index_factory'], config['search']['nprobe']), ("IVF1024,PQ8", 32))
+            self.assertEqual(config['rerank'], {'enabled': True, 'k_factor': 8})
+            write_faiss_config(dict(result(0.99, 0.2, 100, "IVF1024,Flat", {'nprobe': 32}), rerank=0), path)
+            config = load_faiss_config(path)
+            self.assertEqual((config['index_factory'], config['rerank']['enabled']), ("IVF1024,Flat", False))
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            self.assertIn("# IVF查询的聚类数", text)
+
+            # 文件中没有的键按yaml写入
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("faiss:\n  metric: l2\n")
+            write_faiss_config(dict(result(0.99, 0.2, 100, "HNSW32", {'efSearch': 128}), rerank=4), path)
+            config = load_faiss_config(path)
+            self.assertEqual((config['index_factory'], config['search']['efSearch']), ("HNSW32", 128))
+            self.assertEqual(config['rerank'], {'enabled': True, 'k_factor': 4})
+
+
+if __name__ == '__main__':
+    unittest.main()
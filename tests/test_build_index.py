@@ -0,0 +1,130 @@
+import os
+import json
+import unittest
+import tempfile
+import numpy as np
+from build_index import IndexBuilder
+from retriever.document_store import DocumentStore
+from retriever.rank_bm25_retriever import RankBM25Retriever
+
+
+def write_data(data_dir, num_files=3, docs_per_file=20):
+    os.makedirs(data_dir)
+    for i in range(num_files):
+        with open(os.path.join(data_dir, f"f{i}.jsonl"), 'w', encoding='utf-8') as f:
+            for j in range(docs_per_file):
+                f.write(json.dumps({'id': f"{i}-{j}", 'type': 'paragraph', 'text': f"file{i} doc{j} common"}) + "\n")
+
+
+class CrashingBuilder(IndexBuilder):
+    """索引完 crash_after 个文档后模拟进程中断"""
+    crash_after = None
+
+    def index_shard(self, shard_path, manifest):
+        if self.crash_after is not None and self.sparse_index.num_docs >= self.crash_after:
+            raise KeyboardInterrupt
+        super().index_shard(shard_path, manifest)
+
+
+class FakeEncoder:
+    """代替FaissRetriever：向量由文本确定，finalize时记录索引的向量"""
+    embedding_cache = None
+
+    @staticmethod
+    def encode(text):
+        return np.random.default_rng(abs(hash(text)) % 2 ** 32).standard_normal(4).astype(np.float32)
+
+    def encode_documents(self, texts):
+        return np.stack([self.encode(text) for text in texts])
+
+    def index_vectors(self, vectors):
+        self.vectors = np.array(vectors)
+
+    def save(self, path, vectors=None):
+        pass
+
+
+class TestResumableBuild(unittest.TestCase):
+    def build(self, index_dir, data_dir, crash_after=None, build_faiss=False, commit_interval=0):
+        builder = CrashingBuilder(index_dir=index_dir, build_faiss=build_faiss, batch_size=7)
+        builder.crash_after = crash_after
+        if build_faiss:
+            builder.faiss_index = FakeEncoder()
+        builder.build_all_indexes(data_dir, max_workers=1, commit_interval=commit_interval)
+        return builder
+
+    def test_resume_after_crash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir, index_dir = os.path.join(tmp, "data"), os.path.join(tmp, "indexes")
+            write_data(data_dir)
+            with self.assertRaises(KeyboardInterrupt):
+                self.build(index_dir, data_dir, crash_after=40)
+            with open(os.path.join(index_dir, "processed_files.txt")) as f:
+                self.assertEqual(len(f.read().split()), 2)
+            self.assertFalse(os.path.exists(os.path.join(index_dir, "bm25")))
+
+            builder = self.build(index_dir, data_dir)
+            self.assertEqual(builder.build_manifest['status'], 'published')
+            retriever = RankBM25Retriever.load(os.path.join(index_dir, "bm25"))
+            self.assertEqual(retriever.bm25.num_docs, 60)
+            self.assertEqual([retriever.raw_documents[i]['id'] for i in (0, 20, 59)], ["0-0", "1-0", "2-19"])
+            self.assertEqual(retriever.search(["file2", "doc3"], top_k=1)[0]['metadata']['id'], "2-3")
+
+            # 文件未变化时不重新构建；新增文件后重新构建并包含新文件
+            self.build(index_dir, data_dir)
+            with open(os.path.join(data_dir, "f9.jsonl"), 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'id': "9-0", 'type': 'paragraph', 'text': "file9"}) + "\n")
+            self.build(index_dir, data_dir)
+            self.assertEqual(RankBM25Retriever.load(os.path.join(index_dir, "bm25")).bm25.num_docs, 61)
+
+    def test_failed_file_is_retried(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir, index_dir = os.path.join(tmp, "data"), os.path.join(tmp, "indexes")
+            write_data(data_dir)
+            bad_path = os.path.join(data_dir, "f1.jsonl")
+            with open(bad_path, 'a', encoding='utf-8') as f:
+                f.write("{not json\n")
+            builder = self.build(index_dir, data_dir)
+            self.assertEqual(builder.build_manifest['status'], 'building')
+            self.assertEqual([entry['path'] for entry in builder.build_manifest['failed']], [bad_path])
+            self.assertEqual(len(builder.build_manifest['files']), 2)
+            self.assertFalse(os.path.exists(os.path.join(index_dir, "bm25")))
+
+            # 文件未修复时仍然失败，不发布
+            builder = self.build(index_dir, data_dir)
+            self.assertEqual(builder.build_manifest['status'], 'building')
+
+            # 修复后只处理失败的文件，追加在已提交的文件之后并发布
+            with open(bad_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'id': "1-0", 'type': 'paragraph', 'text': "file1 fixed"}) + "\n")
+            builder = self.build(index_dir, data_dir)
+            self.assertEqual(builder.build_manifest['status'], 'published')
+            self.assertEqual(builder.build_manifest['failed'], [])
+            retriever = RankBM25Retriever.load(os.path.join(index_dir, "bm25"))
+            self.assertEqual(retriever.bm25.num_docs, 41)
+            self.assertEqual(retriever.raw_documents[40]['id'], "1-0")
+            builder = self.build(index_dir, data_dir)
+            self.assertEqual(builder.build_manifest['status'], 'published')
+
+    def test_faiss_vectors_follow_committed_documents(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir, index_dir = os.path.join(tmp, "data"), os.path.join(tmp, "indexes")
+            write_data(data_dir)
+            # 编码了40个文档后中断，这些文档都没有提交
+            with self.assertRaises(KeyboardInterrupt):
+                self.build(index_dir, data_dir, crash_after=40, build_faiss=True, commit_interval=3600)
+            with open(os.path.join(data_dir, "f0.jsonl"), 'w', encoding='utf-8') as f:
+                for j in range(25):
+                    f.write(json.dumps({'id': f"0-{j}", 'type': 'paragraph', 'text': f"changed doc{j}"}) + "\n")
+
+            builder = self.build(index_dir, data_dir, build_faiss=True)
+            self.assertEqual(builder.build_manifest['status'], 'published')
+            self.assertEqual(builder.build_manifest['faiss_count'], 65)
+            documents = DocumentStore.open(os.path.join(index_dir, "documents"))
+            self.assertEqual(len(documents), 65)
+            expected = np.stack([FakeEncoder.encode(documents[i]['text']) for i in range(len(documents))])
+            np.testing.assert_array_equal(builder.faiss_index.vectors, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import bz2
+import json
+import unittest
+import tempfile
+from decompress import prepare_shard, article_documents
+
+try:
+    from build_index import iter_documents
+except ImportError:
+    iter_documents = None
+
+ARTICLES = [
+    {'id': '1', 'title': 'Paris', 'text': [[], ['Paris is the <a href="France">capital</a> of France.', '  It is  big.']]},
+    {'id': '2', 'title': 'Bank', 'text': [['A <a href="Bank">bank</a> lends money.'], ['   ']]},
+]
+
+
+class TestPrepareShard(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "raw")
+        self.output = os.path.join(self.tmp.name, "prepared")
+        os.makedirs(os.path.join(self.root, "AA"))
+        self.shard = os.path.join(self.root, "AA", "wiki_00.bz2")
+        with bz2.open(self.shard, 'wt', encoding='utf-8') as f:
+            for article in ARTICLES:
+                f.write(json.dumps(article) + "\n")
+            f.write("not json\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_streams_cleaned_documents_as_jsonl(self):
+        self.assertEqual(prepare_shard(self.shard, self.root, self.output), 4)
+        self.assertFalse(os.path.exists(self.shard))
+        with open(os.path.join(self.output, "AA", "wiki_00.jsonl"), encoding='utf-8') as f:
+            documents = [json.loads(line) for line in f]
+        self.assertEqual(documents, [doc for article in ARTICLES for doc in article_documents(article)])
+        self.assertEqual(documents[1], {'id': '1', 'type': 'paragraph', 'title': 'paris',
+                                        'text': 'paris is the france capital of france. it is big.'})
+
+    @unittest.skipIf(iter_documents is None, "index build dependencies not installed")
+    def test_iter_documents_reads_jsonl_and_legacy_json(self):
+        prepare_shard(self.shard, self.root, self.output)
+        legacy = os.path.join(self.tmp.name, "legacy.json")
+        with open(legacy, 'w', encoding='utf-8') as f:
+            json.dump(ARTICLES, f)
+
+        documents = list(iter_documents(os.path.join(self.output, "AA", "wiki_00.jsonl")))
+        self.assertEqual(len(documents), 4)
+        self.assertEqual(documents, list(iter_documents(legacy)))
+        self.assertEqual(documents[0]['text'], 'paris')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import unittest
+import tempfile
+from retriever.document_store import DocumentStore, DocumentWriter, save_documents, open_documents
+from retriever.storage import replace_directory
+from retriever.rank_bm25_retriever import RankBM25Retriever
+from retriever.bm25s_retriever import BM25SRetriever
+
+
+def make_docs(n):
+    return [{'id': str(i), 'type': 'paragraph', 'text': f"段落 {i} " + "word " * (i % 7)} for i in range(n)]
+
+
+class TestDocumentStore(unittest.TestCase):
+    def test_compressed_round_trip(self):
+        docs = make_docs(150)
+        with tempfile.TemporaryDirectory() as tmp:
+            DocumentStore(docs).save(tmp, codec='zlib', block_size=16)
+            self.assertTrue(os.path.exists(os.path.join(tmp, "blocks.bin")))
+            store = DocumentStore.open(tmp)
+            self.assertEqual(len(store), 150)
+            self.assertEqual(store[149], docs[149])
+            self.assertEqual(store[-1], docs[-1])
+            self.assertEqual(list(store), docs)
+
+    def test_reads_uncompressed_format(self):
+        docs = make_docs(10)
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = DocumentWriter(tmp)
+            writer.extend(docs)
+            writer.finish()
+            self.assertEqual(list(DocumentStore.open(tmp)), docs)
+
+    def test_opened_directory_is_shared_but_appends_are_not(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            DocumentStore(make_docs(5)).save(tmp)
+            first, second = DocumentStore.open(tmp), DocumentStore.open(tmp)
+            self.assertIs(first._stored, second._stored)
+            first.append({'id': 'new'})
+            self.assertEqual((len(first), len(second)), (6, 5))
+
+            # 目录被重新保存（替换）后打开的是新内容
+            path = os.path.join(tmp, "store")
+            DocumentStore(make_docs(5)).save(path)
+            old = DocumentStore.open(path)
+            DocumentStore(make_docs(3)).save(path + ".tmp")
+            replace_directory(path + ".tmp", path)
+            self.assertEqual((len(old), len(DocumentStore.open(path))), (5, 3))
+
+    def test_retrievers_link_to_shared_store(self):
+        docs = make_docs(20)
+        texts = [doc['text'] for doc in docs]
+        with tempfile.TemporaryDirectory() as tmp:
+            shared_path = os.path.join(tmp, "documents")
+            DocumentStore(docs).save(shared_path)
+            shared = DocumentStore.open(shared_path)
+
+            bm25 = RankBM25Retriever([text.split() for text in texts], shared)
+            bm25s = BM25SRetriever(texts, shared)
+            bm25.save(os.path.join(tmp, "bm25"))
+            bm25s.save(os.path.join(tmp, "bm25s"))
+            self.assertTrue(os.path.exists(os.path.join(tmp, "bm25", "raw_documents", "link.json")))
+
+            loaded = RankBM25Retriever.load(os.path.join(tmp, "bm25"))
+            loaded_s = BM25SRetriever.load(os.path.join(tmp, "bm25s"))
+            self.assertIs(loaded.raw_documents._stored, loaded_s.raw_documents._stored)
+            self.assertEqual(loaded.search(["段落", "19"], top_k=1)[0]['metadata'], docs[19])
+
+            # 追加文档后保存为独立的副本，不影响共享存储
+            loaded.add_documents([["extra"]], [{'id': 'extra', 'text': 'extra'}])
+            loaded.save(os.path.join(tmp, "bm25"))
+            self.assertFalse(os.path.exists(os.path.join(tmp, "bm25", "raw_documents", "link.json")))
+            self.assertEqual(len(open_documents(os.path.join(tmp, "bm25", "raw_documents"))), 21)
+            self.assertEqual(len(open_documents(os.path.join(tmp, "bm25s", "raw_documents"))), 20)
+
+    def test_store_inside_target_is_copied(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "raw_documents")
+            DocumentStore(make_docs(4)).save(path)
+            store = DocumentStore.open(path)
+            save_documents(store, os.path.join(tmp, "copy"), path)
+            self.assertFalse(os.path.exists(os.path.join(tmp, "copy", "link.json")))
+            self.assertEqual(len(DocumentStore.open(os.path.join(tmp, "copy"))), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import tempfile
+import numpy as np
+from retriever.embedding_cache import EmbeddingCache, embedding_key
+
+
+class FakeEncoder:
+    """按文本哈希生成确定性向量，并记录被编码的文本"""
+
+    def __init__(self, dimension=8):
+        self.dimension = dimension
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.extend(texts)
+        return np.stack([np.random.default_rng(abs(hash(text)) % 2 ** 32).standard_normal(self.dimension)
+                         for text in texts]).astype(np.float32)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def encode(self, cache, texts, encoder, model="m"):
+        return cache.encode(texts, encoder, model, 512, "mean")
+
+    def test_only_new_texts_are_encoded(self):
+        encoder = FakeEncoder()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = EmbeddingCache(tmp, dimension=8)
+            first = self.encode(cache, ["a", "b", "c"], encoder)
+            second = self.encode(cache, ["c", "d", "a"], encoder)
+            self.assertEqual(encoder.calls, ["a", "b", "c", "d"])
+            np.testing.assert_array_equal(second[0], first[2])
+            np.testing.assert_array_equal(second[2], first[0])
+            stats = cache.stats()
+            self.assertEqual((stats['hits'], stats['misses']), (2, 4))
+            self.assertAlmostEqual(stats['hit_rate'], 2 / 6)
+
+            # 重新打开后仍然命中
+            cache.flush()
+            reopened = EmbeddingCache(tmp, dimension=8)
+            encoder.calls.clear()
+            again = self.encode(reopened, ["a", "b", "c", "d"], encoder)
+            self.assertEqual(encoder.calls, [])
+            np.testing.assert_array_equal(again[:3], first)
+
+    def test_key_depends_on_encoder_config(self):
+        keys = {
+            embedding_key("text", "model-a", 512, "mean"),
+            embedding_key("text", "model-b", 512, "mean"),
+            embedding_key("text", "model-a", 256, "mean"),
+            embedding_key("text", "model-a", 512, "cls"),
+        }
+        self.assertEqual(len(keys), 4)
+
+    def test_lru_eviction(self):
+        encoder = FakeEncoder()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = EmbeddingCache(tmp, dimension=8, max_entries=4, evict_fraction=0.5)
+            self.encode(cache, ["a", "b", "c", "d"], encoder)
+            self.encode(cache, ["a", "b"], encoder)     # c、d 变为最久未使用
+            self.encode(cache, ["e"], encoder)
+            self.assertEqual(cache.stats()['evictions'], 2)
+            self.assertLessEqual(len(cache), 4)
+
+            encoder.calls.clear()
+            self.encode(cache, ["a", "b", "e"], encoder)
+            self.assertEqual(encoder.calls, [])
+            self.encode(cache, ["c"], encoder)
+            self.assertEqual(encoder.calls, ["c"])
+
+    def test_evicted_slots_not_reused_before_persisted(self):
+        encoder = FakeEncoder()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = EmbeddingCache(tmp, dimension=8, max_entries=4, evict_fraction=0.5)
+            expected = dict(zip("abcd", self.encode(cache, ["a", "b", "c", "d"], encoder)))
+            cache.flush()
+            self.encode(cache, ["a", "b"], encoder)
+            expected.update(zip("ef", self.encode(cache, ["e", "f"], encoder)))
+
+            # 未调用flush就中断：磁盘上的索引引用的槽位都保存着对应的向量
+            reopened = EmbeddingCache(tmp, dimension=8, max_entries=4, evict_fraction=0.5)
+            self.assertGreater(len(reopened), 0)
+            for text in "abcdef":
+                vectors, missing = reopened.get_many([embedding_key(text, "m", 512, "mean")])
+                if not missing:
+                    np.testing.assert_array_equal(vectors[0], expected[text])
+
+    def test_dimension_mismatch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = EmbeddingCache(tmp, dimension=8)
+            self.encode(cache, ["a"], FakeEncoder())
+            cache.flush()
+            with self.assertRaises(ValueError):
+                EmbeddingCache(tmp, dimension=16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import unittest
+import tempfile
+import numpy as np
+from retriever.encoder_backends import mean_pool_numpy, cosine_parity, onnx_model_dir, load_encoder_backend
+from retriever.encoding import BucketedEncoder
+
+try:
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizer
+    from retriever.encoder_backends import mean_pool, TorchBackend, TorchInt8Backend
+except ImportError:
+    torch = None
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+class TestHelpers(unittest.TestCase):
+    def test_cosine_parity(self):
+        reference = np.array([[1.0, 0.0], [1.0, 1.0]])
+        report = cosine_parity(reference, [[2.0, 0.0], [1.0, 0.0]])
+        self.assertAlmostEqual(report['min_cosine'], 1 / np.sqrt(2))
+        self.assertAlmostEqual(report['mean_cosine'], (1 + 1 / np.sqrt(2)) / 2)
+
+    def test_onnx_model_dir(self):
+        self.assertEqual(onnx_model_dir("BAAI/bge-m3", "/cache"), os.path.join("/cache", "BAAI__bge-m3"))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            load_encoder_backend("bert-base-uncased", {'backend': 'tensorrt', 'num_threads': None, 'onnx_dir': None})
+
+
+@unittest.skipIf(torch is None, "torch/transformers not installed")
+class TestBackends(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        words = [f"w{i}" for i in range(50)]
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.model_dir = os.path.join(cls.tmp.name, "model")
+        os.makedirs(cls.model_dir)
+        vocab = os.path.join(cls.model_dir, "vocab.txt")
+        with open(vocab, 'w') as f:
+            f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words))
+        torch.manual_seed(0)
+        BertModel(BertConfig(vocab_size=len(words) + 5, hidden_size=32, num_hidden_layers=2,
+                             num_attention_heads=2, intermediate_size=64)).save_pretrained(cls.model_dir)
+        BertTokenizer(vocab).save_pretrained(cls.model_dir)
+        rng = np.random.default_rng(0)
+        cls.texts = [" ".join(rng.choice(words, rng.integers(1, 40))) for _ in range(30)]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def config(self, backend):
+        return {'backend': backend, 'num_threads': None, 'onnx_dir': os.path.join(self.tmp.name, "onnx")}
+
+    def encode(self, backend):
+        tokenizer, backend = load_encoder_backend(self.model_dir, self.config(backend))
+        return BucketedEncoder(tokenizer, backend, max_length=32, max_tokens=128, max_batch_size=8).encode(self.texts)
+
+    def test_mean_pool_numpy_matches_torch(self):
+        hidden = np.random.default_rng(0).standard_normal((3, 5, 4)).astype(np.float32)
+        mask = np.array([[1, 1, 1, 0, 0], [1, 1, 1, 1, 1], [1, 0, 0, 0, 0]])
+        expected = mean_pool(torch.from_numpy(hidden), torch.from_numpy(mask)).numpy()
+        np.testing.assert_allclose(mean_pool_numpy(hidden, mask), expected, rtol=1e-6)
+
+    def test_torch_backend_matches_raw_model(self):
+        tokenizer, backend = load_encoder_backend(self.model_dir, self.config('torch'))
+        self.assertIsInstance(backend, TorchBackend)
+        raw = BucketedEncoder(tokenizer, backend.model, max_length=32).encode(self.texts)
+        np.testing.assert_allclose(self.encode('torch'), raw, atol=1e-6)
+
+    def test_int8_parity(self):
+        tokenizer, backend = load_encoder_backend(self.model_dir, self.config('torch_int8'))
+        self.assertIsInstance(backend, TorchInt8Backend)
+        report = cosine_parity(self.encode('torch'), self.encode('torch_int8'))
+        self.assertGreater(report['min_cosine'], 0.99)
+
+    @unittest.skipIf(onnxruntime is None, "onnxruntime not installed")
+    def test_onnx_parity(self):
+        reference = self.encode('torch')
+        self.assertGreater(cosine_parity(reference, self.encode('onnx'))['min_cosine'], 0.9999)
+        self.assertTrue(os.path.exists(os.path.join(onnx_model_dir(self.model_dir, self.config('onnx')['onnx_dir']),
+                                                    "model.onnx")))
+        self.assertGreater(cosine_parity(reference, self.encode('onnx_int8'))['min_cosine'], 0.99)
+
+
+if __name__ == '__main__':
+    unittest.main()
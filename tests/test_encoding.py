@@ -0,0 +1,64 @@
+import os
+import unittest
+import tempfile
+import numpy as np
+from retriever.encoding import plan_batches, BucketedEncoder
+
+try:
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizer
+except ImportError:
+    torch = None
+
+
+class TestPlanBatches(unittest.TestCase):
+    def test_batches_cover_all_texts_within_budget(self):
+        lengths = np.random.default_rng(0).integers(1, 512, 1000)
+        batches = plan_batches(lengths, max_tokens=4096, max_batch_size=64)
+        covered = np.concatenate(batches)
+        self.assertEqual(sorted(covered.tolist()), list(range(len(lengths))))
+        for rows in batches:
+            self.assertLessEqual(len(rows), 64)
+            self.assertLessEqual(len(rows) * lengths[rows].max(), 4096)
+
+        # 从长到短组批，相邻批的长度区间不重叠
+        for previous, current in zip(batches, batches[1:]):
+            self.assertGreaterEqual(lengths[previous].min(), lengths[current].max())
+
+    def test_text_longer_than_budget(self):
+        batches = plan_batches([10, 600, 10], max_tokens=512, max_batch_size=8)
+        self.assertEqual([rows.tolist() for rows in batches], [[1], [0, 2]])
+
+
+@unittest.skipIf(torch is None, "torch/transformers not installed")
+class TestBucketedEncoder(unittest.TestCase):
+    def setUp(self):
+        words = [f"w{i}" for i in range(50)]
+        self.tmp = tempfile.TemporaryDirectory()
+        vocab = os.path.join(self.tmp.name, "vocab.txt")
+        with open(vocab, 'w') as f:
+            f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words))
+        self.tokenizer = BertTokenizer(vocab)
+        torch.manual_seed(0)
+        self.model = BertModel(BertConfig(vocab_size=len(words) + 5, hidden_size=32, num_hidden_layers=2,
+                                          num_attention_heads=2, intermediate_size=64)).eval()
+        rng = np.random.default_rng(0)
+        self.texts = [" ".join(rng.choice(words, rng.integers(1, 40))) for _ in range(30)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_unbatched_encoding_in_original_order(self):
+        encoder = BucketedEncoder(self.tokenizer, self.model, max_length=32, max_tokens=128, max_batch_size=8)
+        batched = encoder.encode(self.texts)
+        single = np.vstack([encoder.encode([text]) for text in self.texts])
+        self.assertEqual(batched.shape, (len(self.texts), 32))
+        np.testing.assert_allclose(batched, single, atol=1e-5)
+
+    def test_empty_input(self):
+        encoder = BucketedEncoder(self.tokenizer, self.model)
+        self.assertEqual(encoder.encode([]).shape, (0, 32))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import unittest
+import tempfile
+import numpy as np
+
+try:
+    import faiss
+    from retriever import faiss_index
+except ImportError:
+    faiss = None
+
+
+@unittest.skipIf(faiss is None, "faiss not installed")
+class TestFaissIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.standard_normal((2000, 32)).astype('float32')
+        self.queries = self.vectors[:20] + 0.01 * rng.standard_normal((20, 32)).astype('float32')
+
+    def test_load_config(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "faiss.yaml")
+            with open(path, 'w') as f:
+                f.write("faiss:\n  index_factory: 'HNSW16'\n  search:\n    efSearch: 32\n")
+            config = faiss_index.load_faiss_config(path, {'metric': 'ip'})
+        self.assertEqual(config['index_factory'], 'HNSW16')
+        self.assertEqual(config['metric'], 'ip')
+        self.assertEqual(config['search']['efSearch'], 32)
+        self.assertIsNone(config['search']['nprobe'])
+        with self.assertRaises(ValueError):
+            faiss_index.load_faiss_config(path, {'metric': 'cosine'})
+
+    def test_index_types_on_cpu(self):
+        for factory in ("Flat", "SQfp16", "SQ8", "IVF16,Flat", "IVF16,PQ8x4", "OPQ8,IVF16,PQ8x4", "HNSW16"):
+            config = faiss_index.load_faiss_config(overrides={
+                'index_factory': factory, 'train_sample_size': 1000, 'add_batch_size': 300,
+                'search': {'nprobe': 16, 'efSearch': 64}
+            })
+            index = faiss_index.create_index(32, config)
+            faiss_index.train_index(index, self.vectors, config)
+            faiss_index.add_vectors(index, self.vectors, config)
+            faiss_index.set_search_params(index, config)
+            self.assertEqual(index.ntotal, len(self.vectors))
+
+            _, indices = index.search(faiss_index.prepare_vectors(self.queries, config), 1)
+            recall = np.mean(indices[:, 0] == np.arange(len(self.queries)))
+            self.assertGreaterEqual(recall, 0.9, factory)
+
+    def test_search_params_applied(self):
+        config = faiss_index.load_faiss_config(overrides={
+            'index_factory': "IVF16,Flat", 'search': {'nprobe': 7, 'efSearch': 64}})
+        index = faiss_index.create_index(32, config)
+        faiss_index.train_index(index, self.vectors, config)
+        faiss_index.set_search_params(index, config)
+        self.assertEqual(faiss.extract_index_ivf(index).nprobe, 7)
+
+    def test_rerank_exact(self):
+        for metric in ('l2', 'ip'):
+            config = faiss_index.load_faiss_config(overrides={'index_factory': "PQ4x4", 'metric': metric})
+            index = faiss_index.create_index(32, config)
+            faiss_index.train_index(index, self.vectors, config)
+            faiss_index.add_vectors(index, self.vectors, config)
+            queries = faiss_index.prepare_vectors(self.queries, config)
+
+            exact = faiss.IndexFlat(32, faiss_index.METRIC_TYPES[metric])
+            exact.add(self.vectors)
+            expected_distances, expected = exact.search(queries, 3)
+            # 候选中包含所有向量时，重排结果与精确检索相同
+            _, candidates = index.search(queries, len(self.vectors))
+            distances, indices = faiss_index.rerank_exact(queries, candidates, self.vectors, 3, config)
+            np.testing.assert_array_equal(indices, expected)
+            np.testing.assert_allclose(distances, expected_distances, rtol=1e-4, atol=1e-3)
+
+        # 候选不足top_k时用-1补齐
+        _, indices = faiss_index.rerank_exact(queries[:1], np.array([[5, -1]]), self.vectors, 3, config)
+        self.assertEqual(indices.tolist(), [[5, -1, -1]])
+
+    def test_read_index_mmap(self):
+        for factory in ("Flat", "SQ8", "IVF16,Flat"):
+            config = faiss_index.load_faiss_config(overrides={'index_factory': factory})
+            index = faiss_index.create_index(32, config)
+            faiss_index.train_index(index, self.vectors, config)
+            faiss_index.add_vectors(index, self.vectors, config)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "faiss.index")
+                faiss.write_index(index, path)
+                mapped = faiss_index.read_index(path, mmap=True)
+                np.testing.assert_array_equal(mapped.search(self.queries, 5)[1], index.search(self.queries, 5)[1])
+                del mapped
+
+    def test_gpu_fallback(self):
+        config = faiss_index.load_faiss_config(overrides={'use_gpu': True})
+        index = faiss_index.create_index(32, config)
+        moved, resources = faiss_index.to_gpu(index, config)
+        if not faiss_index.gpu_available():
+            self.assertIs(moved, index)
+            self.assertIsNone(resources)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import time
+import unittest
+from retriever.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from retriever.rank_bm25_retriever import RankBM25Retriever
+from retriever.bm25s_retriever import BM25SRetriever
+
+
+class StaticRetriever:
+    """按固定顺序返回文档id的检索器，可模拟查询耗时"""
+
+    def __init__(self, doc_ids, delay=0.0):
+        self.doc_ids = doc_ids
+        self.delay = delay
+
+    def search(self, query, top_k=5):
+        time.sleep(self.delay)
+        return [{'doc_id': doc_id, 'score': float(-rank), 'document': f"doc {doc_id}", 'metadata': {}}
+                for rank, doc_id in enumerate(self.doc_ids[:top_k])]
+
+
+class TestHybridRetriever(unittest.TestCase):
+    def test_rrf_scores(self):
+        lists = {'a': [{'doc_id': 1}, {'doc_id': 2}], 'b': [{'doc_id': 2}, {'doc_id': 3}]}
+        fused = reciprocal_rank_fusion(lists, {'a': 1.0, 'b': 2.0}, k=60)
+        self.assertAlmostEqual(fused[1], 1 / 61)
+        self.assertAlmostEqual(fused[2], 1 / 62 + 2 / 61)
+        self.assertAlmostEqual(fused[3], 2 / 62)
+
+    def test_fusion_merges_by_doc_id(self):
+        for fusion in ('rrf', 'weighted'):
+            hybrid = HybridRetriever({'sparse': StaticRetriever([1, 2, 3]), 'dense': StaticRetriever([3, 4, 1])},
+                                     fusion=fusion)
+            results = hybrid.search("q", top_k=4)
+            self.assertEqual(len({r['doc_id'] for r in results}), 4)
+            self.assertIn(results[0]['doc_id'], (1, 3))
+            self.assertEqual(set(results[0]['scores']), {'sparse', 'dense'})
+        with self.assertRaises(ValueError):
+            HybridRetriever({}, fusion='max')
+
+    def test_retrievers_run_in_parallel(self):
+        hybrid = HybridRetriever({name: StaticRetriever([i], delay=0.2) for i, name in enumerate("abc")})
+        start = time.perf_counter()
+        self.assertEqual(len(hybrid.search("q")), 3)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_timeout_budget_skips_slow_retriever(self):
+        hybrid = HybridRetriever({'fast': StaticRetriever([1]), 'slow': StaticRetriever([2], delay=0.5)},
+                                 timeout={'slow': 0.05})
+        start = time.perf_counter()
+        results = hybrid.search("q")
+        self.assertLess(time.perf_counter() - start, 0.3)
+        self.assertEqual([r['doc_id'] for r in results], [1])
+        self.assertEqual(hybrid.timeouts, {'fast': 0, 'slow': 1})
+
+        # 超时的查询仍在执行时跳过该检索器，不影响其他检索器
+        start = time.perf_counter()
+        self.assertEqual([r['doc_id'] for r in hybrid.search("q")], [1])
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual(hybrid.skipped, {'fast': 0, 'slow': 1})
+
+        time.sleep(0.5)
+        hybrid.timeout = None
+        self.assertEqual({r['doc_id'] for r in hybrid.search("q")}, {1, 2})
+
+    def test_bm25_retrievers_with_shared_doc_ids(self):
+        docs = ["the cat sat on the mat", "dogs chase cats", "a bird in the hand", "the dog barks"]
+        raw = [{'id': str(i), 'type': 'paragraph', 'text': doc} for i, doc in enumerate(docs)]
+        hybrid = HybridRetriever({
+            'bm25': RankBM25Retriever([doc.split() for doc in docs], raw),
+            'bm25s': BM25SRetriever(docs, raw),
+        })
+        results = hybrid.search("The Dog", top_k=2)
+        self.assertEqual(results[0]['doc_id'], 3)
+        self.assertEqual(set(results[0]['scores']), {'bm25', 'bm25s'})
+        self.assertEqual(hybrid.retrieve("the dog", top_k=1), ["the dog barks"])
+
+
+if __name__ == '__main__':
+    unittest.main()
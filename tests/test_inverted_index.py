@@ -0,0 +1,208 @@
+import os
+import unittest
+import random
+import tempfile
+import numpy as np
+from retriever.inverted_index import InvertedIndex
+from retriever.merge_policy import TieredMergePolicy
+from retriever.rank_bm25_retriever import RankBM25Retriever
+from retriever.bm25s_retriever import BM25SRetriever
+
+
+def make_corpus(num_docs=200, vocab_size=50, seed=0):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(vocab_size)]
+    # 近似Zipf分布，让常见词出现在大多数文档中
+    weights = [1.0 / (i + 1) for i in range(vocab_size)]
+    return [rng.choices(words, weights, k=rng.randint(1, 30)) for _ in range(num_docs)]
+
+
+class TestInvertedIndex(unittest.TestCase):
+    def setUp(self):
+        self.corpus = make_corpus()
+        self.index = InvertedIndex.from_corpus(self.corpus)
+
+    def test_scores_match_bm25okapi(self):
+        try:
+            from rank_bm25 import BM25Okapi
+        except ImportError:
+            self.skipTest("rank_bm25 not installed")
+        reference = BM25Okapi(self.corpus)
+        for query in (["w0"], ["w1", "w7", "w7"], ["w3", "w40", "unknown"]):
+            expected = reference.get_scores(query)
+            doc_ids, scores = self.index.score(query)
+            for doc_id, score in zip(doc_ids, scores):
+                self.assertAlmostEqual(score, expected[doc_id], places=9)
+            # 未命中的文档得分为0
+            missing = set(range(len(self.corpus))) - set(doc_ids.tolist())
+            for doc_id in missing:
+                self.assertEqual(expected[doc_id], 0.0)
+
+    def test_only_matching_documents_scored(self):
+        doc_ids, _ = self.index.score(["w45"])
+        expected = [i for i, doc in enumerate(self.corpus) if "w45" in doc]
+        self.assertEqual(doc_ids.tolist(), expected)
+        self.assertEqual(len(self.index.score(["unknown"])[0]), 0)
+
+    def test_top_k_sorted(self):
+        doc_ids, scores = self.index.top_k(["w2", "w9"], top_k=5)
+        self.assertEqual(len(doc_ids), 5)
+        self.assertTrue(all(scores[i] >= scores[i + 1] for i in range(len(scores) - 1)))
+        all_ids, all_scores = self.index.score(["w2", "w9"])
+        self.assertAlmostEqual(scores[0], all_scores.max())
+
+    def test_pruned_top_k_is_exact(self):
+        corpus = make_corpus(num_docs=3000, vocab_size=300, seed=1)
+        index = InvertedIndex(merge_factor=4)
+        for start in range(0, len(corpus), 250):
+            index.add_documents(corpus[start:start + 250])
+        rng = random.Random(2)
+        for _ in range(50):
+            query = [f"w{rng.randint(0, 299)}" for _ in range(rng.randint(2, 12))]
+            for k in (1, 5, 20):
+                expected_ids, expected_scores = index.top_k(query, k, prune=False)
+                doc_ids, scores = index.top_k(query, k)
+                np.testing.assert_allclose(scores, expected_scores, rtol=1e-9)
+                # 严格高于第k名得分的文档必须一致（并列的文档可以不同）
+                strict = expected_scores > expected_scores[-1] + 1e-9
+                self.assertEqual(set(doc_ids[strict].tolist()), set(expected_ids[strict].tolist()))
+
+    def test_incremental_add_matches_full_build(self):
+        index = InvertedIndex(merge_factor=3)
+        for start in range(0, len(self.corpus), 7):
+            index.add_documents(self.corpus[start:start + 7])
+        self.assertLess(len(index.segments), len(self.corpus) // 7)
+        self.assertEqual(index.num_docs, self.index.num_docs)
+        self.assertEqual(index.avgdl, self.index.avgdl)
+        self.assertEqual(index.df.tolist(), self.index.df.tolist())
+        for query in (["w0"], ["w1", "w7", "w7"], ["w3", "w40", "unknown"]):
+            expected_ids, expected_scores = self.index.score(query)
+            doc_ids, scores = index.score(query)
+            self.assertEqual(doc_ids.tolist(), expected_ids.tolist())
+            self.assertEqual(scores.tolist(), expected_scores.tolist())
+
+    def test_save_and_mmap_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.index.save(tmp)
+            loaded = InvertedIndex.load(tmp)
+            self.assertIsInstance(loaded.doc_len, np.memmap)
+            self.assertEqual(loaded.num_docs, self.index.num_docs)
+            self.assertEqual(list(loaded.vocab), list(self.index.vocab))
+            for query in (["w0"], ["w1", "w7", "w7"], ["w3", "w40", "unknown"]):
+                expected_ids, expected_scores = self.index.score(query)
+                doc_ids, scores = loaded.score(query)
+                self.assertEqual(doc_ids.tolist(), expected_ids.tolist())
+                np.testing.assert_allclose(scores, expected_scores, rtol=1e-12)
+
+            # 加载后仍可追加，新词排在已有词之后
+            loaded.add_documents([["w0", "brand_new"]])
+            self.assertEqual(loaded.vocab["brand_new"], self.index.vocab_size)
+            self.assertEqual(loaded.score(["brand_new"])[0].tolist(), [self.index.num_docs])
+
+    def assert_same_scores(self, index, expected):
+        for query in (["w0"], ["w1", "w7", "w7"], ["w3", "w40", "unknown"]):
+            expected_ids, expected_scores = expected.score(query)
+            doc_ids, scores = index.score(query)
+            self.assertEqual(doc_ids.tolist(), expected_ids.tolist())
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-12)
+
+    def test_background_merge(self):
+        policy = TieredMergePolicy(segments_per_tier=3, max_merge_at_once=3, floor_docs=1)
+        index = InvertedIndex(merge_policy=policy, background_merge=True)
+        for start in range(0, len(self.corpus), 5):
+            index.add_documents(self.corpus[start:start + 5])
+            # 合并进行中也可以查询，新追加的文档立即可见
+            newest = index.num_docs - 1
+            self.assertIn(newest, index.score(self.corpus[newest][:1])[0].tolist())
+        index.wait_for_merges()
+        self.assertLess(len(index.segments), len(self.corpus) // 5)
+        self.assertEqual([s.doc_start for s in index.segments],
+                         np.cumsum([0] + [s.num_docs for s in index.segments[:-1]]).tolist())
+        self.assert_same_scores(index, self.index)
+
+    def test_force_merge_and_incremental_save(self):
+        index = InvertedIndex(merge_factor=100)
+        for start in range(0, len(self.corpus), 50):
+            index.add_documents(self.corpus[start:start + 50])
+        self.assertEqual(len(index.segments), 4)
+        with tempfile.TemporaryDirectory() as tmp:
+            first, second = os.path.join(tmp, "first"), os.path.join(tmp, "second")
+            index.save(first)
+            loaded = InvertedIndex.load(first)
+            loaded.add_documents([["w0", "w1"]])
+            loaded.save(second, previous=first)
+            # 已保存的段以硬链接复用，只写入新段
+            name = loaded.segments[0].name
+            self.assertEqual(os.stat(os.path.join(first, "segments", name, "doc_ids.npy")).st_ino,
+                             os.stat(os.path.join(second, "segments", name, "doc_ids.npy")).st_ino)
+            self.assertEqual(len(os.listdir(os.path.join(second, "segments"))), 5)
+            reloaded = InvertedIndex.load(second)
+            self.assert_same_scores(reloaded, loaded)
+
+            reloaded.force_merge()
+            self.assertEqual(len(reloaded.segments), 1)
+            self.assert_same_scores(reloaded, loaded)
+
+
+class TestBM25Retrievers(unittest.TestCase):
+    def test_result_format(self):
+        corpus = make_corpus(num_docs=20)
+        raw = [{'id': str(i), 'type': 'paragraph', 'text': ' '.join(doc)} for i, doc in enumerate(corpus)]
+
+        results = RankBM25Retriever(corpus, raw).search(["w0", "w3"], top_k=3)
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertEqual(set(result), {'doc_id', 'score', 'document', 'metadata'})
+            self.assertEqual(result['document'], result['metadata']['text'])
+            self.assertEqual(result['metadata']['id'], str(result['doc_id']))
+
+        documents = [' '.join(doc) for doc in corpus]
+        results = BM25SRetriever(documents, raw).search("W0 w3", top_k=3)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['document'], results[0]['metadata']['text'])
+
+    def test_add_documents(self):
+        corpus = make_corpus(num_docs=30)
+        raw = [{'id': str(i), 'type': 'paragraph', 'text': ' '.join(doc)} for i, doc in enumerate(corpus)]
+        retriever = RankBM25Retriever(corpus[:10], raw[:10])
+        retriever.add_documents(corpus[10:], raw[10:])
+        expected = RankBM25Retriever(corpus, raw).search(["w4", "w11"], top_k=5)
+        self.assertEqual(retriever.search(["w4", "w11"], top_k=5), expected)
+
+    def test_save_and_load(self):
+        corpus = make_corpus(num_docs=30)
+        raw = [{'id': str(i), 'type': 'paragraph', 'text': ' '.join(doc)} for i, doc in enumerate(corpus)]
+        documents = [' '.join(doc) for doc in corpus]
+        with tempfile.TemporaryDirectory() as tmp:
+            retriever = RankBM25Retriever(corpus, raw)
+            retriever.save(os.path.join(tmp, "bm25"))
+            # 覆盖保存不影响已加载的实例
+            loaded = RankBM25Retriever.load(os.path.join(tmp, "bm25"))
+            loaded.add_documents([["w1", "w2"]], [{'id': 'new', 'type': 'title', 'text': 'w1 w2'}])
+            loaded.save(os.path.join(tmp, "bm25"))
+            reloaded = RankBM25Retriever.load(os.path.join(tmp, "bm25"))
+            self.assertEqual(len(reloaded.raw_documents), 31)
+            self.assertEqual(reloaded.raw_documents[30]['id'], 'new')
+            self.assertEqual(reloaded.search(["w4", "w11"], top_k=5), loaded.search(["w4", "w11"], top_k=5))
+
+            bm25s = BM25SRetriever(documents, raw)
+            bm25s.save(os.path.join(tmp, "bm25s"))
+            loaded = BM25SRetriever.load(os.path.join(tmp, "bm25s"))
+            self.assertEqual(loaded.search("w4 w11", top_k=5), bm25s.search("w4 w11", top_k=5))
+
+    def test_search_batch_keeps_order(self):
+        corpus = make_corpus(num_docs=100)
+        raw = [{'id': str(i), 'type': 'paragraph', 'text': ' '.join(doc)} for i, doc in enumerate(corpus)]
+        retriever = RankBM25Retriever(corpus, raw)
+        queries = [[f"w{i}", f"w{i + 3}"] for i in range(20)]
+        self.assertEqual(retriever.search_batch(queries, top_k=4, num_workers=4),
+                         [retriever.search(query, top_k=4) for query in queries])
+
+        bm25s = BM25SRetriever([' '.join(doc) for doc in corpus], raw)
+        queries = [' '.join(query) for query in queries]
+        self.assertEqual(bm25s.search_batch(queries, top_k=4, num_workers=4),
+                         [bm25s.search(query, top_k=4) for query in queries])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from retriever.merge_policy import TieredMergePolicy
+
+
+class TestTieredMergePolicy(unittest.TestCase):
+    def test_no_merge_within_budget(self):
+        policy = TieredMergePolicy(segments_per_tier=4, max_merge_at_once=4, floor_docs=10)
+        self.assertIsNone(policy.find_merge([]))
+        self.assertIsNone(policy.find_merge([10, 10, 10, 10]))
+        # 大段所在的层有自己的预算
+        self.assertIsNone(policy.find_merge([40, 40, 10, 10]))
+
+    def test_merges_equal_sized_neighbours(self):
+        policy = TieredMergePolicy(segments_per_tier=4, max_merge_at_once=4, floor_docs=10)
+        # 大段占了总量的大部分，预算较宽松；小段足够多时只合并相邻的小段
+        self.assertIsNone(policy.find_merge([1000] + [10] * 12))
+        self.assertEqual(policy.find_merge([1000] + [10] * 14), (1, 5))
+
+    def test_small_segments_are_floored(self):
+        policy = TieredMergePolicy(segments_per_tier=3, max_merge_at_once=3, floor_docs=100)
+        start, end = policy.find_merge([1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(end - start, 3)
+
+    def test_respects_max_segment_size(self):
+        policy = TieredMergePolicy(segments_per_tier=2, max_merge_at_once=4, floor_docs=1, max_segment_docs=100)
+        self.assertIsNone(policy.find_merge([60, 60, 60]))
+        start, end = policy.find_merge([60, 30, 30, 30, 30])
+        self.assertLessEqual(sum([60, 30, 30, 30, 30][start:end]), 100)
+        self.assertGreater(start, 0)
+
+    def test_repeated_merges_converge(self):
+        policy = TieredMergePolicy(segments_per_tier=4, max_merge_at_once=4, floor_docs=10)
+        sizes = []
+        for _ in range(500):
+            sizes.append(10)
+            while (merge := policy.find_merge(sizes)) is not None:
+                start, end = merge
+                sizes[start:end] = [sum(sizes[start:end])]
+            self.assertLessEqual(len(sizes), policy.allowed_segments(sizes))
+        self.assertEqual(sum(sizes), 5000)
+        # 约为 每层段数 × 层数（log4(5000 / 10) 约4.5层）
+        self.assertLess(len(sizes), 4 * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import json
+import unittest
+import tempfile
+from retriever.metrics import MetricsRegistry, NULL_TIMER, METRICS, load_metrics_config, peak_rss_bytes
+from retriever.bm25s_retriever import BM25SRetriever
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_disabled_records_nothing(self):
+        metrics = MetricsRegistry(enabled=False)
+        self.assertIs(metrics.timer('stage_seconds', stage='a'), NULL_TIMER)
+        with metrics.timer('stage_seconds', stage='a'):
+            pass
+        metrics.inc('queries_total')
+        metrics.observe('stage_seconds', 0.1)
+        metrics.set('gauge', 1)
+        self.assertEqual(metrics.snapshot(), {'counters': [], 'gauges': [], 'histograms': []})
+
+    def test_counters_gauges_and_histograms(self):
+        metrics = MetricsRegistry(enabled=True, buckets=(0.01, 0.1))
+        metrics.inc('queries_total', retriever='a')
+        metrics.inc('queries_total', 2, retriever='a')
+        metrics.inc('queries_total', retriever='b')
+        metrics.set_max('peak_bytes', 5)
+        metrics.set_max('peak_bytes', 3)
+        for value in (0.005, 0.05, 0.05, 1.0):
+            metrics.observe('stage_seconds', value, stage='x')
+        with metrics.timer('stage_seconds', stage='y'):
+            pass
+
+        snapshot = metrics.snapshot()
+        self.assertEqual([(c['labels'], c['value']) for c in snapshot['counters']],
+                         [({'retriever': 'a'}, 3), ({'retriever': 'b'}, 1)])
+        self.assertEqual(snapshot['gauges'], [{'name': 'peak_bytes', 'labels': {}, 'value': 5}])
+        x, y = snapshot['histograms']
+        self.assertEqual((x['count'], y['count']), (4, 1))
+        self.assertAlmostEqual(x['sum'], 1.105)
+        self.assertEqual(x['buckets'], {'0.01': 1, '0.1': 2, '+Inf': 1})
+        json.dumps(snapshot)
+
+    def test_prometheus_format(self):
+        metrics = MetricsRegistry(enabled=True, namespace='rag', buckets=(0.01, 0.1))
+        metrics.inc('queries_total', retriever='a"b')
+        metrics.observe('stage_seconds', 0.05, stage='x')
+        metrics.observe('stage_seconds', 0.5, stage='x')
+        lines = metrics.to_prometheus().splitlines()
+        self.assertIn('# TYPE rag_queries_total counter', lines)
+        self.assertIn('rag_queries_total{retriever="a\\"b"} 1', lines)
+        self.assertIn('# TYPE rag_stage_seconds histogram', lines)
+        # 桶为累计计数
+        self.assertIn('rag_stage_seconds_bucket{stage="x",le="0.01"} 0', lines)
+        self.assertIn('rag_stage_seconds_bucket{stage="x",le="0.1"} 1', lines)
+        self.assertIn('rag_stage_seconds_bucket{stage="x",le="+Inf"} 2', lines)
+        self.assertIn('rag_stage_seconds_count{stage="x"} 2', lines)
+
+        # 工作进程的标签附加到每个指标
+        metrics.labels = {'worker': '1'}
+        lines = metrics.to_prometheus().splitlines()
+        self.assertIn('rag_queries_total{worker="1",retriever="a\\"b"} 1', lines)
+        self.assertIn('rag_stage_seconds_count{worker="1",stage="x"} 2', lines)
+        self.assertEqual(metrics.snapshot()['counters'][0]['labels'], {'worker': '1', 'retriever': 'a"b'})
+
+    def test_write(self):
+        metrics = MetricsRegistry(enabled=True)
+        metrics.inc('queries_total')
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics.write(os.path.join(tmp, "metrics.prom"))
+            metrics.write(os.path.join(tmp, "metrics.json"))
+            with open(os.path.join(tmp, "metrics.prom")) as f:
+                self.assertIn("rag_queries_total 1", f.read())
+            with open(os.path.join(tmp, "metrics.json")) as f:
+                self.assertEqual(json.load(f)['counters'][0]['value'], 1)
+
+    def test_config_environment_override(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "config.yaml")
+            with open(path, 'w') as f:
+                f.write("metrics:\n  enabled: false\n")
+            os.environ['RAG_METRICS'] = '1'
+            try:
+                self.assertTrue(load_metrics_config(path)['enabled'])
+            finally:
+                del os.environ['RAG_METRICS']
+            self.assertFalse(load_metrics_config(path)['enabled'])
+
+    def test_peak_rss(self):
+        self.assertGreater(peak_rss_bytes(), 0)
+
+
+class TestQueryStages(unittest.TestCase):
+    def setUp(self):
+        METRICS.reset()
+        METRICS.enabled = True
+
+    def tearDown(self):
+        METRICS.enabled = False
+        METRICS.reset()
+
+    def test_bm25s_search_stages(self):
+        retriever = BM25SRetriever(["a b c", "b c d", "x y z"], [{'text': t} for t in ("a b c", "b c d", "x y z")])
+        retriever.search_batch(["b", "x"], top_k=2)
+        snapshot = METRICS.snapshot()
+        stages = {h['labels']['stage']: h['count'] for h in snapshot['histograms']
+                  if h['name'] == 'query_stage_seconds'}
+        self.assertEqual(stages, {'tokenize': 2, 'index_search': 2, 'doc_fetch': 2, 'format': 2})
+        self.assertEqual(snapshot['counters'], [{'name': 'queries_total', 'labels': {'retriever': 'bm25s'}, 'value': 2}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import signal
+import unittest
+import http.client
+from types import SimpleNamespace
+from retriever.bm25s_retriever import BM25SRetriever
+from retriever.prefork import PreforkServer
+from retriever.metrics import METRICS, process_memory
+
+TEXTS = ["the quick brown fox", "python programming language", "vector similarity search"]
+RAW = [{'id': str(i), 'type': 'paragraph', 'title': f"doc {i}", 'text': text} for i, text in enumerate(TEXTS)]
+
+
+def request(port, method, path, payload=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    body = json.dumps(payload) if payload is not None else None
+    connection.request(method, path, body, {'Connection': 'close'})
+    response = connection.getresponse()
+    data = json.loads(response.read())
+    connection.close()
+    return response.status, data
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), "os.fork not available")
+class TestPreforkServer(unittest.TestCase):
+    def setUp(self):
+        loader = SimpleNamespace(bm25_retriever=None, bm25s_retriever=BM25SRetriever(TEXTS, RAW),
+                                 faiss_retriever=None, hybrid_retriever=None)
+        self.server = PreforkServer(loader, {'port': 0, 'workers': 2, 'retrievers': ['bm25s']})
+        # 工作进程继承fork时的METRICS设置
+        METRICS.enabled = True
+        try:
+            self.server.start()
+        finally:
+            METRICS.enabled = False
+
+    def tearDown(self):
+        self.server.stop()
+
+    def wait_for_pids(self, expected):
+        """发请求直到看到expected个不同的工作进程（连接由内核分配）"""
+        pids = set()
+        deadline = time.monotonic() + 20
+        while len(pids) < expected and time.monotonic() < deadline:
+            status, stats = request(self.server.port, 'GET', '/stats')
+            self.assertEqual(status, 200)
+            pids.add(stats['pid'])
+        return pids
+
+    def test_workers_share_port(self):
+        status, data = request(self.server.port, 'POST', '/search', {'query': "python", 'top_k': 1})
+        self.assertEqual(status, 200)
+        self.assertEqual(data['results'][0]['doc_id'], 1)
+
+        self.assertEqual(self.wait_for_pids(2), set(self.server.workers))
+        _, stats = request(self.server.port, 'GET', '/stats')
+        self.assertGreater(stats['memory_mb']['rss'], 0)
+        self.assertEqual(set(self.server.worker_memory()), set(self.server.workers))
+
+    def test_metrics_are_labelled_by_worker(self):
+        workers = set()
+        deadline = time.monotonic() + 20
+        while len(workers) < 2 and time.monotonic() < deadline:
+            connection = http.client.HTTPConnection('127.0.0.1', self.server.port, timeout=10)
+            connection.request('GET', '/metrics?format=json', headers={'Connection': 'close'})
+            body = json.loads(connection.getresponse().read())
+            connection.close()
+            workers.update(gauge['labels']['worker'] for gauge in body['gauges'])
+        self.assertEqual(workers, {'0', '1'})
+
+    def test_exited_worker_is_replaced(self):
+        pid = next(iter(self.server.workers))
+        number = self.server.workers[pid]
+        os.kill(pid, signal.SIGKILL)
+        exited = []
+        deadline = time.monotonic() + 10
+        while not exited and time.monotonic() < deadline:
+            exited = self.server._reap()
+            time.sleep(0.05)
+        self.assertEqual([item[0] for item in exited], [number])
+        self.server._spawn(number)
+        self.assertEqual(sorted(self.server.workers.values()), [0, 1])
+        self.assertEqual(request(self.server.port, 'GET', '/health')[0], 200)
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), "os.fork not available")
+class TestPreforkSupervision(unittest.TestCase):
+    def test_refuses_gpu_index_in_parent(self):
+        loader = SimpleNamespace(bm25_retriever=None, bm25s_retriever=None,
+                                 faiss_retriever=SimpleNamespace(on_gpu=True), hybrid_retriever=None)
+        with self.assertRaises(RuntimeError):
+            PreforkServer(loader, {'port': 0, 'workers': 2}).start()
+
+    def test_crash_loop_gives_up(self):
+        # 没有检索器时工作进程启动后立即退出
+        loader = SimpleNamespace(bm25_retriever=None, bm25s_retriever=None, faiss_retriever=None,
+                                 hybrid_retriever=None)
+        server = PreforkServer(loader, {'port': 0, 'workers': 1, 'memory_report_s': 0, 'restart_backoff_s': 0.01,
+                                        'max_restarts': 2})
+        handler = signal.getsignal(signal.SIGTERM)
+        stderr = os.dup(2)
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 2)    # 工作进程的traceback
+        try:
+            start = time.monotonic()
+            with self.assertRaises(RuntimeError):
+                server.serve_forever()
+        finally:
+            os.dup2(stderr, 2)
+            signal.signal(signal.SIGTERM, handler)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(server._failures, {0: 3})
+        self.assertEqual(server.workers, {})
+
+    def test_backoff_doubles(self):
+        server = PreforkServer(SimpleNamespace(), {'workers': 1, 'restart_backoff_s': 1, 'restart_backoff_max_s': 3})
+        for expected in (1, 2, 3, 3):
+            server._started[0] = 100.0
+            server._schedule_restart(0, 1, 100.5)
+            self.assertEqual(server._restarts[0], 100.5 + expected)
+        # 存活超过crash_window_s后重新计数
+        server._started[0] = 0.0
+        server._schedule_restart(0, 1, 1000.0)
+        self.assertEqual(server._failures[0], 1)
+
+
+class TestProcessMemory(unittest.TestCase):
+    @unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), "smaps_rollup not available")
+    def test_process_memory(self):
+        memory = process_memory()
+        self.assertGreater(memory['rss'], 0)
+        self.assertLessEqual(memory['uss'], memory['rss'])
+        self.assertEqual(process_memory(2 ** 30), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import numpy as np
+from retriever.query_cache import LRUCache, CachedRetriever
+from retriever.service import SearchService
+from main_load_built_index import IndexLoader
+from retriever.rank_bm25_retriever import RankBM25Retriever
+from retriever.bm25s_retriever import BM25SRetriever
+
+
+class CountingRetriever:
+    """记录search/search_batch调用的BM25S检索器包装"""
+
+    def __init__(self, retriever):
+        self.retriever = retriever
+        self.index_version = 0
+        self.searched = []
+
+    def search(self, query, top_k=10):
+        self.searched.append(query)
+        return self.retriever.search(query, top_k)
+
+    def search_batch(self, queries, top_k=10):
+        self.searched.extend(queries)
+        return [self.retriever.search(query, top_k) for query in queries]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction_and_ttl(self):
+        clock = FakeClock()
+        cache = LRUCache(2, ttl=10, clock=clock)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)     # b 变为最久未使用
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        clock.now = 11
+        self.assertIsNone(cache.get('a'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['expirations']),
+                         (1, 2, 1, 1))
+
+
+class TestCachedRetriever(unittest.TestCase):
+    def setUp(self):
+        docs = ["the cat sat on the mat", "dogs chase cats", "a bird in the hand", "the dog barks"]
+        raw = [{'id': str(i), 'text': doc} for i, doc in enumerate(docs)]
+        self.inner = CountingRetriever(BM25SRetriever(docs, raw))
+        self.cached = CachedRetriever(self.inner, config={'lowercase': True, 'result_max_entries': 100})
+
+    def test_repeated_queries_hit_cache(self):
+        first = self.cached.search("the  Cat", top_k=2)
+        second = self.cached.search("the cat", top_k=2)
+        self.assertEqual(first, second)
+        self.assertEqual(self.inner.searched, ["the  Cat"])
+        self.cached.search("the cat", top_k=3)  # top_k 不同，不能复用
+        self.assertEqual(len(self.inner.searched), 2)
+        self.assertEqual(self.cached.stats()['results']['hits'], 1)
+
+    def test_cached_results_are_copies(self):
+        first = self.cached.search("the", top_k=2)
+        first[0]['metadata']['id'] = "changed"
+        first.clear()
+        second = self.cached.search("the", top_k=2)
+        self.assertEqual(len(second), 2)
+        self.assertNotEqual(second[0]['metadata']['id'], "changed")
+        second[0]['score'] = -1.0
+        self.assertNotEqual(self.cached.search_batch(["the"], top_k=2)[0][0]['score'], -1.0)
+
+    def test_batch_deduplicates_misses(self):
+        self.cached.search("dog", top_k=2)
+        results = self.cached.search_batch(["dog", "bird", "Bird", "cat"], top_k=2)
+        self.assertEqual(self.inner.searched, ["dog", "bird", "cat"])
+        self.assertEqual(results[1], results[2])
+        self.assertEqual(results[0], self.cached.search("dog", top_k=2))
+
+    def test_index_change_invalidates_results(self):
+        retriever = RankBM25Retriever([["the", "cat"], ["a", "dog"]], [{'id': '0'}, {'id': '1'}])
+        cached = CachedRetriever(retriever)
+        self.assertEqual(len(cached.search(["cat"], top_k=5)), 1)
+        retriever.add_documents([["cat", "food"]], [{'id': '2'}])
+        self.assertEqual(len(cached.search(["cat"], top_k=5)), 2)
+        self.assertEqual(cached.stats()['invalidations'], 1)
+
+    def test_query_embedding_cache_is_injected(self):
+        class Encoder:
+            query_embedding_cache = None
+
+        encoder = Encoder()
+        cached = CachedRetriever(encoder, config={'embedding_max_entries': 10})
+        self.assertIs(encoder.query_embedding_cache, cached.embedding_cache)
+        encoder.query_embedding_cache.put("q", np.zeros(3))
+        self.assertEqual(cached.stats()['query_embeddings']['entries'], 1)
+
+    def test_disabled_passes_through(self):
+        cached = CachedRetriever(self.inner, config={'enabled': False})
+        cached.search("cat", top_k=1)
+        cached.search("cat", top_k=1)
+        self.assertEqual(self.inner.searched, ["cat", "cat"])
+
+    def test_hybrid_cache_follows_child_index(self):
+        retriever = RankBM25Retriever([["the", "cat"], ["a", "dog"]], [{'id': '0'}, {'id': '1'}])
+        loader = IndexLoader(index_dir=None)
+        loader.bm25_retriever = retriever
+        loader.build_hybrid_retriever()
+        loader.enable_query_cache({'enabled': True})
+        self.assertEqual(len(loader.hybrid_retriever.search("cat", top_k=5)), 1)
+        retriever.add_documents([["cat", "food"]], [{'id': '2'}])
+        self.assertEqual(len(loader.hybrid_retriever.search("cat", top_k=5)), 2)
+        self.assertEqual(loader.hybrid_retriever.stats()['invalidations'], 1)
+
+
+class TestEnableQueryCache(unittest.TestCase):
+    def test_loader_wraps_retrievers(self):
+        loader = IndexLoader(index_dir=None)
+        loader.bm25_retriever = RankBM25Retriever([["the", "cat"], ["a", "dog"]], [{'id': '0'}, {'id': '1'}])
+        loader.bm25s_retriever = BM25SRetriever(["the cat", "a dog"], [{'id': '0'}, {'id': '1'}])
+        loader.build_hybrid_retriever()
+        self.assertFalse(loader.enable_query_cache({'enabled': False}))
+        self.assertTrue(loader.enable_query_cache({'enabled': True}))
+        for retriever in (loader.bm25_retriever, loader.bm25s_retriever, loader.hybrid_retriever):
+            self.assertIsInstance(retriever, CachedRetriever)
+
+        # 包装后的RankBM25Retriever仍然按分词后的查询检索
+        service = SearchService.from_loader(loader)
+        self.assertIn('bm25', service.query_transforms)
+        for _ in range(2):
+            results = service._search_batch('bm25', [("The Cat", 1)])
+            self.assertEqual(results[0][0]['metadata']['id'], '0')
+        self.assertEqual(service.stats()['query_cache']['bm25']['results']['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import json
+import time
+import asyncio
+import unittest
+from retriever.service import SearchService, MicroBatcher, Overloaded, LatencyWindow
+from retriever.metrics import METRICS
+
+
+class FakeRetriever:
+    """记录每次 search_batch 的批大小，结果中带上查询本身"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batch_sizes = []
+
+    def search_batch(self, queries, top_k=5):
+        self.batch_sizes.append(len(queries))
+        time.sleep(self.delay)
+        return [[{'doc_id': i, 'score': float(top_k - i), 'document': query} for i in range(top_k)]
+                for query in queries]
+
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(data)
+
+
+class TestMicroBatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_are_batched(self):
+        sizes = []
+
+        def process(items):
+            sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait=0.05)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(20)))
+        self.assertEqual(results, [i * 2 for i in range(20)])
+        self.assertEqual(sizes, [8, 8, 4])
+        await batcher.close()
+
+    async def test_errors_propagate_to_every_request(self):
+        def process(items):
+            raise RuntimeError("boom")
+
+        batcher = MicroBatcher(process, max_wait=0.01)
+        results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        await batcher.close()
+
+    async def test_backpressure(self):
+        batcher = MicroBatcher(lambda items: time.sleep(0.2) or items, max_batch_size=1, max_wait=0, max_queue=2)
+        first = asyncio.ensure_future(batcher.submit(0))
+        await asyncio.sleep(0.05)     # 第一个请求正在执行
+        queued = [asyncio.ensure_future(batcher.submit(i)) for i in (1, 2)]
+        await asyncio.sleep(0)
+        with self.assertRaises(Overloaded):
+            await batcher.submit(3)
+        self.assertEqual(await asyncio.gather(first, *queued), [0, 1, 2])
+        self.assertEqual(batcher.stats()['rejected'], 1)
+        await batcher.close()
+
+
+class TestSearchService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.retriever = FakeRetriever(delay=0.02)
+        self.service = SearchService({'fake': self.retriever}, config={'max_wait_ms': 20, 'max_batch_size': 16},
+                                     config_path='/nonexistent.yaml')
+        await self.service.start('127.0.0.1', 0)
+        self.port = self.service.port
+
+    async def asyncTearDown(self):
+        await self.service.close()
+
+    async def test_search_batches_concurrent_requests(self):
+        responses = await asyncio.gather(*(
+            request(self.port, 'POST', '/search', {'query': f"q{i}", 'top_k': 1 + i % 3}) for i in range(12)))
+        for i, (status, body) in enumerate(responses):
+            self.assertEqual(status, 200)
+            self.assertEqual(len(body['results']), 1 + i % 3)
+            self.assertEqual(body['results'][0]['document'], f"q{i}")
+        self.assertLess(len(self.retriever.batch_sizes), 12)
+        self.assertEqual(sum(self.retriever.batch_sizes), 12)
+
+        status, stats = await request(self.port, 'GET', '/stats')
+        self.assertEqual(status, 200)
+        fake = stats['retrievers']['fake']
+        self.assertEqual(fake['count'], 12)
+        self.assertGreater(fake['mean_batch_size'], 1)
+        self.assertLessEqual(fake['p50_ms'], fake['p99_ms'])
+
+    async def test_bad_requests(self):
+        self.assertEqual((await request(self.port, 'POST', '/search', {'top_k': 3}))[0], 400)
+        self.assertEqual((await request(self.port, 'POST', '/search', {'query': "q", 'top_k': 0}))[0], 400)
+        self.assertEqual((await request(self.port, 'POST', '/search', {'query': "q", 'retriever': 'x'}))[0], 404)
+        self.assertEqual((await request(self.port, 'GET', '/missing'))[0], 404)
+        self.assertEqual((await request(self.port, 'GET', '/search'))[0], 405)
+        status, body = await request(self.port, 'GET', '/health')
+        self.assertEqual((status, body['retrievers']), (200, ['fake']))
+
+    async def test_metrics_endpoint(self):
+        METRICS.reset()
+        METRICS.enabled = True
+        try:
+            await request(self.port, 'POST', '/search', {'query': "q"})
+            status, body = await request(self.port, 'GET', '/metrics?format=json')
+        finally:
+            METRICS.enabled = False
+        self.assertEqual(status, 200)
+        requests = [h for h in body['histograms'] if h['name'] == 'request_seconds']
+        self.assertEqual([(h['labels'], h['count']) for h in requests], [({'retriever': 'fake'}, 1)])
+        gauges = {g['name']: g['value'] for g in body['gauges']}
+        self.assertEqual(gauges['service_queue_depth'], 0)
+
+
+class TestLatencyWindow(unittest.TestCase):
+    def test_percentiles(self):
+        window = LatencyWindow(size=100)
+        for ms in range(1, 201):
+            window.add(ms / 1000)
+        summary = window.summary()
+        self.assertEqual(summary['count'], 200)
+        self.assertAlmostEqual(summary['p50_ms'], 150.5)
+        self.assertAlmostEqual(summary['max_ms'], 200.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
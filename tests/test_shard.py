@@ -0,0 +1,77 @@
+import os
+import json
+import unittest
+import tempfile
+import numpy as np
+from retriever.shard import write_shard, read_manifest, load_shard
+from retriever.inverted_index import InvertedIndex
+from retriever.document_store import DocumentStore, DocumentWriter
+
+
+def make_documents(texts, prefix="d"):
+    return [{'id': f"{prefix}{i}", 'text': text} for i, text in enumerate(texts)]
+
+
+class TestShard(unittest.TestCase):
+    def test_write_and_load(self):
+        documents = make_documents(["a b a", "c b", ""])
+        with tempfile.TemporaryDirectory() as tmp:
+            shard = os.path.join(tmp, "shard")
+            manifest = write_shard(documents, shard, chunk_size=2)
+            self.assertEqual((manifest['num_docs'], manifest['num_tokens'], manifest['vocab_size']), (3, 5, 3))
+            self.assertFalse(os.path.exists(shard + ".tmp"))
+
+            corpus = load_shard(shard)
+            self.assertEqual(corpus.terms, ["a", "b", "c"])
+            np.testing.assert_array_equal(corpus.token_ids, [0, 1, 0, 2, 1])
+            np.testing.assert_array_equal(corpus.lengths, [3, 2, 0])
+            writer = DocumentWriter(os.path.join(tmp, "docs"))
+            writer.append_directory(os.path.join(shard, "documents"))
+            writer.finish()
+            self.assertEqual(list(DocumentStore.open(os.path.join(tmp, "docs"))), documents)
+
+    def test_manifest_is_stale_when_source_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "source.jsonl")
+            with open(source, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'text': "a"}) + "\n")
+            shard = os.path.join(tmp, "shard")
+            self.assertIsNone(read_manifest(shard))
+            write_shard(make_documents(["a"]), shard, source=source)
+            self.assertEqual(read_manifest(shard)['num_docs'], 1)
+
+            with open(source, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'text': "b"}) + "\n")
+            self.assertIsNone(read_manifest(shard))
+
+    def test_add_corpus_matches_add_documents(self):
+        batches = [["x y z x", "y q"], ["q q w", "x"], ["new term y"]]
+        expected = InvertedIndex()
+        index = InvertedIndex()
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, texts in enumerate(batches):
+                expected.add_documents([text.split() for text in texts])
+                shard = os.path.join(tmp, str(i))
+                write_shard(make_documents(texts), shard)
+                index.add_corpus(load_shard(shard))
+
+        self.assertEqual(index.num_docs, expected.num_docs)
+        self.assertEqual(sorted(index.vocab), sorted(expected.vocab))
+        for query in (["x"], ["y", "q"], ["new", "w", "x"]):
+            np.testing.assert_allclose(index.score(query), expected.score(query))
+
+    def test_append_directory_keeps_existing_documents(self):
+        first = make_documents(["one", "two"], prefix="a")
+        second = make_documents(["three"], prefix="b")
+        with tempfile.TemporaryDirectory() as tmp:
+            write_shard(second, os.path.join(tmp, "shard"))
+            writer = DocumentWriter(os.path.join(tmp, "docs"))
+            writer.extend(first)
+            writer.append_directory(os.path.join(tmp, "shard", "documents"))
+            writer.extend(first[:1])
+            writer.finish()
+            self.assertEqual(list(DocumentStore.open(os.path.join(tmp, "docs"))), first + second + first[:1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import unittest
+import tempfile
+import numpy as np
+from retriever.vector_store import VectorStore
+from retriever.document_store import DocumentStore, DocumentWriter
+
+
+class TestVectorStore(unittest.TestCase):
+    def test_append_reopen_and_truncate(self):
+        rng = np.random.default_rng(0)
+        first, second = rng.standard_normal((5, 4)), rng.standard_normal((3, 4))
+        with tempfile.TemporaryDirectory() as tmp:
+            store = VectorStore(tmp)
+            store.append(first)
+            store.append(second)
+            store.flush()
+
+            reopened = VectorStore(tmp)
+            self.assertEqual((len(reopened), reopened.dimension), (8, 4))
+            np.testing.assert_allclose(reopened.vectors(), np.vstack([first, second]).astype(np.float32))
+
+            # 恢复时丢弃检查点之后写入的向量
+            reopened.truncate(5)
+            reopened.append(second[:1])
+            np.testing.assert_allclose(VectorStore(tmp).vectors(),
+                                       np.vstack([first, second[:1]]).astype(np.float32))
+            with self.assertRaises(ValueError):
+                reopened.append(np.zeros((1, 3)))
+
+    def test_partial_row_is_ignored(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = VectorStore(tmp)
+            store.append(np.ones((2, 4)))
+            with open(os.path.join(tmp, "vectors.f32"), 'ab') as f:
+                f.write(b'\0' * 6)
+            store = VectorStore(tmp)
+            self.assertEqual(len(store), 2)
+            store.append(np.full((1, 4), 2.0))
+            np.testing.assert_array_equal(store.vectors()[:, 0], [1, 1, 2])
+
+    def test_link(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = VectorStore(os.path.join(tmp, "a"))
+            store.append(np.ones((3, 4)))
+            linked = store.link(os.path.join(tmp, "b"))
+            self.assertEqual((len(linked), linked.dimension), (3, 4))
+            np.testing.assert_array_equal(linked.vectors(), store.vectors())
+
+
+class TestDocumentWriter(unittest.TestCase):
+    def test_streamed_documents_open_as_store(self):
+        docs = [{'id': str(i), 'text': f"文档 {i}"} for i in range(7)]
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = DocumentWriter(tmp)
+            writer.extend(docs[:4])
+            writer.extend([{'id': 'lost'}])      # 中断前未提交的一批
+            writer.flush()
+
+            writer = DocumentWriter(tmp)
+            self.assertEqual(len(writer), 5)
+            writer.truncate(4)
+            writer.extend(docs[4:])
+            writer.finish()
+
+            store = DocumentStore.open(tmp)
+            self.assertEqual(list(store), docs)
+
+
+if __name__ == '__main__':
+    unittest.main()
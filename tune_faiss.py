@@ -0,0 +1,107 @@
+"""FAISS索引参数调优
+
+从语料中抽样向量，以 IndexFlat 的精确结果为基准，扫描候选索引类型（SQfp16/SQ8标量量化、
+IVF的nlist、PQ/OPQ码长、HNSW的M）及其查询参数（nprobe、efSearch），测量 recall@k、逐条查询的
+p50/p99延迟、批量吞吐量、索引大小和构建时间，输出Pareto前沿
+（recall越高、延迟和索引越小越好），并按目标recall选出一组设置。
+--rerank 指定候选倍数时另外评估用原始向量精确重排后的recall和延迟。
+
+向量来源（二选一）：
+    --index-dir  使用 build_index.py 保存在 <index-dir>/faiss/vectors 中的文档向量
+    --data       从 .jsonl/.json 文件中抽样文档，用 FaissRetriever 的模型编码
+
+查询默认为不在库中的抽样文档向量；--queries 指定查询文本文件（每行一个）时用模型编码。
+
+用法:
+    python tune_faiss.py --index-dir ./indexes --sample-size 200000 --target-recall 0.95
+    python tune_faiss.py --data decompressed_files/*.jsonl --model bert-base-uncased --write-config
+"""
+import os
+import json
+import argparse
+from build_index import iter_documents
+from retriever.faiss_index import load_faiss_config
+from retriever.vector_store import VectorStore
+from retriever.ann_tuning import (reservoir_sample, split_sample, tune, pareto_frontier, choose_setting,
+                                  format_result, write_faiss_config)
+
+
+def index_vectors(index_dir, sample_size, num_queries, seed):
+    """从构建好的索引目录中抽样库向量和查询向量"""
+    vectors = VectorStore(os.path.join(index_dir, "faiss", "vectors")).vectors()
+    database_rows, query_rows = split_sample(len(vectors), sample_size, num_queries, seed)
+    return vectors[database_rows], vectors[query_rows]
+
+
+def encoded_vectors(paths, model, config_path, sample_size, num_queries, queries_path, seed):
+    """抽样文档并用FaissRetriever的模型编码；指定查询文件时编码其中的查询"""
+    from retriever.faiss_retriever import FaissRetriever
+
+    num_held_out = 0 if queries_path else num_queries
+    documents = reservoir_sample((doc for path in paths for doc in iter_documents(path)),
+                                 sample_size + num_held_out, seed)
+    retriever = FaissRetriever(model_name=model, config_path=config_path)
+    vectors = retriever.encode_documents([doc['text'] for doc in documents])
+    if queries_path:
+        with open(queries_path, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()][:num_queries]
+        return vectors, retriever.encode_queries(queries)
+    database_rows, query_rows = split_sample(len(vectors), sample_size, num_queries, seed)
+    return vectors[database_rows], vectors[query_rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--index-dir", help="build_index.py 的索引目录（使用其中保存的文档向量）")
+    source.add_argument("--data", nargs="+", help="抽样文档的 .jsonl/.json 文件")
+    parser.add_argument("--model", default="bert-base-uncased", help="--data 时用于编码的模型")
+    parser.add_argument("--queries", default=None, help="查询文本文件（每行一个），需配合 --data")
+    parser.add_argument("--config", default=None, help="FAISS配置文件，默认为 retriever/faiss_config.yaml")
+    parser.add_argument("--sample-size", type=int, default=100000, help="库向量数")
+    parser.add_argument("--num-queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的k")
+    parser.add_argument("--factories", nargs="+", default=None, help="候选索引类型，默认按向量数和维度生成")
+    parser.add_argument("--latency-queries", type=int, default=200, help="逐条查询测量延迟的查询数")
+    parser.add_argument("--rerank", nargs="*", type=int, default=[], help="评估精确重排的候选倍数，如 2 4")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="把全部结果、Pareto前沿和选定设置写为JSON")
+    parser.add_argument("--write-config", action="store_true", help="把选定的设置写回FAISS配置文件")
+    args = parser.parse_args()
+    if args.queries and not args.data:
+        parser.error("--queries requires --data")
+
+    config = load_faiss_config(args.config)
+    if args.index_dir:
+        vectors, queries = index_vectors(args.index_dir, args.sample_size, args.num_queries, args.seed)
+    else:
+        vectors, queries = encoded_vectors(args.data, args.model, args.config, args.sample_size,
+                                           args.num_queries, args.queries, args.seed)
+    print(f"{len(vectors)} database vectors, {len(queries)} queries, dimension {vectors.shape[1]}, "
+          f"recall@{args.k} against exact search")
+
+    results = tune(vectors, queries, args.k, config, args.factories, args.latency_queries,
+                   rerank_factors=args.rerank)
+    frontier = pareto_frontier(results)
+    chosen = choose_setting(results, args.target_recall)
+
+    print("\nPareto frontier (recall / p50 latency / index size):")
+    for result in frontier:
+        print("  " + format_result(result))
+    print(f"\nChosen for recall >= {args.target_recall}:\n  {format_result(chosen)}")
+    if chosen['recall'] < args.target_recall:
+        print("Warning: no setting reached the target recall, chose the most accurate one")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'num_vectors': len(vectors), 'dimension': int(vectors.shape[1]),
+                       'results': results, 'frontier': frontier, 'chosen': chosen}, f, indent=2)
+    if args.write_config:
+        write_faiss_config(chosen, args.config)
+        print(f"Wrote index_factory={chosen['index_factory']} {chosen['search']} rerank={chosen['rerank']} to "
+              f"{args.config or 'retriever/faiss_config.yaml'}")
+
+
+if __name__ == "__main__":
+    main()